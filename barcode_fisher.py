@@ -7,6 +7,8 @@ import os
 import sys
 import argparse
 
+from pyfunction import BLAST_RANK_KEYS, best_blast_hits, fetch_regions, iter_blast_tab
+
 # check the requirements first.
 if not os.system('cd-hit -h &> /dev/null'):
     print('Error: cd-hit is required. Please install it.', file=sys.stderr, flush=True)
@@ -39,6 +41,12 @@ parser.add_argument('--genome', '-g',
     help='genome file or a list of genome files')
 
 
+parser.add_argument('--rank', '-r',
+    choices=list(BLAST_RANK_KEYS),
+    nargs='+',
+    default=['bitscore'],
+    help='rank the hits of a barcode by these values, in order, higher is better. Default: bitscore')
+
 parser.add_argument('--prefix', '-p',
     type=str,
     help='prefix the output: prefix_ITS.fasta')
@@ -75,18 +83,6 @@ def run_blastn(args_barcode_label, genome_lst):
             genome_abbre = os.path.basename(genome)
             os.system(f"blastn -query temp_barcode_fisher/temp_cdhit/{label}.cdhit.I0.9L0.8.fasta -subject {genome} -outfmt 6 -out temp_barcode_fisher/temp_blastn/{label}_{genome_abbre}.blastn")
 
-def read_genome_2dict(genome):
-    genome_dict = {}
-    with open(genome, 'rt') as infh:
-        for line in infh:
-            if line.startswith('>'):
-                contig_id = line.rstrip('\n').split()[0].lstrip('>')
-                genome_dict[contig_id] = []
-            else:
-                genome_dict[contig_id].append(line.rstrip('\n'))
-    genome_dict = {k:''.join(v) for k,v in genome_dict.items()}
-    return genome_dict
-    
 def check_args_genome(args_genome):
     genome_lst = []
     is_genome_list = True
@@ -103,9 +99,10 @@ def check_args_genome(args_genome):
         genome_lst = [args_genome]
     return genome_lst
 
-def extract_barcode_seq(args_barcode_label, genome_lst, args_flank_length):
-    
+def extract_barcode_seq(args_barcode_label, genome_lst, args_flank_length, rank=('bitscore',)):
+
     barcode_dict = {}
+    genome_region_dict = {genome: [] for genome in genome_lst}
     for barcode in args_barcode_label:
         barcode_dict[barcode] = {}
         for genome in genome_lst:
@@ -113,26 +110,28 @@ def extract_barcode_seq(args_barcode_label, genome_lst, args_flank_length):
             if os.stat(f"temp_barcode_fisher/temp_blastn/{barcode}_{genome_abbre}.blastn").st_size == 0:
                 barcode_dict[barcode][genome_abbre] = 0
             else:
-                genome_dict = read_genome_2dict(genome)
-                with open(f"temp_barcode_fisher/temp_blastn/{barcode}_{genome_abbre}.blastn", 'rt') as infh:
-                    line_lst = infh.readlines()[0].split()
-
-                    contig_id = line_lst[1]
-                    sstart = int(line_lst[8])
-                    send = int(line_lst[9])
+                # best hit over all queries of the barcode, streamed through the table
+                hit_iter = iter_blast_tab(f"temp_barcode_fisher/temp_blastn/{barcode}_{genome_abbre}.blastn")
+                line_lst = best_blast_hits(hit_iter, key_func=lambda hit: barcode, rank=rank)[barcode][0]
 
+                contig_id = line_lst[1]
+                sstart = int(line_lst[8])
+                send = int(line_lst[9])
                 if sstart > send:
                     sstart, send = send, sstart
-                if (sstart - args_flank_length) <0:
-                    sstart = 0
-                else:
-                    sstart -= args_flank_length
-                if (send - args_flank_length) > len(genome_dict[contig_id]):
-                    send = len(genome_dict[contig_id])
-                else:
-                    send += args_flank_length
-
-                barcode_dict[barcode][genome_abbre] = genome_dict[contig_id][sstart-1:send]
+                barcode_dict[barcode][genome_abbre] = None  # keeps the genome order, filled below
+                genome_region_dict[genome].append((barcode, (contig_id, sstart - args_flank_length, send + args_flank_length)))
+
+    # fetch the hit regions of each genome in one go, through genome.fai when it can be indexed
+    for genome, barcode_region_lst in genome_region_dict.items():
+        if not barcode_region_lst:
+            continue
+        genome_abbre = os.path.basename(genome)
+        seq_lst = fetch_regions(genome, [region for _, region in barcode_region_lst])
+        for (barcode, (contig_id, _, _)), seq in zip(barcode_region_lst, seq_lst):
+            if seq is None:
+                sys.exit(f'Error: {contig_id} not found in {genome}')
+            barcode_dict[barcode][genome_abbre] = seq
     return barcode_dict
 
 def output(barcode_dict, args_prefix):
@@ -152,6 +151,6 @@ if __name__ == '__main__':
     run_cdhit(args.sequence, args.barcode_label)
     genome_lst = check_args_genome(args.genome)
     run_blastn(args.barcode_label, genome_lst)
-    barcode_dict = extract_barcode_seq(args.barcode_label, genome_lst, args.flank_length)
+    barcode_dict = extract_barcode_seq(args.barcode_label, genome_lst, args.flank_length, args.rank)
     output(barcode_dict, args.prefix)
     sys.exit(0)
@@ -9,9 +9,10 @@ DATE：
 '''
 
 import sys
-import gzip
 import argparse
 
+from pyfunction import fetch_regions
+
 def parse_args():
     '''Parse command-line arguments
 
@@ -24,7 +25,7 @@ def parse_args():
     parser.add_argument('fasta',
         metavar='<fasta>',
         type=str,
-        help='input fasta filename')
+        help='input fasta filename, indexed as <fasta>.fai on first use (.gz allowed, read without index)')
 
     parser.add_argument('seqid',
         type=str,
@@ -40,33 +41,8 @@ def parse_args():
     args = parser.parse_args()
     return args
 
-def parse_fa_2dict(fafile):
-    '''Parse fasta file(.gz allowed) into python3 dictionary, without '>' and newline signs(\n)
-    {'id':'seq', ...}
-
-    Args:
-        fafile (str): A file name with corresponding path, and the file must be in FASTA format
-
-    Return:
-        fa_dict (dict) :A python3 dictionary without '>' and newline signs(\n). {'id':'seq', ...}
-    '''
-    fa_dict = {}
-
-    fa_fh = gzip.open(fafile, 'rt') if fafile.endswith('.gz') else open(fafile, 'rt')
-    for line in fa_fh:
-        if not line:
-            continue
-        line = line.rstrip('\n')
-        if line.startswith('>'):
-            seq_id = line.lstrip('>').rstrip('\n').split()[0]
-            fa_dict[seq_id] = []
-        else:
-            fa_dict[seq_id].append(line)
-    fa_dict = {seq_id:''.join(seq_lst) for seq_id,seq_lst in fa_dict.items()}
-    return fa_dict
-
-def base_locater(fa_dict, seq_id, position_tuple):
-    '''Get the base according position(s)
+def base_locater(fafile, seq_id, position_tuple):
+    '''Get the base according position(s), 1-based
 
     Input:
         position_tuple : 11-15, 11, 12, 12-13
@@ -78,26 +54,31 @@ def base_locater(fa_dict, seq_id, position_tuple):
         12   : T
         12-13: TG
 
+    Only the requested regions are read, through the .fai index of the fasta.
+
     Args:
-        fa_dict (dict) : a genome fasta. Keys represent seq identifiers, and values represent sequences
+        fafile (str) : a genome fasta
         seq_id (str) : sequence identifier
-        position_tuple (tuple) : a int tuple
+        position_tuple (tuple) : a str tuple
 
     Return:
         NULL
     '''
-    max_len_of_flag = max([len(a) for a in position_tuple])
+    region_lst = []
     for pos in position_tuple:
         if '-' in pos:
             pos_start, pos_end = [int(i) for i in pos.split('-')]
-            show_bases = fa_dict[seq_id][pos_start - 1: pos_end]
-            print(f'{pos:<{max_len_of_flag}} : {show_bases}', file=sys.stdout, flush=True)
         else:
-            pos = int(pos)
-            show_base = fa_dict[seq_id][pos]
-            print(f'{pos:<{max_len_of_flag}} : {show_base}', file=sys.stdout, flush=True)
+            pos_start = pos_end = int(pos)
+        region_lst.append((seq_id, pos_start, pos_end))
+
+    seq_lst = fetch_regions(fafile, region_lst)
+    if seq_lst and seq_lst[0] is None:
+        sys.exit(f'Error: {seq_id} not found in {fafile}')
+    max_len_of_flag = max([len(a) for a in position_tuple])
+    for pos, show_bases in zip(position_tuple, seq_lst):
+        print(f'{pos:<{max_len_of_flag}} : {show_bases}', file=sys.stdout, flush=True)
 
 if __name__ == '__main__':
     args = parse_args()
-    fa_dict =parse_fa_2dict(args.fasta)
-    base_locater(fa_dict, args.seqid, args.loc)
\ No newline at end of file
+    base_locater(args.fasta, args.seqid, args.loc)
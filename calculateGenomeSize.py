@@ -14,10 +14,11 @@ Info:
 '''
 import os
 import sys
-import gzip
 import argparse
 import pandas as pd
 
+from pyfunction import contig_lengths, map_assemblies
+
 def parse_args():
     '''Parse command-line arguments.
     '''
@@ -51,6 +52,13 @@ def parse_args():
                         action='store_true',
                         help='calucate the number of bases in contigs respectively')
     
+    parser.add_argument('-t', '--threads', '--processes',
+                        dest='processes',
+                        metavar='<int>',
+                        type=int,
+                        default=1,
+                        help='number of genomes processed in parallel (default: 1)')
+
     args = parser.parse_args()
 
     if args.field and not args.contig:
@@ -59,126 +67,84 @@ def parse_args():
 
     return args
 
-def fa2dict(arg_input):
+def fa2dict(arg_input, arg_processes=1):
     '''Parse fasta files into dictionary.
 
     parameters:
-        arg_input: input file(s) or folder(s)
+        arg_input    : input file(s) or folder(s)
+        arg_processes: number of genomes read in parallel
     '''
-    fa_len_dict = {}
+    fa_lst = []
     for arg in arg_input:
         if os.path.isfile(arg):
-            _, filename = os.path.split(arg)
-            fa_len_dict[filename] = {}
-            
-            fh = gzip.open(arg, 'rt') if arg.endswith('.gz') else open(arg, 'rt')
-            for line in fh:
-                line = line.rstrip('\n')
-                if line.startswith('>'):
-                    identifier = line.lstrip('>')
-                    fa_len_dict[filename][identifier] = 0
-                else:
-                    fa_len_dict[filename][identifier] += len(line)
-            fh.close()
+            fa_lst.append(arg)
 
         if os.path.isdir(arg):
-            file_lst = os.listdir(arg)
-            file_lst = [f'{arg}/{file}' for file in file_lst]
-            for file in file_lst:
-                _, filename = os.path.split(arg)
-                fa_len_dict[filename] = {}
-            
-                fh = gzip.open(file, 'rt') if arg.endswith('.gz') else open(file, 'rt')
-                for line in fh:
-                    line = line.rstrip('\n')
-                    if line.startswith('>'):
-                        identifier = line.lstrip('>')
-                        fa_len_dict[filename][identifier] = 0
-                    else:
-                        fa_len_dict[filename][identifier] += len(line)
-                fh.close()
+            file_lst = sorted(os.listdir(arg))
+            fa_lst.extend(f'{arg}/{file}' for file in file_lst)
+
+    fa_len_dict = {}
+    for fa, contig_len_dict in map_assemblies(contig_lengths, fa_lst, arg_processes):
+        _, filename = os.path.split(fa)
+        fa_len_dict[filename] = contig_len_dict
     return fa_len_dict
 
+def identifier_field(header, arg_field):
+    '''The identifier of a contig: field arg_field(1-based) of its header, 0 for the entire header
+    '''
+    if arg_field == 0:
+        return header
+    field_lst = header.split()
+    field = arg_field or 1
+    return field_lst[field - 1] if field <= len(field_lst) else ''
+
 def genomelen_dataframe(fa_len_dict):
     '''Parse fa_len_dict into dataframe, and out genome and it's number of bases
     
     parameter:
         fa_len_dict: dictionary {genome_name:{identifier:length}...}
     '''
-    genomic_len_dict = {}
-    for genome_name in fa_len_dict:
-        genomic_len_dict[genome_name] = 0
-        for identifier in fa_len_dict[genome_name]:
-            genomic_len_dict[genome_name] += fa_len_dict[genome_name][identifier]
-    
-    genomic_len_df = pd.DataFrame.from_dict(genomic_len_dict, orient='index', colums=['GenomeID', '#Base'])
+    row_lst = [[genome_name, sum(contig_len_dict.values())] for genome_name, contig_len_dict in fa_len_dict.items()]
+    genomic_len_df = pd.DataFrame(row_lst, columns=['GenomeID', '#Base'])
     return genomic_len_df
 
-def contiglen_dataframe(fa_len_dict):
+def contiglen_dataframe(fa_len_dict, arg_field=None):
     '''Parse fa_len_dict into dataframe, and out genome, contig, identifier and it's number of bases
     
     parameter:
         fa_len_dict: dictionary {genome_name:{identifier:length}...}
+        arg_field  : fasta id field to output, see identifier_field
     '''
-    contig_len_dict = {}
-    for genome_name in fa_len_dict:
-        for identifier in fa_len_dict[genome_name]:
-            contig_len = fa_len_dict[genome_name][identifier]
-            contig_len_dict[genome_name] = [identifier, contig_len]
-    
-    contig_len_df = pd.DataFrame.from_dict(contig_len_dict, orient='index', colums=['GenomeID', 'Identifier', '#Base'])
+    row_lst = [[genome_name, identifier_field(identifier, arg_field), contig_len]
+               for genome_name, contig_len_dict in fa_len_dict.items()
+               for identifier, contig_len in contig_len_dict.items()]
+    contig_len_df = pd.DataFrame(row_lst, columns=['GenomeID', 'Identifier', '#Base'])
     return contig_len_df
 
-def out_genomic_len(genomic_len_df, arg_scale, arg_ndecimal):
-    '''Output genome length in two-column, tab-delimited table.
-    
-    parameter:
-        genomic_len_df: two-column dataframe, genomename and genome_length
-        arg_scale     : scale unit,[K|M|G]
-        arg_ndecimal  : number of decimal places (default: 2)
-    '''
-    if arg_scale == 'K':
-        divisor = 1000
-    elif arg_scale == 'M':
-        divisor = 1000000
-    elif arg_scale == 'G':
-        divisor = 1000000000
-    else:
-        divisor = 1
-        arg_ndecimal = 0
-
-    genomic_len_df['#Base'].map(lambda x: round(x / divisor, arg_ndecimal))
-    genomic_len_df.to_csv(sys.stdout, sep='\t')
-
-def out_contig_len(contig_len_df, arg_scale, arg_ndecimal):
-    '''Output genome length in three-column, tab-delimited table.
+def scale_len(len_df, arg_scale, arg_ndecimal):
+    '''Scale the '#Base' column of a dataframe to K|M|G, rounded to arg_ndecimal places
 
     parameter:
-        contig_len_df: three-column dataframe, genomename, identifier and genome_length
-        arg_scale     : scale unit,[K|M|G]
-        arg_ndecimal  : number of decimal places (default: 2)
+        len_df      : dataframe with a '#Base' column
+        arg_scale   : scale unit,[K|M|G], None keeps the number of bases
+        arg_ndecimal: number of decimal places (default: 2)
     '''
-    if arg_scale == 'K':
-        divisor = 1000
-    elif arg_scale == 'M':
-        divisor = 1000000
-    elif arg_scale == 'G':
-        divisor = 1000000000
-    else:
-        divisor = 1
-        arg_ndecimal = 0
-
-    contig_len_df['#Base'].map(lambda x: round(x / divisor, arg_ndecimal))
-    contig_len_df.to_csv(sys.stdout, sep='\t')
+    divisor = {'K': 1000, 'M': 1000000, 'G': 1000000000}.get(arg_scale)
+    if divisor is not None:
+        ndecimal = 2 if arg_ndecimal is None else arg_ndecimal
+        len_df['#Base'] = len_df['#Base'].map(lambda x: round(x / divisor, ndecimal))
+    return len_df
+
+def out_len(len_df, arg_scale, arg_ndecimal):
+    '''Output the genome (two-column) or contig (three-column) lengths as a tab-delimited table.
+    '''
+    scale_len(len_df, arg_scale, arg_ndecimal).to_csv(sys.stdout, sep='\t', index=False)
 
 if __name__ == '__main__':
     args = parse_args()
-    fa_len_dict = fa2dict(args.input)
-    contig_len_df = contiglen_dataframe(fa_len_dict)
+    fa_len_dict = fa2dict(args.input, args.processes)
     if args.contig:
-        out_contig_len(contig_len_df, args.scale, args.ndecimal)
-        sys.exit(0)
-
-    genome_len_df = genomelen_dataframe(fa_len_dict)
-    out_genomic_len(genomic_len_df, args.scale, args.ndecimal)
-    sys.exit(0)
\ No newline at end of file
+        out_len(contiglen_dataframe(fa_len_dict, args.field), args.scale_unit, args.ndecimal)
+    else:
+        out_len(genomelen_dataframe(fa_len_dict), args.scale_unit, args.ndecimal)
+    sys.exit(0)
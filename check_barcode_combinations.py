@@ -6,17 +6,26 @@
 import os
 import sys
 import argparse
+import itertools
 
-import argparse
+from pyfunction import PartitionScheme, iter_alignment, map_in_order
 
 parser = argparse.ArgumentParser()
 
 parser.add_argument('--msa_barcode_model', type=str, required=True, help='The name of the MSA barcode model.')
-parser.add_argument('--combination_lst', type=str, required=True, help='A list of combinations to process.')
+combination_group = parser.add_mutually_exclusive_group(required=True)
+combination_group.add_argument('--combination_lst', type=str, help='A list of combinations to process.')
+combination_group.add_argument('--all_combinations', action='store_true', help='Process every k-subset of the barcodes, k from --min_size to --max_size.')
+parser.add_argument('--min_size', type=int, default=2, help='Smallest number of barcodes in a combination with --all_combinations. Default: 2')
+parser.add_argument('--max_size', type=int, default=None, help='Largest number of barcodes in a combination with --all_combinations. Default: all barcodes')
+parser.add_argument('--threads', type=int, default=4, help='Combinations written concurrently. Default: 4')
 parser.add_argument('--outdir', type=str, required=True, help='Output directory.')
 
 args = parser.parse_args()
 
+# buffers handed to a single writev call, some systems allow no more than 1024
+IOV_MAX = 1000
+
 def check_input(args_msa_barcode_models, args_combination_file):
     barcode_lst1 = []
     barcode_lst2 = []
@@ -34,88 +43,114 @@ def check_input(args_msa_barcode_models, args_combination_file):
     if not barcode_set2.issubset(barcode_set1):
         sys.exit('[Error]: some barcode does not have the corresponding barcode fasta file.')
 
-def read_fasta(fa_file):
-    fa_dict = {}
-    with open(fa_file, 'rt') as infh:
-        for line in infh:
-            line = line.rstrip('\n')
-            if line.startswith('>'):
-                seq_id = line.lstrip('>')
-                fa_dict[seq_id] = []
-            else:
-                fa_dict[seq_id].append(line)
-    fa_dict = {k:''.join(v) for k,v in fa_dict.items()}
-    length = len(list(fa_dict.values())[0])
-    taxa_lst = sorted(list(fa_dict.keys()))
-    return fa_dict, length, taxa_lst
-
 def read_msa(args_msa_barcode_models):
-    barcode_msa_dict = {}
+    '''Load every barcode alignment once, rows kept as encoded bytes
 
+    The rows, the gap row of each barcode and the FASTA header of each taxon are
+    built here and shared by all combinations, which only join references to them.
+    '''
+    barcode_msa_dict = {}
+    header_dict = {}
     with open(args_msa_barcode_models) as infh:
         for line in infh:
             msa_file, barcode, model = line.rstrip('\n').split()
-            barcode_msa_dict[barcode] = {}
-            fa_dict, length, taxa_lst = read_fasta(msa_file)
-            barcode_msa_dict[barcode]['length'] = length
-            barcode_msa_dict[barcode]['model'] = model
-            barcode_msa_dict[barcode]['msa_dict'] = fa_dict
-            barcode_msa_dict[barcode]['taxa_lst'] = taxa_lst
-    return barcode_msa_dict
+            msa_dict = dict(iter_alignment(msa_file))
+            length = len(next(iter(msa_dict.values())))
+            barcode_msa_dict[barcode] = {'length': length,
+                                         'model': model,
+                                         'msa_dict': msa_dict,
+                                         'gap': b'-' * length,
+                                         'taxa_lst': sorted(msa_dict)}
+            for taxa in msa_dict:
+                if taxa not in header_dict:
+                    header_dict[taxa] = f'>{taxa}\n'.encode()
+    return barcode_msa_dict, header_dict
+
+def read_combinations(args_combination_file):
+    '''(prefix, barcode list) of every line of the combination list
+    '''
+    combination_lst = []
+    with open(args_combination_file) as infh:
+        for line in infh:
+            prefix, barcode_combination_str = line.rstrip('\n').split('\t')
+            combination_lst.append((prefix, barcode_combination_str.split('-')))
+    return combination_lst
+
+def all_combinations(barcode_lst, min_size=2, max_size=None):
+    '''(prefix, barcode list) of every k-subset of barcode_lst, smallest first
+
+    the prefix is the barcodes joined by '-', in the order of barcode_lst
+    '''
+    max_size = len(barcode_lst) if max_size is None else min(max_size, len(barcode_lst))
+    for size in range(max(min_size, 1), max_size + 1):
+        for barcode_combination in itertools.combinations(barcode_lst, size):
+            yield '-'.join(barcode_combination), list(barcode_combination)
 
 def concatenate_msa(barcode_msa_dict, barcode_combination_lst):
-    common_taxa_id_lst = []
+    '''Partition scheme and the row buffers of each taxon, taxa missing from a barcode get its gap row
+    '''
+    common_taxa_id_set = set()
     for barcode in barcode_combination_lst:
-        common_taxa_id_lst.extend(barcode_msa_dict[barcode]['taxa_lst'])
-    common_taxa_id_lst = list(set(common_taxa_id_lst))
+        common_taxa_id_set.update(barcode_msa_dict[barcode]['msa_dict'])
 
-    concatenated_dict = {}
-    best_scheme = {}
+    best_scheme = PartitionScheme()
     for barcode in barcode_combination_lst:
-        length = barcode_msa_dict[barcode]['length']
-        msa_dict = barcode_msa_dict[barcode]['msa_dict']
-        model = barcode_msa_dict[barcode]['model']
-        best_scheme[barcode] = [model,length]
-        for taxa in common_taxa_id_lst:
-            if taxa not in concatenated_dict:
-                concatenated_dict[taxa] = []
-
-            if taxa not in msa_dict:
-                taxa_seq = '-' * length
-            else:
-                taxa_seq= msa_dict[taxa]
-            concatenated_dict[taxa].append(taxa_seq)
+        best_scheme.add(barcode, barcode_msa_dict[barcode]['length'], barcode_msa_dict[barcode]['model'])
+
+    concatenated_dict = {}
+    for taxa in sorted(common_taxa_id_set):
+        concatenated_dict[taxa] = [barcode_msa_dict[barcode]['msa_dict'].get(taxa, barcode_msa_dict[barcode]['gap'])
+                                   for barcode in barcode_combination_lst]
     return best_scheme, concatenated_dict
 
-def output(best_scheme, concatenated_dict, args_outdir, prefix):
+def writev_all(fd, buffer_lst):
+    '''write the buffers with one writev call, finishing a short write with os.write
+    '''
+    written = os.writev(fd, buffer_lst)
+    if written < sum(len(buffer) for buffer in buffer_lst):
+        rest = memoryview(b''.join(buffer_lst))[written:]
+        while rest:
+            rest = rest[os.write(fd, rest):]
+
+def output(best_scheme, concatenated_dict, header_dict, args_outdir, prefix):
+    '''write the concatenation with writev straight from the shared row buffers, no row is copied
+    '''
     outfile = f'{args_outdir}/{prefix}.concatenation.fna'
-    with open(outfile, 'wt') as outfh:
+    buffer_lst = []
+    fd = os.open(outfile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
         for taxa, taxa_seq_lst in concatenated_dict.items():
-            concatenated_seq = ''.join(taxa_seq_lst)
-            outfh.write(f">{taxa}\n{concatenated_seq}\n")
-    best_scheme_file = f"{args_outdir}/{prefix}.best_scheme.txt"
-    end = 0
-    with open(best_scheme_file, 'wt') as outfh:
-        outfh.write(f"#nexus\n")
-        outfh.write(f"begin sets;\n")
-        charpartion_str = 'charpartition ModelFinder = '
-        for barcode, model_length_lst in best_scheme.items():
-            model, length = model_length_lst
-            start = end + 1
-            end = end + length
-            outfh.write(f"charset {barcode} = {start}-{end};\n")
-            charpartion_str += f"{model}:{barcode},"
-        charpartion_str = charpartion_str.rstrip(',') + ";"
-        outfh.write(f"{charpartion_str}\n")
-        outfh.write(f"end;\n")
+            buffer_lst.append(header_dict[taxa])
+            buffer_lst.extend(taxa_seq_lst)
+            buffer_lst.append(b'\n')
+            if len(buffer_lst) >= IOV_MAX:
+                writev_all(fd, buffer_lst)
+                buffer_lst = []
+        if buffer_lst:
+            writev_all(fd, buffer_lst)
+    finally:
+        os.close(fd)
+    best_scheme.write(f"{args_outdir}/{prefix}.best_scheme.txt", 'nexus', name='ModelFinder')
+    return outfile
+
+def process_combination(barcode_msa_dict, header_dict, args_outdir, prefix, barcode_combination_lst):
+    best_scheme, concatenated_dict = concatenate_msa(barcode_msa_dict, barcode_combination_lst)
+    return output(best_scheme, concatenated_dict, header_dict, args_outdir, prefix)
 
 if __name__ == "__main__":
-    check_input(args.msa_barcode_model, args.combination_lst)
-    barcode_msa_dict = read_msa(args.msa_barcode_model)
-    with open(args.combination_lst) as infh:
-        for line in infh:
-            prefix, barcode_combination_str = line.rstrip('\n').split('\t')
-            barcode_combination_lst= barcode_combination_str.split("-")
-            best_scheme, concatenated_dict = concatenate_msa(barcode_msa_dict,barcode_combination_lst)
-            output(best_scheme, concatenated_dict, args.outdir, prefix)
+    if args.combination_lst:
+        check_input(args.msa_barcode_model, args.combination_lst)
+    barcode_msa_dict, header_dict = read_msa(args.msa_barcode_model)
+    if args.all_combinations:
+        combination_lst = list(all_combinations(list(barcode_msa_dict), args.min_size, args.max_size))
+    else:
+        combination_lst = read_combinations(args.combination_lst)
+    os.makedirs(args.outdir, exist_ok=True)
+
+    def process(combination):
+        prefix, barcode_combination_lst = combination
+        return process_combination(barcode_msa_dict, header_dict, args.outdir, prefix, barcode_combination_lst)
+
+    for num_done, outfile in enumerate(map_in_order(process, combination_lst, args.threads), start=1):
+        print(f'[{num_done}/{len(combination_lst)}] {outfile}', file=sys.stdout, flush=True)
     sys.exit(0)
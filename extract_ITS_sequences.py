@@ -5,10 +5,11 @@ extract_ITS_sequences.py -- extracte ITS sequences according ITSx result
 Date: 2021-06-21
 Bugs: Any bugs should be reported to chenyanpeng1992@outlook.com
 '''
-import os
 import sys
 import argparse
 
+from pyfunction import fetch_regions
+
 parser = argparse.ArgumentParser(
     description=__doc__,
     formatter_class=argparse.RawDescriptionHelpFormatter)
@@ -25,19 +26,6 @@ parser.add_argument('itsxposition',
 args = parser.parse_args()
 
 
-def parse_fa2dict(fasta):
-    fadict = {}
-    with open(fasta) as fafh:
-        for line in fafh:
-            line = line.rstrip('\n')
-            if line.startswith('>'):
-                seqid = line.split()[0].lstrip('>')
-                fadict[seqid] = []
-            else:
-                fadict[seqid].append(line)
-    fadict = {k:''.join(v) for k,v in fadict.items()}
-    return fadict
-
 def parse_itsx_positionfile(itsxposition):
     positiondict = {}
     with open(itsxposition) as pfh:
@@ -50,10 +38,10 @@ def parse_itsx_positionfile(itsxposition):
     return positiondict
 
 if __name__ == '__main__':
-    fadict = parse_fa2dict(args.fasta)
     positiondict = parse_itsx_positionfile(args.itsxposition)
-    for seqid,poss in positiondict.items():
-        start, end = poss
-        print(f'>{seqid}')
-        sequence = fadict[seqid][start - 1: end]
-        print(f'{sequence}')
\ No newline at end of file
+    region_lst = [(seqid, start, end) for seqid, (start, end) in positiondict.items()]
+    for (seqid, _, _), sequence in zip(region_lst, fetch_regions(args.fasta, region_lst)):
+        if sequence is None:
+            print(f'Warning: {seqid} not found in {args.fasta}', file=sys.stderr, flush=True)
+            continue
+        sys.stdout.write(f'>{seqid}\n{sequence}\n')
@@ -8,11 +8,10 @@ BUGS：
     Any bugs should be sent to chenyanpeng1992@outlook.com
 '''
 
-import os
 import sys
-import gzip
 import argparse
-import fileinput
+
+from pyfunction import fetch_regions
 
 def parse_args():
     '''Parse command-line arguments.
@@ -23,7 +22,7 @@ def parse_args():
     parser.add_argument('fasta',
         metavar='<fasta-file>',
         type=str,
-        help='input bed file')
+        help='input fasta file, indexed as <fasta-file>.fai on first use (.gz allowed, read without index)')
 
     parser.add_argument('bed',
         metavar='<bed-file>',
@@ -32,27 +31,8 @@ def parse_args():
     args = parser.parse_args()
     return args
 
-def fa2dict(fafile):
-    '''Parse fasta file into dict.
-    '''
-    fafh = gzip.open(fafile, 'rt') if fafile.endswith('.gz') else open(fafile, 'rt')
-
-    fa_dict = {}
-    for line in fa:
-        line = line.rstrip('\n')
-
-        if line.startswith('>'):
-            ID = line.split()[0]
-            fa_dict[ID] = []
-        else:
-            fa_dict[ID].append(line)
-    fafh.close()
-
-    fa_dict = {ID:''.join(line_lst) for ID, line_lst in fa_dict.items()}
-   return fa_dict
-
 def bed2dict(bedfile):
-    '''Parse bed file to dict.
+    '''Parse bed file to a list of intervals, 1-based and inclusive. An ID may have several intervals.
 
     #ID     ITS1.start      ITS2.end
     NR_073212       31      585
@@ -60,30 +40,26 @@ def bed2dict(bedfile):
     NR_073235       31      436
     NR_073272       31      532
     '''
-    bedfh = open(bedfile, 'rt')
-    
-    bed_dict ={}
-    for line in bedfh:
-        line = line.rstrip('\n')
-        if line.startswith('>'):
-            continue
-
-        bed_lst = line.split()
-        ID, start, end = bed_lst
-        bed_dict[ID] = (int(start), int(end))
-    bedfh.close()
+    bed_lst = []
+    with open(bedfile, 'rt') as bedfh:
+        for line in bedfh:
+            if line.startswith('#') or not line.strip():
+                continue
+            ID, start, end = line.split()[:3]
+            bed_lst.append((ID, int(start), int(end)))
+    return bed_lst
 
-    return bed_dict
-
-def out_intervals(fa_dict, bed_dict):
-    for ID in bed_dict:
-        start, end = bed_dict[ID]
-        interval = fa_dict[start - 1:end]
-        print(f'>{ID}', file=sys.stdout, flush=True)
-        print(f'{interval}', file=sys.dtdout, flush=True)
+def out_intervals(fafile, bed_lst):
+    '''Write the intervals in bed order, read from the fasta in file order through its index
+    '''
+    for (ID, start, end), interval in zip(bed_lst, fetch_regions(fafile, bed_lst)):
+        if interval is None:
+            print(f'Warning: {ID} not found in {fafile}', file=sys.stderr, flush=True)
+            continue
+        sys.stdout.write(f'>{ID}\n{interval}\n')
+    sys.stdout.flush()
 
 if __name__ == '__main__':
     args = parse_args()
-    fa_dict = fa2dict(args.fasta)
-    bed_dict = bed2dict(args.bed)
-    out_intervals(fa_dict, bed_dict)
\ No newline at end of file
+    bed_lst = bed2dict(args.bed)
+    out_intervals(args.fasta, bed_lst)
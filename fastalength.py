@@ -6,12 +6,13 @@ fastalength.py -- calucate the fasta length
 AUTHOR: yanpengch@qq.com
 DATE  : 2022-09-24
 USAGE : 
-    fastalength.py input.fa
+    fastalength.py input.fa[.gz]
     cat input.fa | fastalength.py -  
 '''
 
 import sys
-import fileinput
+
+from pyfunction import read_fasta
 
 
 if len(sys.argv) <= 1:
@@ -23,18 +24,6 @@ if (sys.argv[1] in ['-h', '--h', '-help', '--help']) or (len(sys.argv) > 2):
     sys.exit(1)
 
 
-with fileinput.FileInput(sys.argv[1]) as infh:
-    count = 0
-    for line in infh:
-        if line.startswith('>') and count == 0:
-            print(line.lstrip('>') + '\t', end='', file=sys.stdout, flush=True)
-
-        elif line.startswith('>') and count != 0:
-            print(count, file=sys.stdout, flush=True)
-            print(line.lstrip('>') + '\t', end='', file=sys.stdout, flush=True)
-            count = 0
-
-        else:
-            count += len(line.rstrip('\n'))
-    print(count, file=sys.stdout, flush=True)
+for seq_id, seq_len in read_fasta(sys.argv[1], length_only=True, full_header=True):
+    print(seq_id, seq_len, sep='\t', file=sys.stdout, flush=True)
 sys.exit(0)
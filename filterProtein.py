@@ -9,9 +9,13 @@ Bugs:
 '''
 import os
 import sys
-import gzip
 import argparse
 
+from pyfunction import alphabet_filter, filter_fasta, id_filter, min_length_filter, start_residue_filter
+
+# the 20 standard amino acids, a trailing stop '*' is tolerated
+SINGLE_LETTER_AMINO_ACID_CODE = 'GAVLIPFYWSTCMNQDEKRH'
+
 def parse_args():
     '''Parse command-line arguments.
     '''
@@ -33,14 +37,31 @@ def parse_args():
                         action='store_true',
                         help='filter by the start amino acid "M"')
 
+    parser.add_argument('-a', '--alphabet',
+                        default=SINGLE_LETTER_AMINO_ACID_CODE,
+                        metavar='<letters>',
+                        type=str,
+                        help=f'allowed residues, a trailing "*" is tolerated; "" disables the check. default: {SINGLE_LETTER_AMINO_ACID_CODE}')
+
+    parser.add_argument('-i', '--ids',
+                        metavar='<ids.txt>',
+                        type=str,
+                        help='keep only the proteins listed in this file, one ID per line')
+
+    parser.add_argument('-x', '--exclude_ids',
+                        metavar='<ids.txt>',
+                        type=str,
+                        help='remove the proteins listed in this file, one ID per line')
+
     parser.add_argument('-out', '--field',
+                        dest='out',
                         metavar='<in_pass.faa.gz>',
                         type=str,
-                        help='filtered protein file name. default: in_pass.faa.gz')
+                        help='filtered protein file name. default: in_pass.faa(.gz)')
     
     parser.add_argument('-f', '--failed_out',
                         metavar='<in_notpass.faa.gz>',
-                        help='protein file that did not pass the filtration. default: in_notpass.faa.gz')
+                        help='protein file that did not pass the filtration. default: in_notpass.faa(.gz)')
     
     parser.add_argument('-S', '--statistics',
                         metavar='<statistics.txt>',
@@ -54,110 +75,48 @@ def parse_args():
 
     return args
 
-class Proteinfaa:
-    single_letter_amino_acid_code = 'GAVLIPFYWSTCMNQDEKRH'
-    
-    def __init__(self, infile, length=50, start=False):
-        self.abspath = os.path.abspath(infile)
-        self.suffix = os.path.splitext(infile)[1]
-        self.filename = os.path.split(infile)[1].rstrip(self.suffix)
-        self.checkstart = start
-        self.checklength = length
-    
-    def fa_length(self):
-        self.fadict = {}
-        fh = gzip.open(self.abspath, 'rt') if self.suffix == '.gz' else open(self.abspath)
-        for line in fh:
-            line = line.rstrip('\n')
-
-            if line.startswith('>'):
-                # protein_des : protein description line
-                protein_des = line.lstrip('>')
-                self.fadict[protein_des] = []
-            else:
-                # valid the protein, whether the sequence only consists of 20 AA 
-                for amino_acid in line.uppeer():
-                    if amino_acid not in single_letter_amino_acid_code:
-                        sys.exit(f'Error: unnatural amino acid: {amino_acid} in {protein_des}')
-                
-                self.fadict[protein_des].append(line)
-        fh.close()
-        self.fadict = {k:''.join(v) for k,v in self.fadict.items()}
-        return self.fadict
-    
-    def filter_by_start(self):
-        self.pass_start_lst = []
-        self.notpass_start_lst = []
-        
-        if not self.checkstart:
-            return self.pass_start_lst, self.notpass_start_lst
-
-        for k,v in self.fadict.items():
-            if v.upper().startswith('M'):
-                self.pass_start_lst.append(k)
-            else:
-                self.notpass_start_lst.append(k)
-        return self.pass_start_lst, self.notpass_start_lst
-    
-    def filter_by_length(self):
-        self.pass_length_lst = []
-        self.notpass_length_lst = []
-
-        for k,v in self.fadict.items():
-            if len(v) >= self.checklength:
-                self.pass_length_lst.append(k)
-            else:
-                self.notpass_length_lst.append(k)
-        return self.pass_length_lst, self.notpass_length_lst
-    
-    def filter_by_start_length(self):
-        self.pass_start_length_lst = []
-        self.pass_start_length_lst = list(set(self.pass_start_lst) & set(self.pass_length_lst))
-        self.notpass_start_length_lst = list(set(self.fadict.keys()) - set(self.pass_start_length_lst))
-        return self.pass_start_length_lst, self.notpass_start_length_lst
+def read_id_lst(idfile):
+    with open(idfile, 'rt') as infh:
+        return {line.split()[0] for line in infh if line.strip()}
+
+def output_names(args):
+    '''pass/notpass file names: given ones, or derived from the input name; .gz appended with --gzip
+
+    outputs ending with .gz are compressed
+    '''
+    filename = os.path.basename(args.fasta)
+    for suffix in ('.gz', '.faa', '.fasta', '.fa'):
+        if filename.endswith(suffix):
+            filename = filename[:-len(suffix)]
+    passed_file = args.out or f'{filename}_pass.faa'
+    failed_file = args.failed_out or f'{filename}_notpass.faa'
+    if args.gzip:
+        passed_file = passed_file if passed_file.endswith('.gz') else passed_file + '.gz'
+        failed_file = failed_file if failed_file.endswith('.gz') else failed_file + '.gz'
+    return passed_file, failed_file
 
 if __name__ == '__main__':
     args = parse_args()
-    proteinfa = Proteinfaa(args.fasta, length=args.len_threshold, start=args.start_aminoacid)
-    if args.out:
-        proteinfa.filename = args.out
-    
-    ofh = gzip.open(args.out, 'w') if args.gzip else open(args.out, 'w')
-    line_width = 70
-    for passed_id in proteinfa.pass_start_length_lst:
-        ofh.write(f'>{passed_id}\n')
-        
-        # formatting fasta output 
-        sequence = proteinfa.fadict[passed_id]
-        line_num = len(sequence) // line_width + 1 if len(sequence) % line_width != 0 else len(sequence) // line_width 
-        line_lst = []
-        n = 1
-        while n < line_number:
-            line_lst.append(sequence[line_width*(n-1):line_width*n]) 
-            n += 1
-        line_lst.append(sequence[line_width*n:])
-        line_out = "\t".join(line_lst)
-        ofh.write(f'{line_out}\n')
-    ofh.close()
-
-    if args.failed_out:
-        if args.gzip:
-            args.failed_out = args.failed_out.rstrip('.gz') + '.gz'
-    
-        failed_ofh = gzip.open(args.failed_out, 'w') if args.gzip else open(args.failed_out, 'w')
-        
-        for notpassed_id in proteinfa.notpass_start_length_lst:
-            failed_ofh.write(f'>{notpassed_id}\n')
-        
-        # formatting fasta output 
-            sequence = proteinfa.fadict[notpassed_id]
-            line_num = len(sequence) // line_width + 1 if len(sequence) % line_width != 0 else len(sequence) // line_width 
-            line_lst = []
-            n = 1
-            while n < line_number:
-                line_lst.append(sequence[line_width*(n-1):line_width*n]) 
-                n += 1
-            line_lst.append(sequence[line_width*n:])
-            line_out = "\t".join(line_lst)
-            failed_ofh.write(f'{line_out}\n')
-        failed_ofh.close()         
\ No newline at end of file
+    predicate_lst = []
+    if args.alphabet:
+        predicate_lst.append(alphabet_filter(args.alphabet))
+    predicate_lst.append(min_length_filter(args.len_threshold))
+    if args.start_aminoacid:
+        predicate_lst.append(start_residue_filter('M'))
+    if args.ids:
+        predicate_lst.append(id_filter(read_id_lst(args.ids)))
+    if args.exclude_ids:
+        predicate_lst.append(id_filter(read_id_lst(args.exclude_ids), exclude=True))
+
+    passed_file, failed_file = output_names(args)
+    # proteins are streamed one at a time, rewrapped to 70 residues per line
+    counter = filter_fasta(args.fasta, predicate_lst, passed_file, failed_file, line_width=70)
+
+    print(f'Before filtering: {counter["passed"] + counter["failed"]}', file=sys.stdout, flush=True)
+    print(f'After  filtering: {counter["passed"]}', file=sys.stdout, flush=True)
+    if args.statistics:
+        with open(args.statistics, 'wt') as outfh:
+            outfh.write(f'total\t{counter["passed"] + counter["failed"]}\n')
+            outfh.write(f'passed\t{counter["passed"]}\n')
+            for predicate in predicate_lst:
+                outfh.write(f'failed:{predicate.__name__}\t{counter[predicate.__name__]}\n')
@@ -8,6 +8,8 @@ Date : 2021-04-30
 import sys
 import argparse
 
+from pyfunction import read_orthogroup_table
+
 def parse_args():
     '''Parse command-line arguments
     '''
@@ -29,39 +31,28 @@ def parse_args():
         metavar='<outname>',
         help='output filename')
 
+    parser.add_argument('--no_cache',
+        action='store_true',
+        help='read the matrix as text, do not use or write its binary cache')
+
     args = parser.parse_args()
     return args
 
-def filter_by_species_coverage(genecount_matrix, percent_coverage):
+def filter_by_species_coverage(genecount_matrix, percent_coverage, use_cache=True):
     '''filter orthofroups according species coverage
-    '''
-    after_orthogroup_dict = {}
-    with open(genecount_matrix) as matrixfh:
-        n = 0
-        num_orthogroup_filtered = 0
-        for line in matrixfh:
-            n += 1
-            line_lst = line.rstrip('\n').split('\t')
-            if n == 1:
-                head_line_lst = line_lst
-                continue
 
-            orthogroup_name = line_lst[0]
-            orthogroup_gene_count_lst = line_lst[1:]
-            # percent of genomes share this orthogroup
-            if orthogroup_gene_count_lst.count('0') / len(orthogroup_gene_count_lst) > percent_coverage:
-                num_orthogroup_filtered += 1
-            else:
-                after_orthogroup_dict[orthogroup_name] = orthogroup_gene_count_lst
+    A binary cache next to the matrix is loaded instead of the text while it is fresh.
+    '''
+    _, count_df = read_orthogroup_table(genecount_matrix, gene_ids=False, use_cache=use_cache)
+    # percent of genomes share this orthogroup
+    filtered_mask = (count_df == 0).sum(axis=1) / count_df.shape[1] > percent_coverage
+    num_orthogroup_filtered = int(filtered_mask.sum())
     print("==================Summary==================", file=sys.stdout)
-    print(f"Number of orthogroups         : {n}", file=sys.stdout)
+    print(f"Number of orthogroups         : {count_df.shape[0]}", file=sys.stdout)
     print(f'Number of filtered orthogroups: {num_orthogroup_filtered}', file=sys.stdout)
-    return head_line_lst, after_orthogroup_dict
+    return count_df[~filtered_mask]
 
 if __name__ == '__main__':
     args = parse_args()
-    head_line_lst, after_orthogroup_dict = filter_by_species_coverage(args.input, args.coverage)
-    with open(args.out, 'wt') as outfh:
-        outfh.write('\t'.join(head_line_lst) + '\n')
-        for orthogroup, orthogroup_genecount_lst in after_orthogroup_dict.items():
-            outfh.write(orthogroup + '\t' + '\t'.join(orthogroup_genecount_lst) + '\n')
+    after_count_df = filter_by_species_coverage(args.input, args.coverage, not args.no_cache)
+    after_count_df.to_csv(args.out, sep='\t')
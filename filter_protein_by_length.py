@@ -9,9 +9,10 @@ BUGS：
 '''
 
 import sys
-import gzip
 import argparse
 
+from pyfunction import filter_fasta, min_length_filter
+
 def parse_args():
     '''Parse command-line arguments.
     '''
@@ -27,6 +28,11 @@ def parse_args():
         type=str,
         metavar='<out-fasta>',
         help='output fasta filename (suffix .gz for gzipped out)')
+
+    parser.add_argument('-f', '--failed_out',
+        type=str,
+        metavar='<failed-fasta>',
+        help='also write the removed proteins to this file (suffix .gz for gzipped out)')
     
     parser.add_argument('-l', '--length',
         type=int,
@@ -37,84 +43,8 @@ def parse_args():
     args = parser.parse_args()
     return args
 
-def fasta_2dict(infile):
-    '''
-    Parse fasta into python dictionary
-
-    Parameter
-    ---------
-    infile : str
-        input file in FASTA format
-
-    Return
-    ------
-    fa_dict : dict
-        python dictionary, keys represent protein names and values represent sequence lst
-    '''
-    fa_fh = gzip.open(infile, 'rt') if infile.endswith('.gz') else open(infile, 'rt')
-
-    fa_dict = {}
-    for line in fa_fh:
-        if line.startswith('>'):
-            protein_id = line
-            fa_dict[protein_id] = []
-        else:
-            fa_dict[protein_id].append(line)
-    fa_fh.close()
-    return fa_dict
-
-def filter_by_length(fa_dict, length):
-    '''
-    Removed protein if the it's length short than given length
-
-    Parameter
-    ---------
-    fa_dict : dict
-        python dictionary, keys represent contig names and values represent sequence list
-    length : int
-        the minimal length of protein sequences.
-
-    Return
-    ------
-    filtered_dict : dict
-        Filtered protein dict
-    [num_before, num_after] : list
-        num_before and num_after represent the number of proteins before filtering and after respectively
-    '''
-    filtered_dict = {}
-    for protein_id, seq_lst in fa_dict.items():
-        line_width_lst = [len(line) - 1 for line in seq_lst]
-        seq_length = sum(line_width_lst)
-        if seq_length >= length:
-            filtered_dict[protein_id] = seq_lst
-
-    num_before = len(fa_dict)
-    num_after = len(filtered_dict)
-    return filtered_dict, [num_before, num_after]
-
-
-def out_fasta(filtered_dict, outfile):
-    '''
-    Out filtered protein sequences in FASTA format
-
-    Parameters
-    ----------
-    filtered_dict : dict
-        Filtered protein dict
-    outfile : str
-        outfilename (suffix .gz for gzipped out)
-    '''
-    ofh = gzip.open(outfile, 'w') if outfile.endswith('.gz') else open(outfile, 'w')
-    for protein_id, seq_lst in filtered_dict.items():
-        ofh.write(protein_id)
-        for line in seq_lst:
-            ofh.write(line)
-    ofh.close()
-
 if __name__ == '__main__':
     args = parse_args()
-    fa_dict = fasta_2dict(args.input)
-    filtered_dict, [num_before, num_after] = filter_by_length(fa_dict, args.length)
-    print(f'Before filtering: {num_before}', file=sys.stdout, flush=True)
-    print(f'After  filtering: {num_after}', file=sys.stdout, flush=True)
-    out_fasta(filtered_dict, args.output)
\ No newline at end of file
+    counter = filter_fasta(args.input, [min_length_filter(args.length)], args.output, args.failed_out)
+    print(f'Before filtering: {counter["passed"] + counter["failed"]}', file=sys.stdout, flush=True)
+    print(f'After  filtering: {counter["passed"]}', file=sys.stdout, flush=True)
@@ -16,6 +16,8 @@ import sys
 import time
 import argparse
 
+from pyfunction import BLAST_RANK_KEYS, best_blast_hits, fetch_regions, iter_blast_tab
+
 
 # global variables, please specify the absolute path of blastn
 blastn = '/data/Tools/anaconda3/bin/blastn'
@@ -48,6 +50,12 @@ parser.add_argument('-f', '--flanklength',
                     metavar='<int>',
                     help='length of flanking sequences surrounding the HSP region')
 
+parser.add_argument('-r', '--rank',
+                    choices=list(BLAST_RANK_KEYS),
+                    nargs='+',
+                    default=['length'],
+                    help='rank HSPs of a barcode by these values, in order, higher is better. default: length')
+
 
 args = parser.parse_args()
 
@@ -74,78 +82,39 @@ def run_blastn(args_bait: str, args_genome: str, args_outdir: str):
     return blastn_out_lst
 
 
-def best_barcode_location(blastn_out_lst, identity_threshold=60):
+def best_barcode_location(blastn_out_lst, identity_threshold=60, rank=('length',)):
     '''Determine the best barcode location according score
 
     Rules:
-        identity > 80%, the longer HSP the better
+        identity >= identity_threshold, the longer HSP the better (or the given rank)
     '''
     c_time = time.strftime("%Y-%b-%d %H:%M:%S", time.gmtime())
     print(f'{c_time} -- Selecting the best hit according to the Score value.', file=sys.stdout, flush=True)
 
-    barcode_dict = {}
-    for genome_basename in blastn_out_lst:
-        barcode_dict[genome_basename] = []
-        with open(genome_basename + '.blastn') as blastnfh:
-            for line in blastnfh:
-                line_lst = line.rstrip('\n').split('\t')
-
-                subject_id = line_lst[1]
-                barcode = subject_id.split('_')[0]
-                identity = float(line_lst[2])
-
-                # filter hist with identities less than 80
-                if identity < identity_threshold:
-                    continue
-
-                if barcode not in barcode_dict:
-                    barcode_dict[genome_basename][barcode] = [line_lst]
-                else:
-                    barcode_dict[genome_basename][barcode].append(line_lst)
-
     best_hit_dict = {}
-
-    for genome_basename in barcode_dict:
-        for barcode, blast_hits_lst in barcode_dict.items():
-            blast_hits_lst = sorted(
-                blast_hits_lst, key=lambda blast_hits_lst: int(blast_hits_lst[3]), reverse=True)
-            best_hit_dict[genome_basename][barcode] = blast_hits_lst[0]
-
+    for genome_basename in blastn_out_lst:
+        # stream the hits, only the best one of each barcode is kept
+        barcode_hit_dict = best_blast_hits(iter_blast_tab(genome_basename + '.blastn'),
+                                           key_func=lambda hit: hit[1].split('_')[0],
+                                           rank=rank,
+                                           min_identity=identity_threshold)
+        best_hit_dict[genome_basename] = {barcode: hit_lst[0] for barcode, hit_lst in barcode_hit_dict.items()}
     return best_hit_dict
 
 
-def read_fasta2_dict(args_genome):
-    '''Parse genome fasta into python3 dict
-    '''
-    genome_dict = dict()
-    for genome in args_genome:
-        genome_basename = os.path.basename(genome)
-        genome_dict[genome_basename] = dict()
-
-        with open(genome, 'rt') as genomefh:
-            for line in genomefh:
-                line = line.rstrip('\n')
-                if line.startswith('>'):
-                    contigid = line.split()[0].lstrip('>')
-                    genome_dict[genome_basename][contigid] = []
-                else:
-                    genome_dict[genome_basename][contigid].append(line)
-    
-    new_genome_dict = {}
-    for genome_basename,subgenome_dict in genome_dict.items():
-        new_genome_dict[genome_basename] = {}
-        for k,v in subgenome_dict.items():
-            new_genome_dict[genome_basename][k] = ''.join(v)
-    return new_genome_dict
-
-def extract_barcode_sequences(new_genome_dict, best_hit_dict, flank_length):
+def extract_barcode_sequences(args_genome, best_hit_dict, flank_length):
     '''extract barcode sequences from genome sequence according corresponding blastn best hit
+
+    The hit regions of each genome are fetched in one go, through its .fai index when it can be indexed.
     '''
     c_time = time.strftime("%Y-%b-%d %H:%M:%S", time.gmtime())
     print(f'{c_time} -- extract best hit region.', file=sys.stdout, flush=True)
 
+    genome_path_dict = {os.path.basename(genome): genome for genome in args_genome}
     target_barcode_dict = {}
     for genome_basename, hit_dict in best_hit_dict.items():
+        region_lst = []
+        defline_lst = []
         for barcode, hit_lst in hit_dict.items():
             contig_id = hit_lst[0]
             identity = hit_lst[2]
@@ -174,27 +143,29 @@ def extract_barcode_sequences(new_genome_dict, best_hit_dict, flank_length):
 
             target_length = target_with_flank_right - target_with_flank_left + 1
             
-            target_seq = new_genome_dict[genome_basename][contig_id][target_with_flank_left -
-                                                        1:target_with_flank_right].upper()
-            defline = f'>{barcode} Ref={hit_lst[1]} RefLength={subject_length} HSP={hsp_length} Identity={identity} Length={target_length} File={genome_basename}'
-            target_barcode_dict[defline] = target_seq
+            region_lst.append((contig_id, target_with_flank_left, target_with_flank_right))
+            defline_lst.append(f'>{barcode} Ref={hit_lst[1]} RefLength={subject_length} HSP={hsp_length} Identity={identity} Length={target_length} File={genome_basename}')
+
+        seq_lst = fetch_regions(genome_path_dict[genome_basename], region_lst)
+        for defline, (contig_id, _, _), target_seq in zip(defline_lst, region_lst, seq_lst):
+            if target_seq is None:
+                sys.exit(f'Error: {contig_id} not found in {genome_path_dict[genome_basename]}')
+            target_barcode_dict[defline] = target_seq.upper()
     return target_barcode_dict
 
 
 if __name__ == '__main__':
     blastn_out_lst = run_blastn(args.bait, args.genome, args.outdir)
-    best_barcode_location(blastn_out_lst, identity_threshold=60)
-    best_hit_dict = best_barcode_location(blastn_out_lst)
+    best_hit_dict = best_barcode_location(blastn_out_lst, identity_threshold=60, rank=args.rank)
 
-    new_genome_dict = read_fasta2_dict(args.genome)
     target_barcode_dict = extract_barcode_sequences(
-        new_genome_dict, best_hit_dict, args.flanklength)
+        args.genome, best_hit_dict, args.flanklength)
 
     for defline, sequence in target_barcode_dict.items():
         defline_lst = defline.split()
         barcode_label = defline_lst[0].lstrip('>')
         genome_label = ''.join(defline_lst[-1].lstrip('File=').rstrip('\n').split('.')[:-1])
         outfile = f'{args.outdir}/{barcode_label}_{genome_label}.fasta'
-        with open(outfile) as outfh:
-            outfh.write(f'>{genome_label}\n'{sequence}\n)
+        with open(outfile, 'wt') as outfh:
+            outfh.write(f'>{genome_label}\n{sequence}\n')
     sys.exit(0)
@@ -5,16 +5,19 @@
 
 import os
 import sys
+import shutil
+import hashlib
 import argparse
-from concurrent.futures import ThreadPoolExecutor
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from pyfunction import BLAST_RANK_KEYS, best_blast_hits, fetch_regions, iter_blast_tab
 
 # check the requirements first.
-if not os.system('cd-hit -h &> /dev/null'):
-    print('Error: cd-hit is required. Please install it.', file=sys.stderr, flush=True)
-    sys.exit(1)
-if os.system('blastn -h &> /dev/null'):
-    print('Error: blastn is required. Please install it.', file=sys.stderr, flush=True)
-    sys.exit(1)
+for program in ['cd-hit', 'makeblastdb', 'blastn']:
+    if shutil.which(program) is None:
+        print(f'Error: {program} is required. Please install it.', file=sys.stderr, flush=True)
+        sys.exit(1)
 
 # add command-line argument parser
 parser = argparse.ArgumentParser(description="extract barcode sequences from genome assemblies.")
@@ -48,6 +51,21 @@ parser.add_argument('--cpu', '-c',
         default=1,
         help='Maximum number of CPUs to use for parallel processing. Default is all available CPUs.')
 
+parser.add_argument('--db_dir', '-d',
+        default='barcode_fisher_blastdb',
+        help='directory caching one blast database per genome across runs. Default: barcode_fisher_blastdb')
+
+parser.add_argument('--rank', '-r',
+        choices=list(BLAST_RANK_KEYS),
+        nargs='+',
+        default=['bitscore'],
+        help='rank the hits of a barcode by these values, in order, higher is better. Default: bitscore')
+
+parser.add_argument('--timeout', '-t',
+        type=int,
+        default=0,
+        help='seconds allowed for each makeblastdb/blastn call, 0 means no limit. Default: 0')
+
 args = parser.parse_args()
 
 # confirm that each barcode sequence have the corresponding barcode label
@@ -55,8 +73,18 @@ def check_input(args_sequence, args_barcode_label):
     if len(args_barcode_label) != len(args_sequence):
         sys.exit('Error: Each barcode sequence must be associated with a corresponding barcode label.' )
 
+def run_command(cmd_lst, timeout=0):
+    '''run an external command, raise RuntimeError if it fails or exceeds timeout seconds
+    '''
+    try:
+        process = subprocess.run(cmd_lst, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, timeout=timeout or None)
+    except subprocess.TimeoutExpired:
+        raise RuntimeError(f"timeout after {timeout}s: {' '.join(cmd_lst)}")
+    if process.returncode != 0:
+        raise RuntimeError(f"exit status {process.returncode}: {' '.join(cmd_lst)}\n{process.stderr.strip()}")
+
 def run_cdhit_threaded(fasta, label):
-    os.system(f"cd-hit -i {fasta} -aL 0.8 -o temp_barcode_fisher/temp_cdhit/{label}.cdhit.I0.9L0.8 &>/dev/null")
+    run_command(['cd-hit', '-i', fasta, '-aL', '0.8', '-o', f"temp_barcode_fisher/temp_cdhit/{label}.cdhit.I0.9L0.8"])
 
 def run_cdhit(args_fasta_lst, args_barcode_lst, max_workers):
     os.system('rm -rf temp_barcode_fisher')
@@ -64,29 +92,90 @@ def run_cdhit(args_fasta_lst, args_barcode_lst, max_workers):
     os.system('mkdir temp_barcode_fisher/temp_cdhit')
     tasks = list(zip(args_fasta_lst,args_barcode_lst))
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        executor.map(lambda p: run_cdhit_threaded(*p), tasks)
-
-def run_blastn_threaded(label, genome):
-    genome_abbre = os.path.basename(genome)
-    os.system(f"blastn -query temp_barcode_fisher/temp_cdhit/{label}.cdhit.I0.9L0.8.fasta -subject {genome} -outfmt 6 -out temp_barcode_fisher/temp_blastn/{label}_{genome_abbre}.blastn")
-
-def run_blastn(args_barcode_label, genome_lst, max_workers):
-    os.system('mkdir temp_barcode_fisher/temp_blastn')
-    tasks = [(label, genome) for label in args_barcode_label for genome in genome_lst]
+        try:
+            list(executor.map(lambda p: run_cdhit_threaded(*p), tasks))
+        except RuntimeError as error:
+            sys.exit(f'Error: cd-hit failed: {error}')
+
+def genome_file_label(genome):
+    '''basename of a genome plus a hash of its absolute path, so that genomes sharing a basename get their own files
+    '''
+    path_hash = hashlib.sha1(os.path.abspath(genome).encode()).hexdigest()[:12]
+    return f"{os.path.basename(genome)}.{path_hash}"
+
+def make_blastdb(genome, db_dir, timeout=0):
+    '''build the blast database of a genome once, reuse it while the genome file is unchanged
+    '''
+    db = os.path.join(db_dir, genome_file_label(genome))
+    genome_stat = os.stat(genome)
+    stamp = f"{os.path.abspath(genome)}\t{genome_stat.st_size}\t{genome_stat.st_mtime_ns}\n"
+    if os.path.exists(f"{db}.stamp"):
+        with open(f"{db}.stamp", 'rt') as infh:
+            if infh.read() == stamp:
+                return db
+    run_command(['makeblastdb', '-in', genome, '-dbtype', 'nucl', '-out', db], timeout)
+    with open(f"{db}.stamp", 'wt') as outfh:
+        outfh.write(stamp)
+    return db
+
+def write_query(args_barcode_label, query_fasta):
+    '''pool the cd-hit representatives of all barcodes into one query file, named label_1, label_2...
+    '''
+    with open(query_fasta, 'wt') as outfh:
+        for label in args_barcode_label:
+            with open(f"temp_barcode_fisher/temp_cdhit/{label}.cdhit.I0.9L0.8", 'rt') as infh:
+                count = 0
+                for line in infh:
+                    if line.startswith('>'):
+                        count += 1
+                        outfh.write(f">{label}_{count}\n")
+                    else:
+                        outfh.write(line)
+
+def run_blastn_genome(query_fasta, genome, db_dir, timeout=0):
+    '''blastn all barcode queries against one genome database, return the tabular output file
+    '''
+    db = make_blastdb(genome, db_dir, timeout)
+    blastn_out = f"temp_barcode_fisher/temp_blastn/{genome_file_label(genome)}.blastn"
+    run_command(['blastn', '-query', query_fasta, '-db', db, '-outfmt', '6', '-out', blastn_out], timeout)
+    return blastn_out
+
+def read_best_hits(blastn_out, args_barcode_label, rank=('bitscore',)):
+    '''stream a tabular blastn output, keep the best hit (contig, sstart, send) of each barcode
+    '''
+    barcode_hit_dict = best_blast_hits(iter_blast_tab(blastn_out), key_func=lambda hit: hit[0].rsplit('_', 1)[0], rank=rank)
+    hit_dict = {}
+    for label in args_barcode_label:
+        if label in barcode_hit_dict:
+            hit = barcode_hit_dict[label][0]
+            hit_dict[label] = (hit[1], int(hit[8]), int(hit[9]))
+    return hit_dict
+
+def run_blastn(args_barcode_label, genome_lst, max_workers, db_dir, timeout=0, rank=('bitscore',)):
+    '''one multi-query blastn per genome on a pool of max_workers jobs
+
+    Return:
+        dict: {genome: {barcode: (contig, sstart, send)}}, parsed as each genome finishes
+    '''
+    os.makedirs('temp_barcode_fisher/temp_blastn', exist_ok=True)
+    os.makedirs(db_dir, exist_ok=True)
+    query_fasta = 'temp_barcode_fisher/temp_blastn/barcodes.fasta'
+    write_query(args_barcode_label, query_fasta)
+
+    genome_hit_dict = {}
+    failed_lst = []
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        executor.map(lambda p: run_blastn_threaded(*p), tasks)
-
-def read_genome_2dict(genome):
-    genome_dict = {}
-    with open(genome, 'rt') as infh:
-        for line in infh:
-            if line.startswith('>'):
-                contig_id = line.rstrip('\n').split()[0].lstrip('>')
-                genome_dict[contig_id] = []
-            else:
-                genome_dict[contig_id].append(line.rstrip('\n'))
-    genome_dict = {k:''.join(v) for k,v in genome_dict.items()}
-    return genome_dict
+        futures = {executor.submit(run_blastn_genome, query_fasta, genome, db_dir, timeout): genome for genome in genome_lst}
+        for future in as_completed(futures):
+            genome = futures[future]
+            try:
+                genome_hit_dict[genome] = read_best_hits(future.result(), args_barcode_label, rank)
+            except (OSError, RuntimeError) as error:
+                print(f'Error: {genome}: {error}', file=sys.stderr, flush=True)
+                failed_lst.append(genome)
+    if failed_lst:
+        sys.exit(f'Error: blastn failed on {len(failed_lst)} genome(s)')
+    return genome_hit_dict
 
 def check_args_genome(args_genome):
     genome_lst = []
@@ -104,36 +193,29 @@ def check_args_genome(args_genome):
         genome_lst = [args_genome]
     return genome_lst
 
-def extract_barcode_seq(args_barcode_label, genome_lst, args_flank_length):
+def extract_barcode_seq(args_barcode_label, genome_lst, args_flank_length, genome_hit_dict):
 
-    barcode_dict = {}
-    for barcode in args_barcode_label:
-        barcode_dict[barcode] = {}
-        for genome in genome_lst:
-            genome_abbre = os.path.basename(genome)
-            if os.stat(f"temp_barcode_fisher/temp_blastn/{barcode}_{genome_abbre}.blastn").st_size == 0:
+    barcode_dict = {barcode: {} for barcode in args_barcode_label}
+    for genome in genome_lst:
+        genome_abbre = os.path.basename(genome)
+        barcode_region_lst = []
+        for barcode in args_barcode_label:
+            if barcode not in genome_hit_dict[genome]:
                 barcode_dict[barcode][genome_abbre] = 0
             else:
-                genome_dict = read_genome_2dict(genome)
-                with open(f"temp_barcode_fisher/temp_blastn/{barcode}_{genome_abbre}.blastn", 'rt') as infh:
-                    line_lst = infh.readlines()[0].split()
-
-                    contig_id = line_lst[1]
-                    sstart = int(line_lst[8])
-                    send = int(line_lst[9])
-
+                contig_id, sstart, send = genome_hit_dict[genome][barcode]
                 if sstart > send:
                     sstart, send = send, sstart
-                if (sstart - args_flank_length) <0:
-                    sstart = 0
-                else:
-                    sstart -= args_flank_length
-                if (send - args_flank_length) > len(genome_dict[contig_id]):
-                    send = len(genome_dict[contig_id])
-                else:
-                    send += args_flank_length
-
-                barcode_dict[barcode][genome_abbre] = genome_dict[contig_id][sstart-1:send]
+                barcode_region_lst.append((barcode, (contig_id, sstart - args_flank_length, send + args_flank_length)))
+        if not barcode_region_lst:
+            continue
+
+        # fetch the hit regions of the genome in one go, through genome.fai when it can be indexed
+        seq_lst = fetch_regions(genome, [region for _, region in barcode_region_lst])
+        for (barcode, (contig_id, _, _)), seq in zip(barcode_region_lst, seq_lst):
+            if seq is None:
+                sys.exit(f'Error: {contig_id} not found in {genome}')
+            barcode_dict[barcode][genome_abbre] = seq
     return barcode_dict
 
 def output(barcode_dict, args_prefix):
@@ -152,7 +234,7 @@ if __name__ == '__main__':
     check_input(args.sequence, args.barcode_label)
     run_cdhit(args.sequence, args.barcode_label, args.cpu)  # Pass the CPU parameter here
     genome_lst = check_args_genome(args.genome)
-    run_blastn(args.barcode_label, genome_lst, args.cpu)  # And here
-    barcode_dict = extract_barcode_seq(args.barcode_label, genome_lst, args.flank_length)
+    genome_hit_dict = run_blastn(args.barcode_label, genome_lst, args.cpu, args.db_dir, args.timeout, args.rank)  # And here
+    barcode_dict = extract_barcode_seq(args.barcode_label, genome_lst, args.flank_length, genome_hit_dict)
     output(barcode_dict, args.prefix)
     sys.exit(0)
@@ -14,6 +14,8 @@ import os
 import sys
 import argparse
 
+from pyfunction import read_fasta
+
 
 parser = argparse.ArgumentParser(
     description=__doc__,
@@ -56,49 +58,43 @@ def grep_sort_rmout(rm_out: str) -> list:
 def calculate_gc_content(genome, interspersed_repeat_lst):
     '''Check whether the genome caontains unknown or masked character 'N'
     '''
-    fa_dict = dict()
-    with open(genome) as fh:
-        for line in fh:
-            line = line.rstrip('\n')
-            if line.startswith('>'):
-                contig_id = line.lstrip('>').split()[0]
-                fa_dict[contig_id] = []
-            else:
-                line = line.upper()
-                fa_dict[contig_id].append(line)
-
-    fa_dict = {k: ''.join(seq_lst) for k, seq_lst in fa_dict.items()}
+    # repeats grouped by contig, so that one contig at a time is kept in memory
+    contig_repeat_dict = {}
+    for record_lst in interspersed_repeat_lst:
+        contig_id = record_lst[4]
+        start_pos = int(record_lst[5])
+        end_pos = int(record_lst[6])
+        contig_repeat_dict.setdefault(contig_id, []).append((start_pos, end_pos))
 
     A_base_count = []
     T_base_count = []
     G_base_count = []
     C_base_count = []
-    for _, seq in fa_dict.items():
+
+    # TE gc
+    repeat_A_base_count = []
+    repeat_T_base_count = []
+    repeat_G_base_count = []
+    repeat_C_base_count = []
+    for contig_id, seq in read_fasta(genome):
+        seq = seq.upper()
         A_base_count.append(seq.count('A'))
         T_base_count.append(seq.count('T'))
         G_base_count.append(seq.count('G'))
         C_base_count.append(seq.count('C'))
 
+        for start_pos, end_pos in contig_repeat_dict.get(contig_id, []):
+            seq_repeat = seq[start_pos-1:end_pos]
+            repeat_A_base_count.append(seq_repeat.count('A'))
+            repeat_T_base_count.append(seq_repeat.count('T'))
+            repeat_G_base_count.append(seq_repeat.count('G'))
+            repeat_C_base_count.append(seq_repeat.count('C'))
+
     total_A_base = sum(A_base_count)
     total_T_base = sum(T_base_count)
     total_G_base = sum(G_base_count)
     total_C_base = sum(C_base_count)
 
-    # TE gc
-    repeat_A_base_count = []
-    repeat_T_base_count = []
-    repeat_G_base_count = []
-    repeat_C_base_count = []
-    for record_lst in interspersed_repeat_lst:
-        contig_id = record_lst[4]
-        start_pos = int(record_lst[5])
-        end_pos = int(record_lst[6])
-        seq_repeat = fa_dict[contig_id][start_pos-1:end_pos]
-        repeat_A_base_count.append(seq_repeat.count('A'))
-        repeat_T_base_count.append(seq_repeat.count('T'))
-        repeat_G_base_count.append(seq_repeat.count('G'))
-        repeat_C_base_count.append(seq_repeat.count('C'))
-
     total_repeat__A_base = sum(repeat_A_base_count)
     total_repeat_T_base = sum(repeat_T_base_count)
     total_repeat_G_base = sum(repeat_G_base_count)
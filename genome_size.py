@@ -10,7 +10,8 @@ import os
 import sys
 import argparse
 import subprocess
-import multiprocessing
+
+from pyfunction import add_cache_arguments, iter_fasta_chunks, map_assemblies, open_cache
 
 parser = argparse.ArgumentParser(
     description=__doc__,
@@ -33,6 +34,8 @@ parser.add_argument('--cpu',
                     default=4,
                     help='No. cpu to query NCBI nucleotide database. Only useful with --species_list')
 
+add_cache_arguments(parser)
+
 args = parser.parse_args()
 
 
@@ -43,35 +46,31 @@ def count_genome_base(genome):
     T_base_count = []
     G_base_count = []
     C_base_count = []
-    with open(genome) as fh:
-        for line in fh:
-            line = line.rstrip('\n').upper()
-            if line.startswith('>'):
-                continue
-            else:
-                A_base_count.append(line.count('A'))
-                T_base_count.append(line.count('T'))
-                G_base_count.append(line.count('G'))
-                C_base_count.append(line.count('C'))
+    for _, chunk in iter_fasta_chunks(genome):
+        chunk = chunk.upper()
+        A_base_count.append(chunk.count(b'A'))
+        T_base_count.append(chunk.count(b'T'))
+        G_base_count.append(chunk.count(b'G'))
+        C_base_count.append(chunk.count(b'C'))
     total_base = sum(A_base_count) + sum(T_base_count) + \
         sum(G_base_count) + sum(C_base_count)
 
-    print(genome, total_base, sep='\t', file=sys.stdout, flush=True)
+    return total_base
 
 
 if __name__ == '__main__':
     if args.genome_path:
-        count_genome_base(args.genome_path)
-        sys.exit(0)
+        genome_path_lst = [args.genome_path]
 
     if args.genome_list:
         with open(args.genome_list) as listfh:
             genome_path_lst = [genome_path.strip().rstrip('\n')
                                for genome_path in listfh.readlines()]
 
-        # multiple cpu
-        pool = multiprocessing.Pool(args.cpu)
-        pool.map(count_genome_base, genome_path_lst)
-        pool.close()
-        pool.join()
+    # multiple cpu, unchanged genomes are answered from the cache
+    cache = open_cache(args)
+    for genome, total_base in map_assemblies(count_genome_base, genome_path_lst, args.cpu, cache):
+        print(genome, total_base, sep='\t', file=sys.stdout, flush=True)
+    if cache:
+        cache.close()
     sys.exit(0)
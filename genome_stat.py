@@ -8,81 +8,102 @@ bugs: yanpengch@qq.com
 usage:
     ls 00_genomes/*.fna | genome_stat.py -t 4 - > genome.statistics.tsv
     find 00_genomes -name "*.fna" -type f | genome_stat.py -t 4 - > genome.statistics.tsv
+    genome_stat.py -t 16 --chunksize 8 --as_completed --report genome_lst.txt > genome.statistics.tsv
+
+Genomes are parsed on a pool of processes by default, rows follow the input
+order unless --as_completed is given. --report writes the MB/s of every genome
+to stderr.
 """
 
+import os
 import csv
 import sys
+import time
 import argparse
 import fileinput
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from pyfunction import iter_fasta_chunks, nx_statistics
 
 def stat(genome_file):
-    with open(genome_file, 'r') as file:
-        sequences = []
-        current_seq = []
-        for line in file:
-            if line.startswith('>'):
-                if current_seq:
-                    sequences.append(''.join(current_seq))
-                    current_seq = []
-            else:
-                current_seq.append(line.strip())
-        if current_seq:
-            sequences.append(''.join(current_seq))
-
-    num_fragments = len(sequences)
-    gc_content = []
+    # one streaming pass: per-contig length and G+C are accumulated chunk by
+    # chunk, only the array of contig lengths is kept
+    lengths = array('Q')
+    gc_fraction_sum = 0.0
     n_count = 0
-    lengths = []
-
-    for sequence in sequences:
-        gc_content.append((sequence.count('G') + sequence.count('C')) / len(sequence))
-        n_count += sequence.count('N')
-        lengths.append(len(sequence))
+    contig_len = 0
+    contig_gc = 0
+    for header, chunk in iter_fasta_chunks(genome_file):
+        if header is not None:
+            if contig_len:
+                lengths.append(contig_len)
+                gc_fraction_sum += contig_gc / contig_len
+            contig_len = 0
+            contig_gc = 0
+        contig_len += len(chunk)
+        contig_gc += chunk.count(b'G') + chunk.count(b'C')
+        n_count += chunk.count(b'N')
+    if contig_len:
+        lengths.append(contig_len)
+        gc_fraction_sum += contig_gc / contig_len
 
     if not lengths:
         return (genome_file, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0)
 
-    lengths.sort(reverse=True)
-    total_length = sum(lengths)
-
-    def calc_N_L(x):
-        cum_len = 0
-        for i, length in enumerate(lengths):
-            cum_len += length
-            if cum_len >= total_length * (x / 100.0):
-                return length, i + 1
-
-    N50, L50 = calc_N_L(50)
-    N75, L75 = calc_N_L(75)
-    N90, L90 = calc_N_L(90)
+    num_fragments = len(lengths)
+    lengths = sorted(lengths, reverse=True)
+    nx_dict = nx_statistics(lengths, sum(lengths), (50, 75, 90))
 
     return (
         genome_file,
         num_fragments,
-        sum(gc_content) / num_fragments,
+        gc_fraction_sum / num_fragments,
         n_count,
-        max(lengths),
-        min(lengths),
-        N90, L90,
-        N50, L50,
-        N75, L75
+        lengths[0],
+        lengths[-1],
+        nx_dict['N90'], nx_dict['L90'],
+        nx_dict['N50'], nx_dict['L50'],
+        nx_dict['N75'], nx_dict['L75']
     )
 
-def process_genomes(genome_files, num_threads):
-    results = []
-    with ThreadPoolExecutor(max_workers=num_threads) as executor:
-        future_to_genome = {executor.submit(stat, genome): genome for genome in genome_files}
-        for future in as_completed(future_to_genome):
-            result = future.result()
-            results.append(result)
-            yield result
+def timed_stat(genome_file):
+    start = time.perf_counter()
+    result = stat(genome_file)
+    return result, os.path.getsize(genome_file), time.perf_counter() - start
+
+def stat_chunk(genome_lst):
+    return [timed_stat(genome) for genome in genome_lst]
+
+def process_genomes(genome_files, num_workers, executor='process', chunksize=1, ordered=True):
+    # genomes are submitted in chunks of chunksize per task, which amortises the
+    # inter-process round trip on lists of many small genomes
+    chunk_lst = [genome_files[i:i + chunksize] for i in range(0, len(genome_files), chunksize)]
+    if not chunk_lst:
+        return
+    if num_workers <= 1:
+        for chunk in chunk_lst:
+            yield from stat_chunk(chunk)
+        return
+    pool_class = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+    with pool_class(max_workers=min(num_workers, len(chunk_lst))) as pool:
+        if ordered:
+            for chunk_result in pool.map(stat_chunk, chunk_lst):
+                yield from chunk_result
+        else:
+            futures = [pool.submit(stat_chunk, chunk) for chunk in chunk_lst]
+            for future in as_completed(futures):
+                yield from future.result()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description=__doc__,
                                     formatter_class=argparse.RawDescriptionHelpFormatter)
     parser.add_argument("input", type=str, metavar="<genome_lst.tsv>", help="Path to the file containing genome paths or use '-' for standard input")
-    parser.add_argument("-t", "--threads", type=int, default=1, metavar="<1>", help="Number of threads to use. Default 1")
+    parser.add_argument("-t", "--threads", type=int, default=1, metavar="<1>", help="Number of workers to use. Default 1")
+    parser.add_argument("-e", "--executor", choices=["process", "thread"], default="process", help="Run the workers as processes or threads. Default process")
+    parser.add_argument("--chunksize", type=int, default=1, metavar="<1>", help="Genomes handed to a worker per task. Default 1")
+    parser.add_argument("--as_completed", action="store_true", help="Write rows as genomes finish instead of in input order")
+    parser.add_argument("--report", action="store_true", help="Write size, time and MB/s of every genome to stderr")
 
     args = parser.parse_args()
 
@@ -91,6 +112,7 @@ if __name__ == "__main__":
     else:
         with open(args.input, 'rt') as file:
             genome_files = [line.strip() for line in file]
+    genome_files = [genome for genome in genome_files if genome]
 
     tsvwriter = csv.writer(sys.stdout, delimiter='\t')
     tsvwriter.writerow([
@@ -99,6 +121,14 @@ if __name__ == "__main__":
         "N50", "L50", "N75", "L75"
     ])
 
-    for result in process_genomes(genome_files, args.threads):
+    start = time.perf_counter()
+    total_bytes = 0
+    for result, genome_bytes, seconds in process_genomes(genome_files, args.threads, args.executor, max(args.chunksize, 1), not args.as_completed):
         tsvwriter.writerow(result)
         sys.stdout.flush()
+        total_bytes += genome_bytes
+        if args.report:
+            print(f"{result[0]}\t{genome_bytes / 1e6:.1f} MB\t{seconds:.2f}s\t{genome_bytes / 1e6 / max(seconds, 1e-9):.1f} MB/s", file=sys.stderr, flush=True)
+    if args.report:
+        elapsed = time.perf_counter() - start
+        print(f"Total\t{total_bytes / 1e6:.1f} MB\t{elapsed:.2f}s\t{total_bytes / 1e6 / max(elapsed, 1e-9):.1f} MB/s", file=sys.stderr, flush=True)
@@ -8,33 +8,25 @@ Date  : 2023-06-27
 
 import os
 import sys
+import json
+import mmap
+import hashlib
 import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-# convert iqtree models to mrbayes definitions
-model_map = {'GTR':'nst=6',
-             'GTR+I':'nst=6 rates=propinv',
-             'GTR+G':'nst=6 rates=gamma',
-             'GTR+I+G':'nst=6 rates=invgamma',
-             'SYM':['nst=6', 'statefreqpr=fixed(equal)'],
-             'SYM+I':['nst=6 rates=propinv', 'statefreqpr=fixed(equal)'],
-             'SYM+G':['nst=6 rates=gamma','statefreqpr=fixed(equal)'],
-             'SYM+I+G':['nst=6 rates=invgamma','statefreqpr=fixed(equal)'],
-             'HKY':'nst=2',
-             'HKY+I':'nst=2 rates=propinv',
-             'HKY+G':'nst=2 rates=gamma',
-             'HKY+I+G':'nst=2 rates=invgamma',
-             'K2P':['nst=2', 'statefreqpr=fixed(equal)'],
-             'K2P+I':['nst=2 rates=propinv', 'statefreqpr=fixed(equal)'],
-             'K2P+G':['nst=2 rates=gamma','statefreqpr=fixed(equal)'],
-             'K2P+I+G':['nst=2 rates=invgamma','statefreqpr=fixed(equal)'],
-             'F81':'nst=1',
-             'F81+I':'nst=1 rates=propinv',
-             'F81+G':'nst=1 rates=gamma',
-             'F81+I+G':'nst=1 rates=invgamma',
-             'JC':['nst=1', 'statefreqpr=fixed(equal)'],
-             'JC+I':['nst=1 rates=propinv', 'statefreqpr=fixed(equal)'],
-             'JC+G':['nst=1 rates=gamma','statefreqpr=fixed(equal)'],
-             'JC+I+G':['nst=1 rates=invgamma','statefreqpr=fixed(equal)']}
+from pyfunction import PartitionScheme, scan_alignments, write_phylip, write_supermatrix
+
+# checkpoint of finished partitions, kept in the output directory
+MANIFEST = 'modelfinder_manifest.json'
+
+# partition lengths and models, kept in the output directory
+PARTITION_TABLE = 'partition_lengths.tsv'
+
+# extra partition files written next to best_scheme.txt
+PARTITION_FILES = {'raxml': 'best_scheme.raxml.txt',
+                   'partitionfinder': 'partition_finder.cfg'}
 
 parser = argparse.ArgumentParser(
                     prog='iqtree_modelfinder.py',
@@ -44,7 +36,6 @@ parser.add_argument('-i', '--input',
                     metavar='alignment.fna',
                     type=str,
                     nargs='+',
-                    required=True,
                     help='multiple sequence alignment files that must be in FASTA format')
 
 parser.add_argument('-o', '--outdir',
@@ -61,73 +52,98 @@ parser.add_argument('--outgroup',
                     metavar='Outgroup',
                     help='specify the outgroup')
 
+parser.add_argument('--partition_formats',
+                    metavar='raxml|partitionfinder',
+                    choices=list(PARTITION_FILES),
+                    nargs='+',
+                    default=[],
+                    help=f'also write the best scheme as {", ".join(f"{fmt} ({filename})" for fmt, filename in PARTITION_FILES.items())}; partitionfinder reads the alignment from concatenated.phy, written next to it')
+
 parser.add_argument('-m', '--model_restriction',
                     metavar='mrbayes|iqtree',
                     choices=['mrbayes', 'iqtree'],
                     default='mrbayes',
                     help='restrict search to models supported by other programs: mrbayes|iqtree')
 
+parser.add_argument('-T', '--threads',
+                    metavar='<int>',
+                    type=int,
+                    default=os.cpu_count(),
+                    help='total number of cores shared by concurrent modelfinder jobs. default: all cores')
+
+parser.add_argument('--max_job_threads',
+                    metavar='<int>',
+                    type=int,
+                    default=4,
+                    help='maximum number of threads given to a single modelfinder job. default: 4')
+
+parser.add_argument('--cells_per_thread',
+                    metavar='<int>',
+                    type=int,
+                    default=100000,
+                    help='alignment cells (taxa x sites) handled per thread, larger alignments get more threads. default: 100000')
+
+parser.add_argument('--from_manifest',
+                    action='store_true',
+                    help=f'regenerate best_scheme.txt (and run_mrbayes.nexus from the existing concatenated.fna) from outdir/{MANIFEST} without running modelfinder or reading the alignments')
+
 args = parser.parse_args()
+if not args.input and not args.from_manifest:
+    parser.error('the following arguments are required: -i/--input')
 
-def concatenate_msa(msafile_tuple, args_outdir):
-    '''input multiple MSA files, return a concatenated a python3 dictionary
+def concatenate_msa(msafile_tuple, args_outdir, scan=None):
+    '''input multiple MSA files, write the concatenated msa row by row and return its filename
+
+    missing taxa of an msa are filled with '?', scan is the result of scan_alignments if already done
+    '''
+    concatenated_file = args_outdir + '/concatenated.fna'
+    try:
+        write_supermatrix(list(msafile_tuple), concatenated_file, pad='?', scan=scan)
+    except ValueError as err:
+        sys.exit(f'Error: {err}')
+    return concatenated_file
+
+def existing_concatenation(msa_lst, args_outdir):
+    '''return outdir/concatenated.fna, rebuilt from the alignments only when it is missing
     '''
-    #1 get taxa list, and store sequence into dictionary
-    all_msa_dict = {}
-    taxa_lst = []
-    for msa in msafile_tuple:
-        all_msa_dict[msa] = {}
-        with open(msa, 'rt') as fafh:
-            for line in fafh:
-                line = line.rstrip('\n')
-                if line.startswith('>'):
-                    taxa_id = line.lstrip('>')
-                    taxa_lst.append(taxa_id)
-                    all_msa_dict[msa][taxa_id] = []
-                else:
-                    all_msa_dict[msa][taxa_id].append(line)
-    taxa_lst = list(set(taxa_lst))
-
-    # multiple line fasta to single-line fasta
-    for msa, fa_dict in all_msa_dict.items():
-        all_msa_dict[msa] = {k: ''.join(v) for k, v in fa_dict.items()}
-
-    #2 get the length of each msa files
-    msa_length_dict = {}
-    for msa, fa_dict in all_msa_dict.items():
-        for taxa_id, seq in fa_dict.items():
-            fa_length = len(seq)
-            msa_length_dict[msa] = fa_length
-            break
-
-    #3 add missing data into msa
-    for msa, fadict in all_msa_dict.items():
-        msa_length = msa_length_dict[msa]
-        for taxa_id in taxa_lst:
-            if taxa_id not in fadict:
-                all_msa_dict[msa][taxa_id] = '?' * msa_length
-
-    #4 concatenate all MSA files
-    concatenated_dict = {}
-    for taxa_id in taxa_lst:
-        concatenated_dict[taxa_id] = []
-        for msa, fa_dict in all_msa_dict.items():
-            seq = fa_dict[taxa_id]
-            concatenated_dict[taxa_id].append(seq)
-
-    #5 output concatenated FASTA file
-    with open(args_outdir + '/concatenated.fna', 'wt') as outfh:
-        for taxa_id, seq in concatenated_dict.items():
-            outfh.write(f'>{taxa_id}\n{"".join(seq)}\n')
-    return concatenated_dict
-
-def mrbayes_template(partition_model_dict, partition_len_dict, concatenated_dict, args_outdir, args_outgroup='outgroup_label'):
+    concatenated_file = args_outdir + '/concatenated.fna'
+    if os.path.exists(concatenated_file):
+        return concatenated_file
+    missing_lst = [alignment for alignment in msa_lst if not os.path.exists(alignment)]
+    if missing_lst:
+        sys.exit(f'Error: {concatenated_file} is missing and cannot be rebuilt, alignments not found: {", ".join(missing_lst)}')
+    return concatenate_msa(msa_lst, args_outdir)
+
+def supermatrix_rows(concatenated_file, nchar):
+    '''return (taxa label, offset of its row) of a concatenated msa written by write_supermatrix
+
+    Every row is a single line of nchar sites, so only the header lines are read
+    and the rows are skipped over. Labels are the full header lines.
+    '''
+    row_lst = []
+    with open(concatenated_file, 'rb') as infh:
+        while True:
+            header = infh.readline()
+            if not header:
+                break
+            offset = infh.tell()
+            infh.seek(nchar, os.SEEK_CUR)
+            if not header.startswith(b'>') or infh.read(1) != b'\n':
+                sys.exit(f'Error: {concatenated_file} is not a single-line concatenation of {nchar} sites')
+            row_lst.append((header[1:].rstrip(b'\r\n').decode(), offset))
+    return row_lst
+
+def mrbayes_template(scheme, concatenated_file, args_outdir, args_outgroup='outgroup_label'):
     '''convert modelfinder models to mrbayes style
+
+    the interleaved matrix is sliced out of the rows of the concatenated msa through a memory map
     '''
     mrbayes_file = f'{args_outdir}/run_mrbayes.nexus'
-    ntaxa = len(concatenated_dict)
-    nchar = sum(list(partition_len_dict.values()))
-    concatenated_dict = {k: ''.join(seq_lst) for k, seq_lst in concatenated_dict.items()}
+    nchar = scheme.nchar
+    row_lst = supermatrix_rows(concatenated_file, nchar)
+    ntaxa = len(row_lst)
+    concatenated_fh = open(concatenated_file, 'rb')
+    concatenated_mm = mmap.mmap(concatenated_fh.fileno(), 0, access=mmap.ACCESS_READ)
 
     with open(mrbayes_file, 'wt') as ofh:
         ofh.write('#NEXUS\n')
@@ -135,21 +151,23 @@ def mrbayes_template(partition_model_dict, partition_len_dict, concatenated_dict
         ofh.write(f'  FORMAT DATATYPE=DNA MISSING=? GAP=- INTERLEAVE;\n')
         
         ofh.write(f'  MATRIX\n')
-        longest_taxa_label_length = max([len(taxa_label) for taxa_label in concatenated_dict.keys()])
+        longest_taxa_label_length = max([len(taxa_label) for taxa_label, _ in row_lst])
 
         start = 0
         end = 80
         while end < nchar:
-            for taxa_label, sequence in concatenated_dict.items():
-                seq_part = sequence[start:end]
+            for taxa_label, offset in row_lst:
+                seq_part = concatenated_mm[offset + start:offset + end].decode()
                 ofh.write(f'  {taxa_label:{longest_taxa_label_length}} {seq_part}\n')
             start = end
             end += 80
             ofh.write('\n')
 
-        for taxa_label, sequence in concatenated_dict.items():
-            seq_part = sequence[start:nchar]
+        for taxa_label, offset in row_lst:
+            seq_part = concatenated_mm[offset + start:offset + nchar].decode()
             ofh.write(f'  {taxa_label:<{longest_taxa_label_length}} {seq_part}\n')
+        concatenated_mm.close()
+        concatenated_fh.close()
 
         ofh.write(';\n')
         ofh.write('END;\n')
@@ -162,33 +180,10 @@ def mrbayes_template(partition_model_dict, partition_len_dict, concatenated_dict
         ofh.write(f'  outgroup {args_outgroup};\n')
         ofh.write('\n')
 
-        start = 1
-        end = 0
-        num_subset = 0
-        for _, partition_length in partition_len_dict.items():
-            end += partition_length
-            num_subset += 1
-            ofh.write(f'  charset Subset{num_subset} = {start}-{end};\n')
-            start += partition_length
-
-        partition_string = ', '.join(['Subset' + str(i) for i in range(1, num_subset+1)])
-        ofh.write(f'  partition ModelFinder = {num_subset}:{partition_string};\n')
-        ofh.write('  set partition=ModelFinder;\n')
-        ofh.write('\n')
-
-        num_subset = 0
-        for model in partition_model_dict.values():
-            num_subset += 1
-            model = model.rstrip('4').replace('+F', '')
-            try:
-                if len(model_map[model]) == 2:
-                    ofh.write(f'  lset applyto=({num_subset}) {model_map[model][0]};\n')
-                    ofh.write(f'  prset applyto=({num_subset}) {model_map[model][1]};\n')
-                else:
-                    ofh.write(f'  lset applyto=({num_subset}) {model_map[model]};\n')
-            except:
-                sys.exit(f'Error: unknown model {model}')
-
+        try:
+            ofh.write(scheme.mrbayes(name='ModelFinder'))
+        except ValueError as err:
+            sys.exit(f'Error: {err}')
         ofh.write('\n')
         ofh.write('  prset applyto=(all) ratepr=variable;\n')
         ofh.write('  unlink statefreq=(all) revmat=(all) shape=(all) pinvar=(all) tratio=(all);\n')
@@ -200,80 +195,233 @@ def mrbayes_template(partition_model_dict, partition_len_dict, concatenated_dict
         ofh.write('  log stop;\n')
         ofh.write('END;\n')
 
-def get_partition(args_input_tuple):
-    '''get the intervals of input alignments
+def alignment_shape(alignment):
+    '''return the number of sequences and sites of a FASTA alignment
     '''
-    partition_len_dict = {}
-    for alignment in args_input_tuple:
-        partition_label = os.path.basename(alignment).split('.')[0]
-        num_seq = 0
-        len_alignment = 0
-        with open(alignment, 'rt') as infh:
-            for line in infh:
-                line = line.rstrip('\n')
-                if line.startswith('>'):
-                    num_seq += 1
-                    continue
-                else:
-                    if num_seq == 1:
-                        len_alignment += len(line)
-                    else:
-                        break
-        partition_len_dict[partition_label] = len_alignment
-    return partition_len_dict
-
-def run_moelfinder(args_input_tuple, args_model_restriction, args_outdir):
+    num_seq = 0
+    len_alignment = 0
+    with open(alignment, 'rt') as infh:
+        for line in infh:
+            if line.startswith('>'):
+                num_seq += 1
+            elif num_seq == 1:
+                len_alignment += len(line.rstrip('\n'))
+    return num_seq, len_alignment
+
+def read_bic_model(logfile):
+    '''return the BIC model recorded in a modelfinder log, None if the log is missing or unfinished
+    '''
+    if not os.path.exists(logfile):
+        return None
+    with open(logfile, 'rt') as infh:
+        for line in infh:
+            if line.startswith('Bayesian Information Criterion:'):
+                return line.rstrip('\n').split()[-1]
+    return None
+
+def file_sha256(infile):
+    '''return the sha256 hex digest of a file
+    '''
+    sha256 = hashlib.sha256()
+    with open(infile, 'rb') as infh:
+        for block in iter(lambda: infh.read(1024 * 1024), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+def load_manifest(args_outdir):
+    '''return the inputs and partitions recorded in outdir/MANIFEST, ([], {}) if there is none
+
+    The inputs are the alignment paths of the run in input order, each partition
+    label maps to {'alignment', 'sha256', 'length', 'model_restriction', 'model'},
+    the model being None while modelfinder has not finished it.
+    '''
+    manifest_file = f'{args_outdir}/{MANIFEST}'
+    if not os.path.exists(manifest_file):
+        return [], {}
+    with open(manifest_file, 'rt') as infh:
+        manifest = json.load(infh)
+    partition_dict = manifest['partitions']
+    input_lst = manifest.get('inputs') or [entry['alignment'] for entry in partition_dict.values()]
+    return input_lst, partition_dict
+
+def save_manifest(manifest_dict, args_outdir):
+    '''write the partitions to outdir/MANIFEST in input order, replacing the old file atomically
+    '''
+    manifest_file = f'{args_outdir}/{MANIFEST}'
+    input_lst = [entry['alignment'] for entry in manifest_dict.values()]
+    with open(manifest_file + '.tmp', 'wt') as outfh:
+        json.dump({'inputs': input_lst, 'partitions': manifest_dict}, outfh, indent=1)
+    os.replace(manifest_file + '.tmp', manifest_file)
+
+def partition_label(alignment):
+    return os.path.basename(alignment).split('.')[0]
+
+def job_threads(num_cells, cells_per_thread, max_job_threads):
+    '''number of threads for an alignment of num_cells cells, between 1 and max_job_threads
+    '''
+    return max(1, min(max_job_threads, -(-num_cells // cells_per_thread)))
+
+class CoreBudget:
+    '''a pool of cores shared by concurrent jobs, a job blocks until enough cores are free
+    '''
+    def __init__(self, num_cores):
+        self.free = num_cores
+        self.condition = threading.Condition()
+
+    def acquire(self, num):
+        with self.condition:
+            self.condition.wait_for(lambda: self.free >= num)
+            self.free -= num
+
+    def release(self, num):
+        with self.condition:
+            self.free += num
+            self.condition.notify_all()
+
+def modelfinder_job(alignment, prefix, num_threads, args_model_restriction, budget, redo=False):
+    '''run one modelfinder job once num_threads cores are free, return the BIC model or None
+    '''
+    iqtree_command = ['iqtree2', '-s', alignment, '-T', str(num_threads), '--prefix', prefix, '-m', 'TESTONLY']
+    if args_model_restriction == 'mrbayes':
+        iqtree_command += ['--mset', 'mrbayes', '--msub', 'nuclear']
+    else:
+        iqtree_command += ['--msub', 'nuclear']
+    if redo or args_model_restriction != 'mrbayes':
+        iqtree_command.append('--redo')
+
+    budget.acquire(num_threads)
+    try:
+        process = subprocess.run(iqtree_command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    except OSError as error:
+        print(f'Error: failed run iqtree2 on {alignment}: {error}', file=sys.stderr, flush=True)
+        return None
+    finally:
+        budget.release(num_threads)
+    if process.returncode != 0:
+        print(f'Error: iqtree2 exited with {process.returncode} on {alignment}\n{process.stderr}', file=sys.stderr, flush=True)
+    return read_bic_model(f'{prefix}.log')
+
+def run_moelfinder(args_input_tuple, args_model_restriction, args_outdir, args_threads=4, args_max_job_threads=4, args_cells_per_thread=100000, scan=None):
     '''to find the best evolution model for each input
+
+    Partitions recorded in the manifest with the same alignment hash and model
+    restriction are not rerun, nor are partitions unknown to the manifest or
+    unfinished in it whose modelfinder log already holds a BIC model. The others are run concurrently,
+    largest first, sharing args_threads cores; each job gets threads in proportion
+    to its number of cells, at most args_max_job_threads. The manifest is saved as
+    every job finishes, so an interrupted run resumes where it stopped. The manifest
+    always lists every partition of the run in input order, unfinished ones without
+    a model. The shapes of the alignments are taken from scan, the result of
+    scan_alignments, if given.
     '''
-    partition_model_dict = {}
+    _, manifest_dict = load_manifest(args_outdir)
+    partition_dict = {}
+    job_lst = []
+    num_reused = 0
     for alignment in args_input_tuple:
-        partition_label = os.path.basename(alignment).split('.')[0]
-        if args_model_restriction == 'mrbayes':
-            iqtree_command = f'iqtree2 -s {alignment} -T 4 --prefix {args_outdir}/{partition_label}_modelfinder -m TESTONLY --mset mrbayes --msub nuclear'
+        label = partition_label(alignment)
+        prefix = f'{args_outdir}/{label}_modelfinder'
+        if scan is None:
+            num_seq, len_alignment = alignment_shape(alignment)
         else:
-            iqtree_command = f'iqtree2 -s {alignment} -T 4 --prefix {args_outdir}/{partition_label}_modelfinder -m TESTONLY --msub nuclear --redo'
-        try:
-            os.system(iqtree_command)
-        except:
-            print(f'failed run iqtree', file=sys.stderri, flush=True)
-        with open(f'{args_outdir}/{partition_label}_modelfinder.log', 'rt') as infh:
-            for line in infh:
-                if line.startswith('Bayesian Information Criterion:'):
-                    model = line.rstrip('\n').split()[-1]
-                    break
-        partition_model_dict[partition_label] = model
-    return partition_model_dict
-
-def get_best_scheme(partition_len_dict, partition_model_dict, args_outdir):
+            num_seq, len_alignment = len(scan[2][alignment]), scan[1][alignment]
+        partition_dict[label] = {'alignment': os.path.abspath(alignment),
+                                 'sha256': file_sha256(alignment),
+                                 'length': len_alignment,
+                                 'model_restriction': args_model_restriction,
+                                 'model': None}
+        # partitions unknown to the manifest or still unfinished in it may have a finished log
+        recorded = manifest_dict.get(label, {})
+        changed = bool(recorded) and any(recorded.get(key) != partition_dict[label][key] for key in ('sha256', 'model_restriction'))
+        model = None if changed else recorded.get('model') or read_bic_model(f'{prefix}.log')
+        if model:
+            partition_dict[label]['model'] = model
+            num_reused += 1
+            continue
+        num_threads = job_threads(num_seq * len_alignment, args_cells_per_thread, args_max_job_threads)
+        job_lst.append((num_seq * len_alignment, label, alignment, prefix, min(num_threads, args_threads), changed))
+    if num_reused:
+        print(f'Reuse {num_reused} finished modelfinder results in {args_outdir}', file=sys.stdout, flush=True)
+    save_manifest(partition_dict, args_outdir)
+
+    job_lst.sort(key=lambda job: job[0], reverse=True)
+    budget = CoreBudget(args_threads)
+    failed_lst = []
+    with ThreadPoolExecutor(max_workers=max(1, args_threads)) as executor:
+        futures = {executor.submit(modelfinder_job, alignment, prefix, num_threads, args_model_restriction, budget, changed): label
+                   for _, label, alignment, prefix, num_threads, changed in job_lst}
+        for num_done, future in enumerate(as_completed(futures), start=1):
+            label = futures[future]
+            model = future.result()
+            if model:
+                partition_dict[label]['model'] = model
+                save_manifest(partition_dict, args_outdir)
+            else:
+                failed_lst.append(label)
+            print(f'[{num_done}/{len(futures)}] {label}: {model}', file=sys.stdout, flush=True)
+    if failed_lst:
+        sys.exit(f'Error: no BIC model found for {", ".join(failed_lst)}')
+
+    return {label: entry['model'] for label, entry in partition_dict.items()}
+
+def write_concatenated_phylip(concatenated_file, args_outdir):
+    '''write outdir/concatenated.phy, the alignment read by partition_finder.cfg
+    '''
+    phylip_file = f'{args_outdir}/concatenated.phy'
+    write_phylip(concatenated_file, phylip_file)
+    print(f'PartitionFinder alignment:{phylip_file}', file=sys.stdout, flush=True)
+    return phylip_file
+
+def get_best_scheme(scheme, args_outdir, args_formats=()):
     '''
-    output best partition scheme
+    output best partition scheme, in IQ-TREE NEXUS and the other requested formats,
+    and keep the partition table next to it
     '''
-    outfile_name = f'{args_outdir}/best_scheme.txt'
-    outfh = open(outfile_name, 'wt')
-    outfh.write('#nexus\n')
-    outfh.write('begin sets;\n')
-
-    end = 0
-    for partition_label in partition_len_dict:
-        start = end + 1
-        end = end + partition_len_dict[partition_label]
-        outfh.write(f'charset {partition_label} = {start}-{end};\n')
-
-    charpartition = ''
-    for partition_label in partition_model_dict:
-        model = partition_model_dict[partition_label]
-        charpartition += f'{model}:{partition_label}, '
-    charpartition = 'charpartition ModelFinder = ' + charpartition.rstrip(', ') + ';'
-    outfh.write(f'{charpartition}\n')
-    outfh.write('end;\n')
-    outfh.close()
-    return print(f'Best scheme:{outfile_name}', file=sys.stdout, flush=True)
+    outfile_name = scheme.write(f'{args_outdir}/best_scheme.txt', 'nexus', name='ModelFinder')
+    print(f'Best scheme:{outfile_name}', file=sys.stdout, flush=True)
+    for fmt in args_formats:
+        outfile_name = scheme.write(f'{args_outdir}/{PARTITION_FILES[fmt]}', fmt)
+        print(f'Best scheme ({fmt}):{outfile_name}', file=sys.stdout, flush=True)
+    scheme.save(f'{args_outdir}/{PARTITION_TABLE}')
 
 if __name__ == '__main__':
-    partition_len_dict = get_partition(args.input)
-    partition_model_dict= run_moelfinder(args.input, args.model_restriction, args.outdir)
-    get_best_scheme(partition_len_dict, partition_model_dict, args.outdir)
-    concatenated_dict = concatenate_msa(args.input, args.outdir)
+    if args.from_manifest:
+        msa_lst, manifest_dict = load_manifest(args.outdir)
+        if not manifest_dict:
+            sys.exit(f'Error: no {MANIFEST} found in {args.outdir}')
+        label_lst = [partition_label(alignment) for alignment in msa_lst]
+        unfinished_lst = [label for label in label_lst if not manifest_dict.get(label, {}).get('model')]
+        if unfinished_lst:
+            sys.exit(f'Error: {len(unfinished_lst)} of {len(label_lst)} partitions have no model yet ({", ".join(unfinished_lst)}), '
+                     f'rerun with -i to resume modelfinder')
+        scheme = PartitionScheme((label, manifest_dict[label]['length'], manifest_dict[label]['model']) for label in label_lst)
+        # the alignments are only read if concatenated.fna is missing
+        get_best_scheme(scheme, args.outdir, args.partition_formats)
+        if args.mrbayes_nexus or 'partitionfinder' in args.partition_formats:
+            concatenated_file = existing_concatenation(msa_lst, args.outdir)
+        if 'partitionfinder' in args.partition_formats:
+            write_concatenated_phylip(concatenated_file, args.outdir)
+        if args.mrbayes_nexus:
+            mrbayes_template(scheme, concatenated_file, args.outdir, args.outgroup)
+        sys.exit(0)
+
+    os.makedirs(args.outdir, exist_ok=True)
+    # lengths and taxa of every alignment are read once and shared by the scheduler,
+    # the partition files and the concatenation
+    msa_lst = args.input
+    try:
+        scan = scan_alignments(msa_lst, threads=min(args.threads, 8))
+    except ValueError as err:
+        sys.exit(f'Error: {err}')
+    partition_model_dict = run_moelfinder(msa_lst, args.model_restriction, args.outdir, args.threads, args.max_job_threads, args.cells_per_thread, scan)
+    scheme = PartitionScheme()
+    for alignment in msa_lst:
+        label = partition_label(alignment)
+        scheme.add(label, scan[1][alignment], partition_model_dict[label])
+    get_best_scheme(scheme, args.outdir, args.partition_formats)
+    concatenated_file = concatenate_msa(msa_lst, args.outdir, scan)
+    if 'partitionfinder' in args.partition_formats:
+        write_concatenated_phylip(concatenated_file, args.outdir)
     if args.mrbayes_nexus:
-        mrbayes_template(partition_model_dict, partition_len_dict, concatenated_dict, args.outdir, args.outgroup)
-    sys.exit(0)
\ No newline at end of file
+        mrbayes_template(scheme, concatenated_file, args.outdir, args.outgroup)
+    sys.exit(0)
@@ -12,6 +12,8 @@ import os
 import sys
 import argparse
 
+from pyfunction import PartitionScheme, scan_alignments, write_phylip, write_supermatrix
+
 parser = argparse.ArgumentParser(
     description=__doc__,
     formatter_class=argparse.RawDescriptionHelpFormatter)
@@ -33,6 +35,19 @@ parser.add_argument('--partition_scheme',
                     default='partition_scheme.txt',
                     help='partition scheme')
 
+parser.add_argument('--partition_formats',
+                    choices=PartitionScheme.FORMATS,
+                    nargs='+',
+                    default=[],
+                    metavar='nexus|raxml|mrbayes|partitionfinder',
+                    help='also write the partition scheme in these formats as PARTITION_SCHEME.*; the partition lengths are kept in PARTITION_SCHEME.lengths.tsv; partitionfinder reads the --output alignment as PHYLIP, written next to the cfg')
+
+parser.add_argument('--threads',
+                    type=int,
+                    default=4,
+                    metavar='4',
+                    help='alignment files read concurrently. Default: 4')
+
 args = parser.parse_args()
 
 def parse_modelmap_2dict(arg_alignment2model_file):
@@ -61,74 +76,46 @@ def parse_modelmap_2dict(arg_alignment2model_file):
         model2alignment_dict[model].sort()
     return model2alignment_dict, alignmentfile_lst
 
-def parse_all_alignment_2_dict(alignmentfile_lst):
-    '''Parse alignment file into python3 dictonary
-
-    alignment_file: multiple FASTA format file
+def busco_taxon(header):
+    '''taxon label of a BUSCO alignment header: >BUSCOID__taxon
     '''
-    # get the length of the longest file name to format log
-    max_length_of_str = max([len(alignmentfile) for alignmentfile in alignmentfile_lst])
-    all_alignment_dict = {}
-    number_total_msa_file = len(alignmentfile_lst)
-    count = 0
-    for alignmentfile in alignmentfile_lst:
-        count += 1
-
-        alignment_dict = {}
-        with open(alignmentfile) as fh:
-            for line in fh:
-                line = line.rstrip('\n')
-
-                if line.startswith('>'):
-                    seq_id = line.lstrip('>').split('__')[1]
-                    alignment_dict[seq_id] = []
-                else:
-                    alignment_dict[seq_id].append(line)
-        alignment_dict = {k:''.join(v) for k,v in alignment_dict.items()}
-
-        msa_length = 0
-        for k,v in alignment_dict.items():
-            msa_length = len(v)
-            break
-        print(f'Parsing {alignmentfile:{max_length_of_str}} length:{msa_length:0>5} into dictionary........[{count:04}/{number_total_msa_file}]', file = sys.stdout, flush = True)
-
-        if alignmentfile not in all_alignment_dict:
-            all_alignment_dict[alignmentfile] = {}
-            all_alignment_dict[alignmentfile]['alignment'] = alignment_dict
-            all_alignment_dict[alignmentfile]['length'] = msa_length
-
-    return all_alignment_dict
-
-def check_missing_and_add_placeholders(all_alignment_dict):
-    '''Check whether some taxa are absent in certain alignment file
+    return header.split('__')[1]
+
+def parse_all_alignment_2_dict(alignmentfile_lst, threads=4):
+    '''First pass over the alignment files: taxa and length of each, sequences are not kept
+
+    alignment_file: multiple FASTA format file, read by a pool of threads
     '''
-    # check how many taxa the aligment files includes
-    all_taxa_id_lst = []
-    for msafile in all_alignment_dict:
-        all_taxa_id_lst.extend(list(all_alignment_dict[msafile]['alignment'].keys()))
+    try:
+        return scan_alignments(alignmentfile_lst, busco_taxon, threads, log=sys.stdout)
+    except ValueError as err:
+        sys.exit(f'Error: {err}')
 
-    all_taxa_id_set = set(all_taxa_id_lst)
-    number_total_taxa = len(all_taxa_id_set)
-    print('Number of taxa: {number_total_taxa}', file = sys.stdout, flush=True)
+def check_missing_taxa(scan):
+    '''Check whether some taxa are absent in certain alignment file, they will be filled with '?'
+    '''
+    all_taxa_id_lst, msa_length_dict, msa_taxa_dict = scan
+    number_total_taxa = len(all_taxa_id_lst)
+    print(f'Number of taxa: {number_total_taxa}', file = sys.stdout, flush=True)
 
     # checking missing taxa in msa file
-    for msafile in all_alignment_dict:
-        taxa_id_set = set(all_alignment_dict[msafile]['alignment'].keys())
-
-        if taxa_id_set != all_taxa_id_set:
+    for msafile, taxa_id_set in msa_taxa_dict.items():
+        if len(taxa_id_set) != number_total_taxa:
 
             print(f'{msafile} ： some taxa are missing', file=sys.stdout, flush=True)
 
-            missing_taxa_lst = list(all_taxa_id_set - taxa_id_set)
-            aln_length = all_alignment_dict[msafile]['length']
+            aln_length = msa_length_dict[msafile]
+            for taxa in all_taxa_id_lst:
+                if taxa not in taxa_id_set:
+                    print(f"    {taxa}\t{aln_length}", file = sys.stdout, flush = True)
 
-            for taxa in missing_taxa_lst:
-                all_alignment_dict[msafile]['alignment'][taxa] = '?' * aln_length
-                print(f"    {taxa}\t{aln_length}", file = sys.stdout, flush = True)
-
-    return all_alignment_dict, all_taxa_id_set
+def partitionfinder_phylip(arg_partition_scheme_filename, arg_output_filename):
+    '''PHYLIP copy of the concatenated alignment, next to the partition_finder.cfg that reads it
+    '''
+    phylip_basename = os.path.splitext(os.path.basename(arg_output_filename))[0] + '.phy'
+    return os.path.join(os.path.dirname(arg_partition_scheme_filename), phylip_basename)
 
-def get_partition_scheme(model2alignment_dict, all_alignment_dict, arg_partition_scheme_filename):
+def get_partition_scheme(model2alignment_dict, msa_length_dict, arg_partition_scheme_filename, arg_formats=(), arg_phylip_filename='concatenated.phy'):
     '''Output patition file for iqtree
 
     Input:
@@ -140,63 +127,48 @@ def get_partition_scheme(model2alignment_dict, all_alignment_dict, arg_partition
         modle, part2 = 101-384
         ...
     '''
-    start = 1
-    end = 0
-
-    model_part_dict = {}
     model2alignment_dict = dict(sorted(model2alignment_dict.items(), key = lambda items: (len(items[1]), items[0]), reverse = True))
     print(model2alignment_dict)
+    scheme = PartitionScheme()
     for model, msafile_lst in model2alignment_dict.items():
-        model_part_dict[model] = []
-
         for msafile in msafile_lst:
-            msa_length = all_alignment_dict[msafile]['length']
-            start = end + 1
-            end = end + msa_length
-            model_part_dict[model].append(f'{start}-{end}')
-    with open(arg_partition_scheme_filename, 'wt') as ofh:
-        count_part = 0
-        number_partitions = len(model_part_dict)
-        for model, start_end_lst in model_part_dict.items():
-            count_part += 1
-            print(f'{model}, part_{count_part} = {", ".join(start_end_lst)}', file = ofh, flush=True)
+            scheme.add(os.path.basename(msafile).split('.')[0], msa_length_dict[msafile], model)
+    scheme.write(arg_partition_scheme_filename, 'raxml', group_by_model=True)
+    scheme.save(arg_partition_scheme_filename + '.lengths.tsv')
+    try:
+        filename_lst = scheme.write_formats(arg_partition_scheme_filename, arg_formats,
+                                            {'partitionfinder': {'alignment': os.path.basename(arg_phylip_filename)}})
+    except ValueError as err:
+        sys.exit(f'Error: {err}')
+    for filename in filename_lst:
+        print(f'## Partition file: {os.path.abspath(filename)}', file=sys.stdout, flush=True)
 
     schemefile_abspath = os.path.abspath(arg_partition_scheme_filename)
     print(f'## Partition file: {schemefile_abspath}', file=sys.stdout, flush=True)
     return model2alignment_dict
 
-def join_marker(model2alignment_dict, all_alignment_dict, all_taxa_id_set, arg_output_filename):
-    '''
+def join_marker(model2alignment_dict, scan, arg_output_filename, threads=4):
+    '''write the concatenated alignment row by row, alignments ordered as in the partition scheme
     '''
     msa_list_ordered = []
     for model, msa_lst in model2alignment_dict.items():
         msa_list_ordered.extend(msa_lst)
 
-    joined_dict = {}
     print(f'Start joining all alignment file', file = sys.stdout, flush=True)
-
-    number_taxa = len(all_taxa_id_set)
-    count_taxa = 0
-    max_len_taxa_str = max([len(taxa) for taxa in all_taxa_id_set])
-
-    for taxa in list(all_taxa_id_set):
-        count_taxa += 1
-        joined_dict[taxa] = []
-        print(f'    joining {taxa:.<{max_len_taxa_str}}........[{count_taxa}/{number_taxa}]', file = sys.stdout, flush=True)
-        for msafile in msa_list_ordered:
-            joined_dict[taxa].append(all_alignment_dict[msafile]['alignment'][taxa])
-
-    joined_dict = {k:''.join(v) for k,v in joined_dict.items()}
-    # output joined sequences
-    with open(arg_output_filename, 'wt') as ofh:
-        for k,seq in joined_dict.items():
-            ofh.write(f">{k}\n{seq}\n")
+    try:
+        write_supermatrix(msa_list_ordered, arg_output_filename, pad='?', parse_id=busco_taxon, scan=scan, threads=threads, log=sys.stdout)
+    except ValueError as err:
+        sys.exit(f'Error: {err}')
 
 if __name__ == '__main__':
     model2alignment_dict, alignmentfile_lst = parse_modelmap_2dict(args.alignment2model)
-    all_alignment_dict = parse_all_alignment_2_dict(alignmentfile_lst)
-    all_alignment_dict, all_taxa_id_set = check_missing_and_add_placeholders(all_alignment_dict)
-    model2alignment_dict = get_partition_scheme(model2alignment_dict, all_alignment_dict, args.partition_scheme)
-    join_marker(model2alignment_dict, all_alignment_dict, all_taxa_id_set, args.output)
+    scan = parse_all_alignment_2_dict(alignmentfile_lst, args.threads)
+    check_missing_taxa(scan)
+    phylip_filename = partitionfinder_phylip(args.partition_scheme, args.output)
+    model2alignment_dict = get_partition_scheme(model2alignment_dict, scan[1], args.partition_scheme, args.partition_formats, phylip_filename)
+    join_marker(model2alignment_dict, scan, args.output, args.threads)
+    if 'partitionfinder' in args.partition_formats:
+        write_phylip(args.output, phylip_filename)
+        print(f'## PartitionFinder alignment: {os.path.abspath(phylip_filename)}', file=sys.stdout, flush=True)
     print('Done!', file = sys.stdout, flush=True)
-    sys.exit(0)
\ No newline at end of file
+    sys.exit(0)
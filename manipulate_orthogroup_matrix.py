@@ -9,7 +9,8 @@ Bugs: Any bugs should be reported to chengyanpeng1992@outlook.com
 import os
 import sys
 import argparse
-import pandas as pd
+
+from pyfunction import read_orthogroup_table, single_copy_mask
 
 parser = argparse.ArgumentParser(
     description=__doc__,
@@ -45,13 +46,19 @@ parser.add_argument('--orthogroup_count_matrix',
     metavar='<orthogroup_count_matrix.tsv>',
     help='output file containing the gene count of each species in each orthogroup')
 
+parser.add_argument('--no_cache',
+    action='store_true',
+    help='read the matrix as text, do not use or write its binary cache')
+
 args = parser.parse_args()
 
-def read_matrix_into_dataframe(arg_matrix):
-    '''Parse orthogroup matrix into pandas data frame
+def read_matrix_into_dataframe(arg_matrix, use_cache=True):
+    '''Parse orthogroup matrix into pandas data frames of seqids and sequence counts
+
+    A binary cache next to the matrix is loaded instead of the text while it is fresh.
     '''
-    df = pd.read_csv("Orthogroups.tsv", sep="\t", index_col=0, dtype='str')
-    return df
+    df, count_df = read_orthogroup_table(arg_matrix, use_cache=use_cache)
+    return df, count_df
 
 def drop_species(df, arg_drop_species):
     '''Species list need to be removed from matrix
@@ -71,16 +78,6 @@ def drop_orthogroup(df, arg_drop_orthogroup):
     df = df.drop(index=drop_orthogroup_lst)
     return df
 
-def seqid_matrix_2_count_matrix(df):
-    '''Count sequences of each species in each orthogroup
-    '''
-    row_index = list(df.index)
-    count_df = pd.DataFrame()
-
-    for species in df:
-        count_df[species] = df[species].apply(lambda x: len(x.split(', ')) if isinstance(x, str) else 0)
-    return count_df
-
 def output_orthogroup_count_matrix(count_df, arg_orthogroup_count_matrix):
     '''Output orthogroup count matrix
     '''
@@ -91,16 +88,8 @@ def output_orthogroup_count_matrix(count_df, arg_orthogroup_count_matrix):
 def get_singlecopy_orthogroup_matrix(count_df):
     '''Get and output single-copy orthogroup matrix
     '''
-    num_species = count_df.shape[1]
-    drop_orthgroup_lst = []
-    single_copy_orthogroup_lst = []
-    for index, row in count_df.iterrows():
-        if list(row).count(1) != num_species:
-            drop_orthgroup_lst.append(index)
-        else:
-            single_copy_orthogroup_lst.append(index)
-
-    singlecopy_count_df = count_df.drop(index=drop_orthgroup_lst)
+    singlecopy_count_df = count_df[single_copy_mask(count_df)]
+    single_copy_orthogroup_lst = list(singlecopy_count_df.index)
     return singlecopy_count_df, single_copy_orthogroup_lst
 
 def output_single_copy_seqid_matrix(df, single_copy_orthogroup_lst, arg_single_copy_seqid_matrix):
@@ -114,19 +103,20 @@ def output_single_copy_seqid_matrix(df, single_copy_orthogroup_lst, arg_single_c
 def output_single_copy_count_matrix(singlecopy_count_df, arg_single_copy_count_matrix):
     '''Output single copy count matrix
     '''
-    singlecopy_count_df.to_csv(arg_single_copy_matrix, index_label='Orthogroup', sep='\t' )
-    outfile_abspath = os.path.abspath(arg_single_copy_matrix)
+    singlecopy_count_df.to_csv(arg_single_copy_count_matrix, index_label='Orthogroup', sep='\t' )
+    outfile_abspath = os.path.abspath(arg_single_copy_count_matrix)
     print(f'##Single-copy orthogroups count matrix:\n     {outfile_abspath}\n', file=sys.stdout, flush=True)
 
 if __name__ == '__main__':
-    orthogroup_seqid_df= read_matrix_into_dataframe(args.orthogroup_matrix)
+    orthogroup_seqid_df, orthogroup_count_df = read_matrix_into_dataframe(args.orthogroup_matrix, not args.no_cache)
 
     if args.drop_species:
         orthogroup_seqid_df = drop_species(orthogroup_seqid_df, args.drop_species)
+        orthogroup_count_df = drop_species(orthogroup_count_df, args.drop_species)
     if args.drop_orthogroup:
         orthogroup_seqid_df = drop_orthogroup(orthogroup_seqid_df, args.drop_orthogroup)
+        orthogroup_count_df = drop_orthogroup(orthogroup_count_df, args.drop_orthogroup)
 
-    orthogroup_count_df = seqid_matrix_2_count_matrix(orthogroup_seqid_df)
     singlecopy_count_df, single_copy_orthogroup_lst = get_singlecopy_orthogroup_matrix(orthogroup_count_df)
 
     if args.orthogroup_count_matrix:
@@ -3,7 +3,8 @@
 import os
 import sys
 import argparse
-import pandas as pd
+
+from pyfunction import read_orthogroup_table
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -24,6 +25,9 @@ def parse_args():
         required=True,
         metavar='<outdir>',
         help='output directory')
+    parser.add_argument('--no_cache',
+        action='store_true',
+        help='read the matrix as text, do not use or write its binary cache')
     args = parser.parse_args()
     return args
 
@@ -56,10 +60,10 @@ def fasta2dict(fastafile):
     fadict = {identifier:''.join(seq_lst) for identifier,seq_lst in fadict.items()}
     return fadict
 
-def output(matrixfile, mapdict, outdir):
+def output(matrixfile, mapdict, outdir, use_cache=True):
     '''
     '''
-    matrix = pd.read_table(matrixfile, header=0, index_col=0)
+    matrix, _ = read_orthogroup_table(matrixfile, use_cache=use_cache)
     speciesid_lst = list(matrix.columns)
     groupid_lst = list(matrix.index)
 
@@ -85,4 +89,4 @@ def output(matrixfile, mapdict, outdir):
 if __name__ == '__main__':
     args = parse_args()
     mapdict = get_proteinfile_map(args.proteinfilepathmap)
-    output(args.matrixfile, mapdict, args.outdir)
+    output(args.matrixfile, mapdict, args.outdir, not args.no_cache)
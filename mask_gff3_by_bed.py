@@ -8,14 +8,13 @@ BUGS：
     Any bugs should be sent to chenyanpeng1992@outlook.com
 '''
 
-import os
-import re
 import sys
 import gzip
 import argparse
-import fileinput
 from collections import defaultdict
 
+from pyfunction import GFF3Graph, IntervalIndex, gff3_root
+
 def parse_args():
     parser = argparse.ArgumentParser(description=__doc__,
                                     formatter_class=argparse.RawDescriptionHelpFormatter)
@@ -41,17 +40,20 @@ def parse_args():
     parser.add_argument('-c', '--coverage_2_bed',
                        type=float,
                        default=0.5,
-                       help='overlapping_region_length / bed_region_length')
+                       help='overlapping_region_length / bed_region_length, 0 to disable. Default: 0.5')
 
     parser.add_argument('-C', '--coverage_2_gff3',
                        type=float,
                        default=0.5,
-                       help='overlapping_region_length / gene_region_length')
+                       help='overlapping_region_length / gene_region_length, 0 to disable. Default: 0.5')
     args = parser.parse_args()
-    if args.coverage_2_bed and args.coverage_2_gff3:
-        sys.exit('Error message: --coverage_2_bed is incompatible with --coverage_2_gff3')
+    if not args.coverage_2_bed and not args.coverage_2_gff3:
+        sys.exit('Error message: --coverage_2_bed and --coverage_2_gff3 cannot both be 0')
     return args
 
+def open_text(filename):
+    return gzip.open(filename, 'rt') if filename.endswith('.gz') else open(filename, 'rt')
+
 def read_gff3_2_dict(gff3):
     '''
     ##gff-version 3
@@ -68,46 +70,28 @@ def read_gff3_2_dict(gff3):
     ANPB02000006.1  EVM     exon    12486   15416   .       -       .       ID=exon-30842;Parent=mRNA12235
     ANPB02000006.1  EVM     CDS     11856   12415   .       -       0       ID=CDS7448;Parent=mRNA12235
     ANPB02000006.1  EVM     CDS     12486   15416   .       -       0       ID=CDS7448;Parent=mRNA12235
-    '''
-    gff3fh = gzip.open(gff3) if gff3.endswith('.gz') else open(gff3)
-    
-    gff3_gene_pos_strand_dict = defaultdict(list)
-    gff3_contig_gene_dict = defaultdict(list)
-    gff3_gene_mRNA_dict = defaultdict(list)
-    gff3_mRNA_pos_strand_dict = defaultdict(list)
-    gff3_mRNA_exon_dict = defaultdict(list)
-    gff3_mRNA_CDS_dict = defaultdict(list)
-    gff3_exon_pos_strand_dict = defaultdict(list)
-    gff3_CDS_pos_strand_dict = defaultdict(list)
-
-    for line in gff3fh:
-        if line.startswith('#'):
-            continue
 
-        seqid, source, feature, start, end, score, strand, phase, attrs = line.split('\t')
-        if feature == 'gene':
-            geneid = re.search(r'ID=(.*?)[;\n]', attrs).group(1)
-            if geneid in gff3_gene_pos_strand_dict:
-                sys.exit(f'Error message: duplicate geneid {geneid}')
-            gff3_gene_pos_strand_dict[geneid] = [seqid, start, end, strand]
-            gff3_contig_gene_dict[seqid].append(geneid)
-        if feature == 'mRNA':
-            mRNAid = re.search(r'ID=(.*?)[;\n]', attrs).group(1)
-            parent_geneid = re.search(r'Parent=(.*?)[;\n]', attrs).group(1)
-            gff3_gene_mRNA_dict[geneid].append(mRNAid)
-            gff3_mRNA_pos_strand_dict[mRNAid] = [seqid, start, end, strand]
-        if feature == 'exon':
-            exonid = re.search(r'ID=(.*?)[;\n]', attrs).group(1)
-            parent_mRNAid = re.search(r'Parent=(.*?)[;\n]', attrs).group(1)
-            gff3_mRNA_exon_dict[parent_mRNAid].append(exonid)
-            gff3_exon_pos_strand_dict[mRNAid] = [seqid, start, end, strand]
-        if feature == 'CDS':
-            CDSid = re.search(r'ID=(.*?)[;\n]', attrs).group(1)
-            parent_mRNAid = re.search(r'Parent=(.*?)[;\n]', attrs).group(1)
-            gff3_mRNA_CDS_dict[parent_mRNAid].append(CDSid)
-            gff3_CDS_pos_strand_dict[mRNAid] = [seqid, start, end, strand]
-    gff3fh.close()
-    return gff3_gene_pos_strand_dict, gff3_gene_mRNA_dict, gff3_mRNA_pos_strand_dict, gff3_mRNA_exon_dict, gff3_mRNA_CDS_dict, gff3_exon_pos_strand_dict, gff3_CDS_pos_strand_dict
+    Return:
+        dict: {seqid: IntervalIndex of the genes on it, labelled by geneid}
+        dict: {featureid: parentid} of every feature with both
+    '''
+    gff3_contig_gene_dict = defaultdict(IntervalIndex)
+    gff3_parent_dict = {}
+    gene_set = set()
+    with open_text(gff3) as gff3fh:
+        for line in gff3fh:
+            if line.startswith('#') or not line.strip():
+                continue
+            seqid, source, feature, start, end, score, strand, phase, attrs = line.split('\t')
+            featureid, parentid = GFF3Graph.parse_attrs(attrs)
+            if feature == 'gene':
+                if featureid in gene_set:
+                    sys.exit(f'Error message: duplicate geneid {featureid}')
+                gene_set.add(featureid)
+                gff3_contig_gene_dict[seqid].add(int(start), int(end), featureid)
+            elif featureid is not None and parentid is not None:
+                gff3_parent_dict[featureid] = parentid
+    return gff3_contig_gene_dict, gff3_parent_dict
 
 def read_bed_2_dict(bedfile):
     '''Bed file can be generated using bedtools
@@ -122,82 +106,74 @@ def read_bed_2_dict(bedfile):
     WEZL01001087.1  .       BED_feature     5039    5209    .       .       .       .
     WEZL01001089.1  .       BED_feature     5892    6061    .       .       .       .
     WEZL01001091.1  .       BED_feature     330     381     .       .       .       .
+
+    plain BED lines (seqid, 0-based start, end) are accepted as well.
+    Coordinates are cast to int once and returned 1-based and inclusive.
     '''
-    bedfh = gzip.open(bedfile) if bedfile.endswith('.gz') else open(bedfile)
     bed_dict = defaultdict(list)
-    for line in bedfh:
-        if line.startswith('#'):
-            continue
-        seqid, _, feature, start, end = line.split('\t')[:5]
-        bed_dict[seqid].append((start, end))
-    bedfh.close()
+    with open_text(bedfile) as bedfh:
+        for line in bedfh:
+            if line.startswith(('#', 'track', 'browser')) or not line.strip():
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if fields[1].isdigit():
+                bed_dict[fields[0]].append((int(fields[1]) + 1, int(fields[2])))
+            else:
+                bed_dict[fields[0]].append((int(fields[3]), int(fields[4])))
     return bed_dict
 
-def remove_overlapping_region(gff3_contig_gene_dict, gene_pos_strand_dict, bed_dict, cover2bed, cover2gff3):
+def remove_overlapping_region(gff3_contig_gene_dict, bed_dict, cover2bed, cover2gff3):
+    '''genes overlapped by a bed region above either coverage threshold
+
+    The gene index of each contig is queried once per region, so a contig costs
+    O((genes + regions) log genes) plus the overlapping pairs.
+
+    Return:
+        set: geneids to remove
+    '''
+    removed_gene_set = set()
     for seqid, regions in bed_dict.items():
-        for region in regions:
-            region_start = region[0]
-            region_end = region[1]
-            region_length = int(region_end) - int(region_start) + 1
-            for gene in gff3_contig_gene_dict[seqid]:
-                _, gene_region_start, gene_region_end = gene_pos_strand_dict[gene][:3]
-                gene_length = int(gene_region_end) - int(gene_region_start) + 1
-                if int(gene_region_start) >= int(region_end) or int(gene_region_end) <= int(region_start):
-                    continue
-                if int(gene_region_start) < int(region_end) and int(gene_region_start) > int(region_start):
-                    overlapping_region_length = int(region_end) - int(gene_region_start) += 1
-                    if cover2bed and overlapping_region_length / region_length >= 0.5:
-                        del gene_pos_strand_dict[gene]
-                        continue
-                    if cover2gff3 and overlapping_region_length / gene_length >= 0.5:
-                        del gene_pos_strand_dict[gene]
-                        continue
-    seqids_with_genes = set([seqid_pos_strand[0] for gene,seqid_pos_strand in gene_pos_strand_dict.items()])
-    return gene_pos_strand_dict, seqids_with_genes
+        gene_index = gff3_contig_gene_dict.get(seqid)
+        if gene_index is None:
+            continue
+        for region_start, region_end in regions:
+            region_length = region_end - region_start + 1
+            for gene_start, gene_end, geneid in gene_index.overlap(region_start, region_end):
+                overlapping_region_length = min(region_end, gene_end) - max(region_start, gene_start) + 1
+                if cover2bed and overlapping_region_length / region_length >= cover2bed:
+                    removed_gene_set.add(geneid)
+                elif cover2gff3 and overlapping_region_length / (gene_end - gene_start + 1) >= cover2gff3:
+                    removed_gene_set.add(geneid)
+    return removed_gene_set
+
+def write_gff3(gff3, outfile, gff3_contig_gene_dict, gff3_parent_dict, removed_gene_set):
+    '''stream the gff3 once, dropping removed genes with all their descendants
+
+    ##sequence-region lines are kept for the contigs that still carry a gene
+    '''
+    seqids_with_genes = {seqid for seqid, gene_index in gff3_contig_gene_dict.items()
+                         if any(geneid not in removed_gene_set for _, _, geneid in gene_index)}
+
+    with open_text(gff3) as gff3fh, open(outfile, 'wt') as outfh:
+        for line in gff3fh:
+            if line.startswith('##sequence-region'):
+                if line.split()[1] in seqids_with_genes:
+                    outfh.write(line)
+                continue
+            if line.startswith('#') or not line.strip():
+                outfh.write(line)
+                continue
+            featureid, parentid = GFF3Graph.parse_attrs(line.split('\t')[8])
+            if gff3_root(parentid if featureid is None else featureid, gff3_parent_dict) in removed_gene_set:
+                continue
+            outfh.write(line)
 
 if __name__ == '__main__':
     args = parse_args()
-    gff3_gene_pos_strand_dict, gff3_gene_mRNA_dict, gff3_mRNA_pos_strand_dict, gff3_mRNA_exon_dict, gff3_mRNA_CDS_dict, gff3_exon_pos_strand_dict, gff3_CDS_pos_strand_dict = read_gff3_2_dict(args.gff3)
+    gff3_contig_gene_dict, gff3_parent_dict = read_gff3_2_dict(args.gff3)
     bed_dict = read_bed_2_dict(args.bed)
-    gene_pos_strand_dict, seqids_with_genes = remove_overlapping_region(gff3_contig_gene_dict, gene_pos_strand_dict, bed_dict, args.coverage_2_bed, args.coverage_2_gff3)
-    gff3fh = gzip.open(gff3) if gff3.endswith('.gz') else open(gff3)
-    
-    outfh = open(args.out, 'wt')
-    for line in gff3fh:
-        if line.startswith('##sequence-region'):
-            seq_id = line.split()[1]
-            if seq_id in seqids_with_genes:
-                outfh.write(line)
-            continue
-        if line.startswith('#'):
-            outfh.write(line)
-            continue
-        seqid, source, feature, start, end, score, strand, phase, attrs = line.split('\t')
-        if feature == 'gene':
-            geneid = re.search(r'ID=(.*?)[;\n]', attrs).group(1)
-            if geneid in gene_pos_strand_dict:
-                outfh.write(line)
-            continue
-        if feature == 'mRNA':
-            mRNAid = re.search(r'ID=(.*?)[;\n]', attrs).group(1)
-            parent_geneid = re.search(r'Parent=(.*?)[;\n]', attrs).group(1)
-            if parent_geneid in gene_pos_strand_dict:
-                outfh.write(line)
-            continue
-         if feature
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+    removed_gene_set = remove_overlapping_region(gff3_contig_gene_dict, bed_dict, args.coverage_2_bed, args.coverage_2_gff3)
+    write_gff3(args.gff3, args.out, gff3_contig_gene_dict, gff3_parent_dict, removed_gene_set)
+    num_genes = sum(len(gene_index) for gene_index in gff3_contig_gene_dict.values())
+    print(f'Removed {len(removed_gene_set)} of {num_genes} genes: {args.out}', file=sys.stdout, flush=True)
+    sys.exit(0)
@@ -12,6 +12,8 @@ Input:
 import sys
 import argparse
 
+from pyfunction import add_cache_arguments, open_cache, write_statistics_table
+
 
 parser = argparse.ArgumentParser(
     description=__doc__,
@@ -22,29 +24,26 @@ parser.add_argument(
     '--input',
     type=str,
     required=True,
-    help='genome file')
+    nargs='+',
+    help='genome file(s)')
+
+parser.add_argument(
+    '-t',
+    '--threads',
+    '--processes',
+    dest='processes',
+    type=int,
+    default=1,
+    help='number of genomes processed in parallel. Default: 1')
+
+add_cache_arguments(parser)
 
 
 args = parser.parse_args()
 
-fa_dict = dict()
-with open(args.input, 'rt') as infh:
-    for line in infh:
-        line = line.rstrip('\n')
-        if line.startswith('>'):
-            contig_id = line.split()[0]
-            fa_dict[contig_id] = []
-        else:
-            fa_dict[contig_id].append(line)
-
-fa_dict = {k: ''.join(v) for k, v in fa_dict.items()}
-fa_length = [len(v) for k, v in fa_dict.items()]
-total_length = sum(fa_length)
-fa_length.sort(reverse=True)
-c_length = 0
-for i in fa_length:
-    c_length += i
-    if c_length >= total_length / 2:
-        print(args.input, i, sep='\t', file=sys.stdout, flush=True)
-        break
-sys.exit(0)
+if __name__ == '__main__':
+    cache = open_cache(args)
+    write_statistics_table(args.input, ['N50'], (50,), args.processes, cache, header=False, basename=False)
+    if cache:
+        cache.close()
+    sys.exit(0)
@@ -10,8 +10,9 @@ import sys
 import time
 import tqdm
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 
-import pandas as pd
+from pyfunction import fetch_regions, read_orthogroup_table, single_copy_mask
 
 parser = argparse.ArgumentParser(description=__doc__,
                                  formatter_class=argparse.RawDescriptionHelpFormatter)
@@ -35,15 +36,24 @@ parser.add_argument('--directory',
                     type=str,
                     metavar='single_copy_coverage',
                     help = 'filename of output directory. Orthogroup is will be fasta file name, and the taxa label will be sequence IDs')
+parser.add_argument('--no_cache',
+                    action='store_true',
+                    help = 'read Orthogroups.tsv as text, do not use or write its binary cache')
+parser.add_argument('--threads',
+                    default=4,
+                    type=int,
+                    metavar='4',
+                    help = 'number of orthogroup fasta files written in parallel. Default: 4')
 
 args = parser.parse_args()
 
-def read_orthogroup_matrix_2_dataframe(tbl):
-    # read orthofinder result file: Orthogroups.tsv into python dataframe
+def read_orthogroup_matrix_2_dataframe(tbl, use_cache=True):
+    # read orthofinder result file: Orthogroups.tsv into python dataframe, and count genes in each cell
     # first column is index, representing the cluster IDs
     # first row is colnames, representing the species IDs
+    # a binary cache next to Orthogroups.tsv is loaded instead of the text while it is fresh
     try:
-        orthogroup_dataframe = pd.read_table(tbl, index_col=0, low_memory=False)
+        orthogroup_dataframe, count_dataframe = read_orthogroup_table(tbl, use_cache=use_cache)
     except FileNotFoundError:
         sys.exit(f'Error: parse {tbl} into dataframe failed ')
 
@@ -51,23 +61,27 @@ def read_orthogroup_matrix_2_dataframe(tbl):
     print('-' * 20, file=sys.stdout, flush=True)
     print(f'Number of orthogroups: {num_rows}', file=sys.stdout, flush=True)
     print(f'Number of genomes    : {num_cols}', file=sys.stdout, flush=True)
-    return orthogroup_dataframe
-
-def orthogroup_dataframe_2_count_matrix(orthogroup_dataframe):
-    # get count dataframe by counting gene number in each cell
-    count_dataframe = orthogroup_dataframe.applymap(lambda cell: len(cell.split(', ')) if isinstance(cell, str) else 0)
-    return count_dataframe
+    return orthogroup_dataframe, count_dataframe
 
 def single_copy_orthogroups(count_dataframe, taxa_coverage):
     # according given taxa coverage to get the single copy orthogroup dataframe
-    mask = count_dataframe.apply(lambda row: ((row != 0).sum() / len(row) >= taxa_coverage/100) and not any(cell > 1 for cell in row), axis=1)
+    mask = single_copy_mask(count_dataframe, taxa_coverage)
     single_copy_dataframe = count_dataframe[mask]
     num_rows, num_cols = single_copy_dataframe.shape[0], single_copy_dataframe.shape[1]
     print(f'single-copy orthogroups: {num_rows}', file=sys.stdout, flush=True)
     return single_copy_dataframe
 
-def read_all_pep_2_dict(args_list):
-    # read all pep file into python3 dictionary
+def single_copy_gene_ids(single_copy_count_dataframe, orthogroup_dataframe):
+    # gene IDs of the single-copy orthogroups, grouped by taxa label: {taxa_label: {geneid, ...}}
+    single_copy_dataframe = orthogroup_dataframe.loc[list(single_copy_count_dataframe.index)]
+    gene_dict = {}
+    for taxa_label, column in single_copy_dataframe.items():
+        gene_dict[taxa_label] = {geneid.strip() for geneid in column.dropna() if geneid.strip()}
+    return gene_dict
+
+def read_all_pep_2_dict(args_list, gene_dict):
+    # fetch only the single-copy proteins, one pep file open at a time: through pep.fai (built once
+    # and reused), or by streaming gzipped and unevenly wrapped files
     fa_dict = {}
     lable_2_path = {}
     with open(args_list) as lst_fh:
@@ -79,19 +93,22 @@ def read_all_pep_2_dict(args_list):
     pbar = tqdm.tqdm(taxa_label_lst)
     for taxa_label in pbar:
         pbar.set_description('Reading ' + taxa_label)
-        pep_path = lable_2_path[taxa_label]
-        fa_dict[taxa_label] = {}
-        with open(pep_path) as fafh:
-            for line in fafh:
-                line = line.rstrip('\n')
-                if line.startswith('>'):
-                    seq_id = line.split()[0].lstrip('>')
-                    fa_dict[taxa_label][seq_id] = []
-                else:
-                    fa_dict[taxa_label][seq_id].append(line)
+        geneid_lst = sorted(gene_dict.get(taxa_label, ()))
+        seq_lst = fetch_regions(lable_2_path[taxa_label], [(geneid, 1, None) for geneid in geneid_lst])
+        fa_dict[taxa_label] = {geneid: seq for geneid, seq in zip(geneid_lst, seq_lst) if seq is not None}
     return fa_dict
 
-def output_single_copy_sequences(fa_dict, single_copy_count_dataframe, orthogroup_dataframe, outdirectory):
+def write_orthogroup_fasta(fa_filename, row, fa_dict):
+    with open(fa_filename, 'wt') as fafh:
+        for column_index, geneid in row.items():
+            try:
+                sequence = fa_dict[column_index][geneid]
+            except KeyError:
+                #print(column_index, geneid)
+                continue
+            fafh.write('>' + column_index + '\n' + sequence + '\n')
+
+def output_single_copy_sequences(fa_dict, single_copy_count_dataframe, orthogroup_dataframe, outdirectory, threads=4):
     if os.path.exists(outdirectory):
         sys.exit(f'Error: output directory {outdirectory} already exists. Try new output dirname or remove the directory.')
     else:
@@ -99,27 +116,23 @@ def output_single_copy_sequences(fa_dict, single_copy_count_dataframe, orthogrou
     print(f'Output single-copy datasets: {outdirectory}', file = sys.stdout, flush = True)
     single_copy_dataframe = orthogroup_dataframe.loc[list(single_copy_count_dataframe.index)]
 
-    for row_index, row in single_copy_dataframe.iterrows():  # iterate over rows
-        fa_filename = outdirectory + '/' + row_index + '.faa'
-        if os.path.exists(fa_filename):
-            sys.exit(f'Error: {fa_filename} already exists.')
-
-        with open(fa_filename, 'wt') as fafh:
-            for column_index, geneid in row.items():
-                try:
-                    sequence = ''.join(fa_dict[column_index][geneid])
-                except KeyError:
-                    #print(column_index, geneid)
-                    continue
-                fafh.write('>' + column_index + '\n' + sequence + '\n')
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = []
+        for row_index, row in single_copy_dataframe.iterrows():  # iterate over rows
+            fa_filename = outdirectory + '/' + row_index + '.faa'
+            if os.path.exists(fa_filename):
+                sys.exit(f'Error: {fa_filename} already exists.')
+            futures.append(executor.submit(write_orthogroup_fasta, fa_filename, row, fa_dict))
+        for future in futures:
+            future.result()
 
 if __name__ == '__main__':
     st = time.time()
-    fa_dict = read_all_pep_2_dict(args.list)
-    orthogroup_dataframe = read_orthogroup_matrix_2_dataframe(args.tsv)
-    count_dataframe = orthogroup_dataframe_2_count_matrix(orthogroup_dataframe)
+    orthogroup_dataframe, count_dataframe = read_orthogroup_matrix_2_dataframe(args.tsv, not args.no_cache)
     single_copy_dataframe = single_copy_orthogroups(count_dataframe, args.coverage)
-    output_single_copy_sequences(fa_dict, single_copy_dataframe, orthogroup_dataframe, args.directory)
+    gene_dict = single_copy_gene_ids(single_copy_dataframe, orthogroup_dataframe)
+    fa_dict = read_all_pep_2_dict(args.list, gene_dict)
+    output_single_copy_sequences(fa_dict, single_copy_dataframe, orthogroup_dataframe, args.directory, args.threads)
     print('-' * 20, file=sys.stdout, flush=True)
     elapsed_time = time.time() - st
     print('Elapsed time:', time.strftime("%H:%M:%S", time.gmtime(elapsed_time)), file=sys.stdout, flush=True)
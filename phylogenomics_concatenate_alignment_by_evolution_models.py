@@ -10,6 +10,8 @@ import sys
 import collections
 import argparse
 
+from pyfunction import PartitionScheme, scan_alignments, write_phylip, write_supermatrix
+
 parser = argparse.ArgumentParser(
         description=__doc__,
         formatter_class=argparse.RawDescriptionHelpFormatter)
@@ -24,8 +26,23 @@ parser.add_argument('-p', '--prefix',
     type=str,
     help='prefix outfile, PREFIX.concatenate.faa | PREFIX.concatenate.partition_scheme.txt')
 
+parser.add_argument('-f', '--partition_formats',
+    choices=PartitionScheme.FORMATS,
+    nargs='+',
+    default=[],
+    metavar='nexus|raxml|mrbayes|partitionfinder',
+    help='also write the partition scheme in these formats as PREFIX.concatenate.partition_scheme.*; the partition lengths are kept in PREFIX.concatenate.partition_scheme.lengths.tsv; partitionfinder reads PREFIX.partition_concatenate.phy, written next to it')
+
+parser.add_argument('-t', '--threads',
+    type=int,
+    default=4,
+    help='alignment files read concurrently. Default: 4')
+
 args = parser.parse_args()
 
+def first_word(header):
+    return header.split()[0]
+
 def read_alignment2models(args_input):
     '''
     Parameters
@@ -34,86 +51,54 @@ def read_alignment2models(args_input):
 
     Return
     ---------------
-    dictionary1: a python dictionary, the 1st level keys are alignment file, the 2rd level keys are fasta ids, and the sequences are the values.
-    dictionary2: a python dictionary, keys represent alignment filenames, values represent alignment length.
-    dictionary3: a python dictionary, keys represent evolution models, value are list comprising alignment files.
+    tuple: result of scan_alignments, taxa list, alignment lengths and taxa of each alignment file; sequences are not kept.
+    list: alignment files ordered by evolution models.
     txt: Raxml-style partition scheme
     '''
-    all_msa_dict = {}
     model2alignment_lst_dict = collections.defaultdict(list)
-    taxa_lst = []
     with open(args_input, 'rt') as infh:
         for line in infh:
             alignment_file, model = line.rstrip('\n').split('\t')
             model2alignment_lst_dict[model].append(alignment_file)
 
-            if alignment_file not in all_msa_dict:
-                all_msa_dict[alignment_file] = {}
-                with open(alignment_file, 'rt') as fafh:
-                    for line in fafh:
-                        line = line.rstrip('\n')
-                        if line.startswith('>'):
-                            fa_id = line.split()[0].lstrip('>')
-                            taxa_lst.append(fa_id)
-                            all_msa_dict[alignment_file][fa_id] = []
-                        else:
-                            all_msa_dict[alignment_file][fa_id].append(line)
-
-    for msa, fa_dict in all_msa_dict.items():
-        all_msa_dict[msa] = {k:''.join(v) for k,v in fa_dict.items()}
-    
     model2alignment_lst_dict = {key: val for key, val in sorted(model2alignment_lst_dict.items(), key = lambda ele: ele[0])}
     ordered_msa_lst = []
     for model, alignment_lst in model2alignment_lst_dict.items():
         ordered_msa_lst.extend(alignment_lst)
-    
-    msa_len_dict = {}
-    with open(args.prefix + 'concatenate.partition_scheme.txt', 'wt') as txtfh:
-        join_length = 0
-        for model, alignment_lst in model2alignment_lst_dict.items():
-            for alignment in alignment_lst:
-                part_label = os.path.basename(alignment).split('.')[0]
-                alignment_length = len(list(all_msa_dict[alignment].items())[0][1])
-                msa_len_dict[alignment] = alignment_length
-                if join_length == 0:
-                    start = 1
-                else:
-                    start = join_length + 1
-                join_length += alignment_length
-                end = join_length
-                txtfh.write(f'{model}, {part_label} = {start} - {end}\n')
-    return all_msa_dict, msa_len_dict, ordered_msa_lst, list(set(taxa_lst))
+    try:
+        scan = scan_alignments(list(dict.fromkeys(ordered_msa_lst)), first_word, args.threads)
+    except ValueError as err:
+        sys.exit(f'Error: {err}')
+    msa_len_dict = scan[1]
 
-def add_missingdata_to_alignment(taxa_lst, all_msa_dict, msa_len_dict):
-    '''Adding missing data into some msa file.
-    '''
-    for msa, fadict in all_msa_dict.items():
-        msa_length = msa_len_dict[msa]
-        taxa_missing_lst = []
-        for taxa_id in taxa_lst:
-            if taxa_id not in fadict:
-                taxa_missing_lst.append(taxa_id)
-                all_msa_dict[msa][taxa_id] = '?' * msa_length
-
-        print('#' + msa, msa_length, len(taxa_missing_lst), file=sys.stdout, flush=True)
-        print("\n".join(taxa_missing_lst) + '\n', file=sys.stdout, flush=True)
-    return all_msa_dict
+    scheme = PartitionScheme()
+    for model, alignment_lst in model2alignment_lst_dict.items():
+        for alignment in alignment_lst:
+            scheme.add(os.path.basename(alignment).split('.')[0], msa_len_dict[alignment], model)
+    scheme.write(args.prefix + 'concatenate.partition_scheme.txt', 'raxml')
+    scheme.save(args.prefix + 'concatenate.partition_scheme.lengths.tsv')
+    try:
+        scheme.write_formats(args.prefix + 'concatenate.partition_scheme', args.partition_formats,
+                             {'partitionfinder': {'alignment': os.path.basename(args.prefix + '.partition_concatenate.phy')}})
+    except ValueError as err:
+        sys.exit(f'Error: {err}')
+    return scan, ordered_msa_lst
 
-def concatenate(taxa_lst, all_msa_dict, ordered_msa_lst):
-    '''Combing msa file by common ids
+def report_missingdata(scan):
+    '''Report the taxa missing from each msa file, they are filled with '?'.
     '''
-    concatenate_dict = {}
-    for taxa_id in taxa_lst:
-        concatenate_dict[taxa_id] = []
-        for msa in ordered_msa_lst:
-            seq = all_msa_dict[msa][taxa_id]
-            concatenate_dict[taxa_id].append(seq)
-    return concatenate_dict
+    taxa_lst, msa_len_dict, msa_taxa_dict = scan
+    for msa, taxa_set in msa_taxa_dict.items():
+        taxa_missing_lst = [taxa_id for taxa_id in taxa_lst if taxa_id not in taxa_set]
+        print('#' + msa, msa_len_dict[msa], len(taxa_missing_lst), file=sys.stdout, flush=True)
+        print("\n".join(taxa_missing_lst) + '\n', file=sys.stdout, flush=True)
 
 if __name__ == '__main__':
-    all_msa_dict, msa_len_dict, ordered_msa_lst, taxa_lst = read_alignment2models(args.input)
-    all_msa_dict = add_missingdata_to_alignment(taxa_lst, all_msa_dict, msa_len_dict)
-    concatenate_dict = concatenate(taxa_lst, all_msa_dict, ordered_msa_lst)
-    with open(args.prefix + '.partition_concatenate.faa' , 'wt') as outfh:
-        for taxa_id, seq in concatenate_dict.items():
-            outfh.write(f'>{taxa_id}\n{"".join(seq)}\n')
\ No newline at end of file
+    scan, ordered_msa_lst = read_alignment2models(args.input)
+    report_missingdata(scan)
+    try:
+        write_supermatrix(ordered_msa_lst, args.prefix + '.partition_concatenate.faa', pad='?', parse_id=first_word, scan=scan, threads=args.threads)
+    except ValueError as err:
+        sys.exit(f'Error: {err}')
+    if 'partitionfinder' in args.partition_formats:
+        write_phylip(args.prefix + '.partition_concatenate.faa', args.prefix + '.partition_concatenate.phy')
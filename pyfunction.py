@@ -1,6 +1,190 @@
 #!/usr/bin/env python3
+'''
+pyfunction.py -- shared helpers imported by the scripts in this directory.
 
+    from pyfunction import read_fasta
+
+    for seq_id, seq in read_fasta('genome.fna.gz'):
+        ...
+    for seq_id, length in read_fasta('genome.fna', length_only=True):
+        ...
+'''
 import os
+import sys
+import gzip
+import heapq
+import json
+import mmap
+import time
+import sqlite3
+import hashlib
+import collections
+import multiprocessing
+from array import array
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+# bytes read from a FASTA file per chunk. Big enough to amortise the Python
+# overhead per chunk, small enough to keep memory flat on multi-Gb assemblies.
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# used with bytes.translate to drop line breaks and blanks from sequence chunks
+_WHITESPACE = b' \t\r\n\v\f'
+
+# used with bytes.translate to fold sequence chunks into one bit per base class
+# before counting: G/C -> 0b001, A/T -> 0b010, N -> 0b100, anything else -> 0
+_BASE_CLASS = bytes(1 if b in b'GCgc' else 2 if b in b'ATat' else 4 if b in b'Nn' else 0
+                    for b in range(256))
+
+# default Nx thresholds reported by the assembly statistics
+NX_THRESHOLDS = (90, 75, 50, 25)
+
+# convert iqtree models to mrbayes definitions
+MRBAYES_MODEL_MAP = {'GTR':'nst=6',
+                     'GTR+I':'nst=6 rates=propinv',
+                     'GTR+G':'nst=6 rates=gamma',
+                     'GTR+I+G':'nst=6 rates=invgamma',
+                     'SYM':['nst=6', 'statefreqpr=fixed(equal)'],
+                     'SYM+I':['nst=6 rates=propinv', 'statefreqpr=fixed(equal)'],
+                     'SYM+G':['nst=6 rates=gamma','statefreqpr=fixed(equal)'],
+                     'SYM+I+G':['nst=6 rates=invgamma','statefreqpr=fixed(equal)'],
+                     'HKY':'nst=2',
+                     'HKY+I':'nst=2 rates=propinv',
+                     'HKY+G':'nst=2 rates=gamma',
+                     'HKY+I+G':'nst=2 rates=invgamma',
+                     'K2P':['nst=2', 'statefreqpr=fixed(equal)'],
+                     'K2P+I':['nst=2 rates=propinv', 'statefreqpr=fixed(equal)'],
+                     'K2P+G':['nst=2 rates=gamma','statefreqpr=fixed(equal)'],
+                     'K2P+I+G':['nst=2 rates=invgamma','statefreqpr=fixed(equal)'],
+                     'F81':'nst=1',
+                     'F81+I':'nst=1 rates=propinv',
+                     'F81+G':'nst=1 rates=gamma',
+                     'F81+I+G':'nst=1 rates=invgamma',
+                     'JC':['nst=1', 'statefreqpr=fixed(equal)'],
+                     'JC+I':['nst=1 rates=propinv', 'statefreqpr=fixed(equal)'],
+                     'JC+G':['nst=1 rates=gamma','statefreqpr=fixed(equal)'],
+                     'JC+I+G':['nst=1 rates=invgamma','statefreqpr=fixed(equal)']}
+
+# rank keys of tabular BLAST hits (-outfmt 6, optionally followed by qlen slen)
+BLAST_RANK_KEYS = {'bitscore': lambda hit: float(hit[11]),
+                   'length': lambda hit: int(hit[3]),
+                   'identity': lambda hit: float(hit[2]),
+                   'evalue': lambda hit: -float(hit[10])}
+
+def open_fasta(fafile, mode='rb'):
+    '''Open a plain or gzip-compressed (.gz) file
+
+    Args:
+        fafile (str): file name with corresponding path, '-' means stdin
+        mode (str): 'rb' (default) or 'rt'
+
+    Return:
+        file object
+    '''
+    if fafile == '-':
+        return sys.stdin.buffer if 'b' in mode else sys.stdin
+    if fafile.endswith('.gz'):
+        return gzip.open(fafile, mode)
+    return open(fafile, mode)
+
+def _parse_header(header, full_header):
+    header = header.decode().rstrip('\r')
+    if full_header:
+        return header
+    fields = header.split(maxsplit=1)
+    return fields[0] if fields else ''
+
+def iter_fasta_chunks(fafile, full_header=False, chunk_size=CHUNK_SIZE):
+    '''Scan a FASTA file(.gz allowed) in bulk byte chunks
+
+    The first item of every record carries its identifier, the following items
+    of the same record carry None. Chunks are bytes without line breaks, and
+    the first chunk of a record may be empty. Only one chunk is held at a time.
+
+        ('contig_1', b'ATGC...'), (None, b'GGCA...'), ('contig_2', b'TTAG...'), ...
+
+    Args:
+        fafile (str): a file name with corresponding path, the file must be in FASTA format
+        full_header (bool): keep the entire header line instead of the first field
+        chunk_size (int): number of bytes read per chunk
+
+    Yield:
+        tuple: (seq_id or None, chunk)
+    '''
+    fa_fh = open_fasta(fafile, 'rb')
+    try:
+        in_header = False
+        at_line_start = True
+        header_parts = []
+        chunk = fa_fh.read(chunk_size)
+        while chunk:
+            pos = 0
+            chunk_len = len(chunk)
+            while pos < chunk_len:
+                if in_header:
+                    newline = chunk.find(b'\n', pos)
+                    if newline < 0:
+                        header_parts.append(chunk[pos:])
+                        break
+                    header_parts.append(chunk[pos:newline])
+                    yield _parse_header(b''.join(header_parts), full_header), b''
+                    in_header = False
+                    at_line_start = True
+                    pos = newline + 1
+                    continue
+
+                if at_line_start and chunk[pos] == 62:  # '>'
+                    in_header = True
+                    header_parts = []
+                    pos += 1
+                    continue
+
+                next_header = chunk.find(b'\n>', pos)
+                end = chunk_len if next_header < 0 else next_header + 1
+                seq_chunk = chunk[pos:end].translate(None, _WHITESPACE)
+                if seq_chunk:
+                    yield None, seq_chunk
+                at_line_start = chunk[end - 1] == 10  # '\n'
+                pos = end
+            chunk = fa_fh.read(chunk_size)
+
+        if in_header:
+            yield _parse_header(b''.join(header_parts), full_header), b''
+    finally:
+        if fa_fh is not sys.stdin.buffer:
+            fa_fh.close()
+
+def read_fasta(fafile, length_only=False, full_header=False, chunk_size=CHUNK_SIZE):
+    '''Iterate over the records of a FASTA file(.gz allowed) one at a time
+
+    Only the current record is kept in memory. With length_only=True not even
+    that: the sequence is counted chunk by chunk and never assembled.
+
+    Args:
+        fafile (str): a file name with corresponding path, the file must be in FASTA format
+        length_only (bool): yield (seq_id, length) instead of (seq_id, seq)
+        full_header (bool): keep the entire header line instead of the first field
+        chunk_size (int): number of bytes read per chunk
+
+    Yield:
+        tuple: (seq_id, seq) or (seq_id, length)
+    '''
+    seq_id = None
+    seq_len = 0
+    seq_parts = []
+    for header, chunk in iter_fasta_chunks(fafile, full_header, chunk_size):
+        if header is not None:
+            if seq_id is not None:
+                yield (seq_id, seq_len) if length_only else (seq_id, b''.join(seq_parts).decode())
+            seq_id = header
+            seq_len = 0
+            seq_parts = []
+        if length_only:
+            seq_len += len(chunk)
+        elif chunk:
+            seq_parts.append(chunk)
+    if seq_id is not None:
+        yield (seq_id, seq_len) if length_only else (seq_id, b''.join(seq_parts).decode())
 
 def parse_fa_2rawdict(fafile):
     '''Parse fasta file(.gz allowed) into python3 dictionary, '>' and newline signs(\n) were saved
@@ -26,30 +210,18 @@ def parse_fa_2rawdict(fafile):
             fa_raw_dict[seq_id].append(line)
     return fa_raw_dict
 
-def parse_fa_2dict(fafile):
+def parse_fa_2dict(fafile, full_header=True):
     '''Parse fasta file(.gz allowed) into python3 dictionary, without '>' and newline signs(\n)
     {'id':'seq', ...}
     
     Args:
         fafile (str): A file name with corresponding path, and the file must be in FASTA format
+        full_header (bool): keep the entire header line as key instead of the first field
 
     Return:
         fa_dict (dict) :A python3 dictionary without '>' and newline signs(\n). {'id':'seq', ...}    
     '''
-    fa_dict = {}
-
-    fa_fh = gzip.open(fafile, 'rt') if fafile.endswith('.gz') else open(fafile, 'rt')
-    for line in fa_fh:
-        if not line:
-            continue
-        line = line.rstrip('\n')
-        if line.startswith('>'):
-            seq_id = line.lstrip('\n')
-            fa_dict[seq_id] = []
-        else:
-            fa_dict[seq_id].append(line)
-    fa_dict = {seq_id:''.join(seq_lst) for seq_id,seq_lst in fa_dict.items()}
-    return fa_dict
+    return dict(read_fasta(fafile, full_header=full_header))
 
 def sort_fadict_by_length(fa_dict):
     '''
@@ -64,7 +236,7 @@ def sort_fadict_by_length(fa_dict):
     ------
         dict: A sorted dictionay by length
     '''
-    return sorted(fa_dict.items(), key = lambda kv:length(kv[1]),reverse=True)
+    return sorted(fa_dict.items(), key = lambda kv:len(kv[1]),reverse=True)
     
 def calculate_sequence_statistic_values(sorted_fa_dict):
     '''Calucate sequence statistic values return them in dictionary
@@ -150,6 +322,1163 @@ def calculate_sequence_statistic_values(sorted_fa_dict):
     statistics_dict['count_N'] = count_N
     return statistics_dict
 
+def nx_statistics(sorted_len_lst, total_len, nx_lst=NX_THRESHOLDS):
+    '''Calculate Nx and Lx values from contig lengths sorted from longest to shortest
+
+    Nx is the length of the shortest contig in the smallest set of longest
+    contigs covering x% of the assembly, Lx is the size of that set.
+
+    Args:
+        sorted_len_lst (list): contig lengths in descending order
+        total_len (int): sum of the contig lengths
+        nx_lst (tuple): thresholds in percent, e.g. (90, 75, 50, 25)
+
+    Return:
+        dict: {'N50': int, 'L50': int, ...}, None when the assembly is empty
+    '''
+    statistics_dict = {}
+    pending_nx_lst = sorted(nx_lst)
+    cumulative_len = 0
+    for L_num, contig_len in enumerate(sorted_len_lst, start=1):
+        cumulative_len += contig_len
+        while pending_nx_lst and cumulative_len * 100 >= pending_nx_lst[0] * total_len:
+            nx = pending_nx_lst.pop(0)
+            statistics_dict[f'N{nx}'] = contig_len
+            statistics_dict[f'L{nx}'] = L_num
+        if not pending_nx_lst:
+            break
+    for nx in pending_nx_lst:
+        statistics_dict[f'N{nx}'] = None
+        statistics_dict[f'L{nx}'] = None
+    return statistics_dict
+
+def assembly_statistics_header(nx_lst=NX_THRESHOLDS):
+    '''Column names of assembly_statistics output, in report order
+
+    Args:
+        nx_lst (tuple): thresholds in percent
+
+    Return:
+        list: column names
+    '''
+    head_lst = ['Length', 'MinLen', 'MaxLen', 'GC%', 'Count', 'Mean', 'Media']
+    for nx in sorted(nx_lst, reverse=True):
+        head_lst.extend([f'L{nx}', f'N{nx}'])
+    return head_lst
+
+def assembly_statistics(fafile, nx_lst=NX_THRESHOLDS, chunk_size=CHUNK_SIZE):
+    '''Calculate assembly statistics in a single streaming pass
+
+    Bases are tallied chunk by chunk with bytes.translate, only an array of
+    contig lengths is kept, so memory grows with the number of
+    contigs, not with the number of bases.
+
+    Statistic values : Length, MinLen, MaxLen, GC%, Count, Mean, Media, CountN, Nx, Lx
+
+    Args:
+        fafile (str): a file name with corresponding path, the file must be in FASTA format(.gz allowed)
+        nx_lst (tuple): Nx thresholds in percent. Default: (90, 75, 50, 25)
+        chunk_size (int): number of bytes read per chunk
+
+    Return:
+        dict: A dictionary contains sequence statistic values
+    '''
+    # the translated chunk is read as one big integer, masking a class bit in
+    # every byte and popcounting gives the count of that class. This is several
+    # times faster than bytes.count on chunks where half of the bytes match.
+    gc_mask = int.from_bytes(b'\x01' * chunk_size, 'little')
+    at_mask = gc_mask << 1
+    n_mask = gc_mask << 2
+
+    contig_len_arr = array('Q')
+    contig_len = None
+    number_at = 0
+    number_gc = 0
+    count_N = 0
+    for header, chunk in iter_fasta_chunks(fafile, chunk_size=chunk_size):
+        if header is not None:
+            if contig_len is not None:
+                contig_len_arr.append(contig_len)
+            contig_len = 0
+        contig_len += len(chunk)
+        class_bits = int.from_bytes(chunk.translate(_BASE_CLASS), 'little')
+        number_gc += (class_bits & gc_mask).bit_count()
+        number_at += (class_bits & at_mask).bit_count()
+        count_N += (class_bits & n_mask).bit_count()
+    if contig_len is not None:
+        contig_len_arr.append(contig_len)
+
+    statistics_dict = {key: None for key in assembly_statistics_header(nx_lst)}
+    statistics_dict['Count'] = len(contig_len_arr)
+    statistics_dict['CountN'] = count_N
+    if not contig_len_arr:
+        return statistics_dict
+
+    sorted_len_lst = sorted(contig_len_arr, reverse=True)
+    del contig_len_arr
+    length = sum(sorted_len_lst)
+    num_contigs = len(sorted_len_lst)
+    statistics_dict['Length'] = length
+    statistics_dict['MinLen'] = sorted_len_lst[-1]
+    statistics_dict['MaxLen'] = sorted_len_lst[0]
+    statistics_dict['Mean'] = int(length / num_contigs)
+    if num_contigs % 2 == 0:
+        statistics_dict['Media'] = int((sorted_len_lst[num_contigs // 2] + sorted_len_lst[num_contigs // 2 - 1]) / 2)
+    else:
+        statistics_dict['Media'] = sorted_len_lst[num_contigs // 2]
+
+    number_atgc = number_at + number_gc
+    gc_content = number_gc / number_atgc * 100 if number_atgc else 0
+    statistics_dict['GC%'] = round(gc_content, 4)
+    statistics_dict.update(nx_statistics(sorted_len_lst, length, nx_lst))
+    return statistics_dict
+
+def contig_lengths(fafile, full_header=True):
+    '''Lengths of the sequences in a FASTA file(.gz allowed), read without assembling them
+
+    Args:
+        fafile (str): a file name with corresponding path
+        full_header (bool): key by the entire header line instead of the first field
+
+    Return:
+        dict: {identifier: length}
+    '''
+    return dict(read_fasta(fafile, length_only=True, full_header=full_header))
+
+class FastaRecord():
+    '''One FASTA record as read from the file, header and sequence lines kept verbatim
+
+    Args:
+        header (bytes): header line, '>' and line end included
+        line_lst (list): sequence lines (bytes) with their line ends
+    '''
+    __slots__ = ('header', 'line_lst', '__seq')
+
+    def __init__(self, header, line_lst):
+        self.header = header
+        self.line_lst = line_lst
+        self.__seq = None
+
+    @property
+    def id(self):
+        fields = self.header[1:].split(None, 1)
+        return fields[0].decode() if fields else ''
+
+    @property
+    def seq(self):
+        '''sequence bytes without line breaks and blanks, computed once
+        '''
+        if self.__seq is None:
+            self.__seq = b''.join(self.line_lst).translate(None, _WHITESPACE)
+        return self.__seq
+
+    def __len__(self):
+        return len(self.seq)
+
+    def write(self, outfh, line_width=None):
+        '''write the record as read, or rewrapped to line_width residues per line
+        '''
+        outfh.write(self.header)
+        if line_width is None:
+            outfh.writelines(self.line_lst)
+            return
+        seq = self.seq
+        outfh.writelines(seq[i:i + line_width] + b'\n' for i in range(0, len(seq), line_width))
+
+def iter_fasta_records(fafile):
+    '''Iterate over the records of a FASTA file(.gz allowed, '-' for stdin) one at a time
+
+    Yield:
+        FastaRecord
+    '''
+    header = None
+    line_lst = []
+    with open_fasta(fafile, 'rb') as infh:
+        for line in infh:
+            if line.startswith(b'>'):
+                if header is not None:
+                    yield FastaRecord(header, line_lst)
+                header = line if line.endswith(b'\n') else line + b'\n'
+                line_lst = []
+            elif header is not None:
+                line_lst.append(line if line.endswith(b'\n') else line + b'\n')
+    if header is not None:
+        yield FastaRecord(header, line_lst)
+
+def _named(predicate, name):
+    predicate.__name__ = name
+    return predicate
+
+def min_length_filter(min_length):
+    '''Predicate: the sequence has at least min_length residues
+    '''
+    return _named(lambda record: len(record) >= min_length, f'length>={min_length}')
+
+def max_length_filter(max_length):
+    '''Predicate: the sequence has at most max_length residues
+    '''
+    return _named(lambda record: len(record) <= max_length, f'length<={max_length}')
+
+def start_residue_filter(residues='M'):
+    '''Predicate: the sequence starts with one of residues, case-insensitive
+    '''
+    start_tuple = tuple(residue.encode() for residue in residues.upper() + residues.lower())
+    return _named(lambda record: record.seq.startswith(start_tuple), f'start={residues}')
+
+def alphabet_filter(letters, trailing='*'):
+    '''Predicate: the sequence holds only letters (case-insensitive), trailing characters such as a stop '*' excepted
+
+    Checked with bytes.translate, which deletes the allowed letters in C; a valid
+    sequence leaves nothing behind.
+    '''
+    allowed = (letters.upper() + letters.lower()).encode()
+    trailing = trailing.encode()
+    return _named(lambda record: not record.seq.rstrip(trailing).translate(None, allowed), f'alphabet={letters}')
+
+def id_filter(id_set, exclude=False):
+    '''Predicate: the record ID (first word of the header) is in id_set, or is not with exclude=True
+    '''
+    id_set = set(id_set)
+    if exclude:
+        return _named(lambda record: record.id not in id_set, 'id_not_listed')
+    return _named(lambda record: record.id in id_set, 'id_listed')
+
+def open_output(filename, compress=None):
+    '''Open a binary output file, gzip-compressed when compress is True or, by default, when it ends with .gz
+    '''
+    if compress is None:
+        compress = filename.endswith('.gz')
+    return gzip.open(filename, 'wb', compresslevel=6) if compress else open(filename, 'wb')
+
+def filter_fasta(fafile, predicate_lst, passed_file, failed_file=None, compress=None, line_width=None):
+    '''Stream a FASTA file through a chain of predicates, writing every record as it is decided
+
+    Records passing every predicate go to passed_file, the others to failed_file
+    if given. Only the current record is held in memory.
+
+        counter = filter_fasta('in.faa.gz', [min_length_filter(50), start_residue_filter('M')],
+                               'pass.faa.gz', 'notpass.faa.gz')
+
+    Args:
+        fafile (str): input FASTA file(.gz allowed)
+        predicate_lst (list): functions FastaRecord -> bool, applied in order
+        passed_file (str): output of the passed records
+        failed_file (str): output of the failed records, optional
+        compress (bool): gzip the outputs, default by their .gz suffix
+        line_width (int): rewrap the sequences, default keep the input lines
+
+    Return:
+        collections.Counter: 'passed', 'failed' and, per predicate name, the records it rejected first
+    '''
+    counter = collections.Counter()
+    passed_fh = open_output(passed_file, compress)
+    failed_fh = open_output(failed_file, compress) if failed_file else None
+    try:
+        for record in iter_fasta_records(fafile):
+            for predicate in predicate_lst:
+                if not predicate(record):
+                    counter['failed'] += 1
+                    counter[predicate.__name__] += 1
+                    if failed_fh is not None:
+                        record.write(failed_fh, line_width)
+                    break
+            else:
+                counter['passed'] += 1
+                record.write(passed_fh, line_width)
+    finally:
+        passed_fh.close()
+        if failed_fh is not None:
+            failed_fh.close()
+    return counter
+
+def iter_blast_tab(blastfile):
+    '''Stream the hits of a tabular BLAST output (-outfmt 6 or "6 std qlen slen")
+
+    Args:
+        blastfile (str): BLAST output file name, '-' for stdin, may be gzipped
+
+    Return:
+        iterator: hit fields as a list of str
+    '''
+    with open_fasta(blastfile, 'rt') as infh:
+        for line in infh:
+            if line.startswith('#') or not line.strip():
+                continue
+            yield line.rstrip('\n').split('\t')
+
+def best_blast_hits(hit_iter, key_func=lambda hit: hit[0], k=1, rank=('bitscore',), min_identity=None):
+    '''Keep the top-k hits of every key while streaming through BLAST hits
+
+    Each key holds a heap of at most k hits, so memory depends on the number of
+    keys and k, not on the size of the BLAST table. Hits with equal rank are kept
+    in input order.
+
+    Args:
+        hit_iter (iterator): hits as lists of fields, e.g. from iter_blast_tab()
+        key_func (function): hit -> key, default the query id
+        k (int): number of hits kept per key
+        rank (tuple): names in BLAST_RANK_KEYS, compared in order, higher is better
+        min_identity (float): drop hits with a lower percent identity
+
+    Return:
+        dict: {key: [hit, ...]}, best hit first
+    '''
+    if isinstance(rank, str):
+        rank = (rank,)
+    rank_func_lst = [BLAST_RANK_KEYS[name] for name in rank]
+    heap_dict = {}
+    for order, hit in enumerate(hit_iter):
+        if min_identity is not None and float(hit[2]) < min_identity:
+            continue
+        item = (tuple(rank_func(hit) for rank_func in rank_func_lst), -order, hit)
+        heap = heap_dict.setdefault(key_func(hit), [])
+        if len(heap) < k:
+            heapq.heappush(heap, item)
+        elif item[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, item)
+    return {key: [item[2] for item in sorted(heap, key=lambda item: item[:2], reverse=True)]
+            for key, heap in heap_dict.items()}
+
+class FastaIndex():
+    '''Random access to a plain FASTA file through a samtools faidx style .fai index
+
+    The index (NAME, LENGTH, OFFSET, LINEBASES, LINEWIDTH per sequence) is read
+    from <fafile>.fai when it is not older than the FASTA file, otherwise it is
+    built in one pass and written next to the FASTA file when the directory is
+    writable. Regions are sliced out of a read-only mmap of the FASTA file, so a
+    fetch costs O(region) no matter how large the genome is.
+
+        with FastaIndex('genome.fna') as genome:
+            seq = genome.fetch('contig_1', 1001, 2000)
+
+    Args:
+        fafile (str): FASTA file name, not compressed
+    '''
+    def __init__(self, fafile):
+        self.fafile = fafile
+        self.fai = fafile + '.fai'
+        if os.path.exists(self.fai) and os.path.getmtime(self.fai) >= os.path.getmtime(fafile):
+            self.index = self.read_fai(self.fai)
+        else:
+            self.index = self.build(fafile)
+            try:
+                self.write_fai(self.fai)
+            except OSError:
+                pass
+        self.__fh = open(fafile, 'rb')
+        if os.fstat(self.__fh.fileno()).st_size:
+            self.__mm = mmap.mmap(self.__fh.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.__mm = b''
+
+    @staticmethod
+    def build(fafile):
+        '''Index a FASTA file, lines of a sequence must share one width except the last
+
+        Args:
+            fafile (str): FASTA file name
+
+        Return:
+            dict: {seq_id: (length, offset, linebases, linewidth)}
+        '''
+        if fafile.endswith('.gz'):
+            raise ValueError(f'{fafile}: cannot index a gzipped FASTA file, decompress it first')
+        index = {}
+
+        def close_record():
+            if seq_id in index:
+                raise ValueError(f'{fafile}: duplicated sequence name {seq_id}')
+            index[seq_id] = (length, offset, linebases, linewidth)
+
+        seq_id = None
+        position = 0
+        with open(fafile, 'rb') as infh:
+            for line in infh:
+                if line.startswith(b'>'):
+                    if seq_id is not None:
+                        close_record()
+                    seq_id = line[1:].split(None, 1)[0].decode() if line[1:].strip() else ''
+                    offset = position + len(line)
+                    length = linebases = linewidth = 0
+                    last_line = False
+                elif seq_id is not None:
+                    bases = len(line.rstrip(b'\r\n'))
+                    if bases:
+                        if last_line:
+                            raise ValueError(f'{fafile}: different line length in sequence {seq_id}')
+                        if linebases == 0:
+                            linebases, linewidth = bases, len(line)
+                        elif bases != linebases or len(line) != linewidth:
+                            last_line = True
+                            if bases > linebases:
+                                raise ValueError(f'{fafile}: different line length in sequence {seq_id}')
+                        length += bases
+                    elif length:
+                        last_line = True
+                position += len(line)
+        if seq_id is not None:
+            close_record()
+        return index
+
+    @staticmethod
+    def read_fai(fai):
+        index = {}
+        with open(fai, 'rt') as infh:
+            for line in infh:
+                seq_id, length, offset, linebases, linewidth = line.rstrip('\n').split('\t')[:5]
+                index[seq_id] = (int(length), int(offset), int(linebases), int(linewidth))
+        return index
+
+    def write_fai(self, fai):
+        with open(fai + '.tmp', 'wt') as outfh:
+            for seq_id, record in self.index.items():
+                outfh.write(seq_id + '\t' + '\t'.join(map(str, record)) + '\n')
+        os.replace(fai + '.tmp', fai)
+
+    def __contains__(self, seq_id):
+        return seq_id in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __getitem__(self, seq_id):
+        return self.fetch(seq_id)
+
+    def length(self, seq_id):
+        return self.index[seq_id][0]
+
+    def fetch(self, seq_id, start=1, end=None):
+        '''Sequence of a region, coordinates are 1-based and inclusive
+
+        Out of range coordinates are clipped to the sequence, as samtools faidx does.
+
+        Args:
+            seq_id (str): sequence name, the first word of the header
+            start (int): first base
+            end (int): last base, default the end of the sequence
+
+        Return:
+            str: sequence of the region, empty when the region is empty
+        '''
+        length, offset, linebases, linewidth = self.index[seq_id]
+        start = max(start, 1) - 1
+        end = length if end is None else min(end, length)
+        if start >= end:
+            return ''
+        first = offset + start // linebases * linewidth + start % linebases
+        last = offset + (end - 1) // linebases * linewidth + (end - 1) % linebases + 1
+        return self.__mm[first:last].translate(None, b'\r\n').decode()
+
+    def fetch_regions(self, region_lst):
+        '''Sequences of many regions, read in order of their offset in the file
+
+        Args:
+            region_lst (list): (seq_id, start, end) tuples, 1-based and inclusive
+
+        Return:
+            list: sequences in the order of region_lst, None for unknown sequence names
+        '''
+        seq_lst = [None] * len(region_lst)
+        order_lst = sorted((self.index[seq_id][1], start, num)
+                           for num, (seq_id, start, _) in enumerate(region_lst) if seq_id in self.index)
+        for _, _, num in order_lst:
+            seq_lst[num] = self.fetch(*region_lst[num])
+        return seq_lst
+
+    def close(self):
+        if isinstance(self.__mm, mmap.mmap):
+            self.__mm.close()
+        self.__fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def fetch_regions(fafile, region_lst):
+    '''Sequences of many regions of a FASTA file, through its .fai index when possible
+
+    Plain FASTA files are indexed (or their .fai reused) and only the regions are
+    read. Gzipped or irregularly wrapped files are streamed once instead, keeping
+    only the current record.
+
+    Args:
+        fafile (str): FASTA file name(.gz allowed)
+        region_lst (list): (seq_id, start, end) tuples, 1-based and inclusive, end may be None
+
+    Return:
+        list: sequences in the order of region_lst, None for unknown sequence names
+    '''
+    try:
+        fa_index = FastaIndex(fafile)
+    except ValueError:
+        fa_index = None
+    if fa_index is not None:
+        with fa_index:
+            return fa_index.fetch_regions(region_lst)
+
+    region_dict = collections.defaultdict(list)
+    for num, (seq_id, _, _) in enumerate(region_lst):
+        region_dict[seq_id].append(num)
+    seq_lst = [None] * len(region_lst)
+    for seq_id, seq in read_fasta(fafile):
+        for num in region_dict.get(seq_id, []):
+            _, start, end = region_lst[num]
+            seq_lst[num] = seq[max(start, 1) - 1:end]
+    return seq_lst
+
+class StatisticsCache():
+    '''Persistent per-file statistics cache stored in a SQLite database
+
+    An entry is keyed by the kind of statistics and the absolute input paths,
+    and is only returned while the inputs keep the same size and mtime (and
+    content hash, when use_hash=True). Values must be JSON serializable.
+
+        cache = StatisticsCache('genome_stats.sqlite')
+        value = cache.get('n50', ['genome.fna'])
+        if value is None:
+            value = compute('genome.fna')
+            cache.set('n50', ['genome.fna'], value)
+        cache.close()
+
+    Args:
+        dbfile (str): SQLite database file, created when missing
+        use_hash (bool): add a SHA-256 of the file content to the fingerprint
+        refresh (bool): ignore stored entries, recompute and overwrite them
+    '''
+    def __init__(self, dbfile, use_hash=False, refresh=False):
+        self.dbfile = dbfile
+        self.use_hash = use_hash
+        self.refresh = refresh
+        self.__conn = sqlite3.connect(dbfile)
+        self.__conn.execute('''CREATE TABLE IF NOT EXISTS statistics (
+                                   key TEXT PRIMARY KEY,
+                                   fingerprint TEXT NOT NULL,
+                                   value TEXT NOT NULL,
+                                   updated REAL NOT NULL)''')
+        self.__conn.commit()
+
+    @staticmethod
+    def _key(kind, path_lst):
+        return '\t'.join([kind] + [os.path.abspath(path) for path in path_lst])
+
+    def fingerprint(self, path_lst):
+        '''Fingerprint of the input files: size, mtime and optional content hash
+
+        Args:
+            path_lst (list): input file names
+
+        Return:
+            str: JSON encoded fingerprint
+        '''
+        fingerprint_lst = []
+        for path in path_lst:
+            stat = os.stat(path)
+            file_fingerprint = [stat.st_size, stat.st_mtime_ns]
+            if self.use_hash:
+                sha256 = hashlib.sha256()
+                with open(path, 'rb') as fh:
+                    for block in iter(partial(fh.read, CHUNK_SIZE), b''):
+                        sha256.update(block)
+                file_fingerprint.append(sha256.hexdigest())
+            fingerprint_lst.append(file_fingerprint)
+        return json.dumps(fingerprint_lst)
+
+    def get(self, kind, path_lst):
+        '''Cached value for the input files, None on a miss or a stale entry
+
+        Args:
+            kind (str): name of the statistics, including any parameters
+            path_lst (list): input file names
+
+        Return:
+            cached value or None
+        '''
+        if self.refresh:
+            return None
+        row = self.__conn.execute('SELECT fingerprint, value FROM statistics WHERE key = ?',
+                                  (self._key(kind, path_lst),)).fetchone()
+        if row is None or row[0] != self.fingerprint(path_lst):
+            return None
+        return json.loads(row[1])
+
+    def set(self, kind, path_lst, value):
+        '''Store the value computed for the input files
+
+        Args:
+            kind (str): name of the statistics, including any parameters
+            path_lst (list): input file names
+            value: JSON serializable result
+        '''
+        self.__conn.execute('INSERT OR REPLACE INTO statistics VALUES (?, ?, ?, ?)',
+                            (self._key(kind, path_lst), self.fingerprint(path_lst),
+                             json.dumps(value), time.time()))
+        self.__conn.commit()
+
+    def close(self):
+        self.__conn.close()
+
+def add_cache_arguments(parser):
+    '''Add the statistics cache options to an argparse parser
+
+    Args:
+        parser (object): argparse.ArgumentParser
+    '''
+    parser.add_argument('--cache',
+                        metavar='<stats.sqlite>',
+                        type=str,
+                        help='reuse statistics of unchanged files stored in this SQLite file (created if missing)')
+    parser.add_argument('--cache-hash',
+                        action='store_true',
+                        help='also compare a SHA-256 of the file content, not only path, size and mtime')
+    parser.add_argument('--refresh-cache',
+                        action='store_true',
+                        help='recompute every input and overwrite its cache entry')
+    parser.add_argument('--no-cache',
+                        action='store_true',
+                        help='bypass the cache, neither read nor write it')
+
+def open_cache(args):
+    '''Open the StatisticsCache requested by the options of add_cache_arguments
+
+    Args:
+        args (object): parsed command-line arguments
+
+    Return:
+        StatisticsCache or None
+    '''
+    if not args.cache or args.no_cache:
+        return None
+    return StatisticsCache(args.cache, use_hash=args.cache_hash, refresh=args.refresh_cache)
+
+def map_assemblies(func, fa_lst, processes=1, cache=None, **kwargs):
+    '''Apply func(fafile, **kwargs) to every assembly, one whole assembly per task
+
+    With processes > 1 the assemblies are spread across a process pool. Results
+    stream back in input order as soon as they are ready, so a slow genome only
+    holds back the rows after it, not the whole run. With a cache, unchanged
+    assemblies are answered from it and only new or modified ones are computed.
+
+    Args:
+        func (function): module-level function taking a FASTA file name, e.g. assembly_statistics
+        fa_lst (list): FASTA file names
+        processes (int): number of worker processes. Default: 1, no pool
+        cache (StatisticsCache): optional statistics cache
+        kwargs: passed to func
+
+    Yield:
+        tuple: (fafile, func result)
+    '''
+    worker = partial(func, **kwargs)
+    kind = func.__name__ + ':' + json.dumps(kwargs, sort_keys=True)
+
+    cached_lst = [cache.get(kind, [fafile]) if cache else None for fafile in fa_lst]
+    todo_lst = [fafile for fafile, value in zip(fa_lst, cached_lst) if value is None]
+    if processes <= 1 or len(todo_lst) <= 1:
+        result_iter = map(worker, todo_lst)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(min(processes, len(todo_lst)))
+        result_iter = pool.imap(worker, todo_lst, chunksize=1)
+
+    try:
+        for fafile, value in zip(fa_lst, cached_lst):
+            if value is None:
+                value = next(result_iter)
+                if cache:
+                    cache.set(kind, [fafile], value)
+            yield fafile, value
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+def write_statistics_table(fa_lst, head_lst, nx_lst=NX_THRESHOLDS, processes=1, cache=None,
+                           header=True, basename=True, outfh=sys.stdout):
+    '''Write one tab-separated row of assembly_statistics per assembly
+
+    Shared by stat_assembly.py and n50.py.
+
+    Args:
+        fa_lst (list): FASTA file names
+        head_lst (list): statistic columns to output, see assembly_statistics_header
+        nx_lst (tuple): Nx thresholds in percent
+        processes (int): number of worker processes
+        cache (StatisticsCache): optional statistics cache
+        header (bool): write the 'File' header line first
+        basename (bool): report the file name without directories
+        outfh (file): output handle. Default: stdout
+
+    Return:
+        NULL
+    '''
+    if header:
+        print('File' + '\t' + '\t'.join(head_lst), file=outfh, flush=True)
+    for fafile, statistics_dict in map_assemblies(assembly_statistics, fa_lst, processes, cache, nx_lst=list(nx_lst)):
+        stat_lst = [str(statistics_dict.get(key)) for key in head_lst]
+        filename = os.path.basename(fafile) if basename else fafile
+        print(filename + '\t' + '\t'.join(stat_lst), file=outfh, flush=True)
+
+def _full_header(header):
+    return header
+
+def iter_alignment(msafile, parse_id=_full_header):
+    '''Stream the records of a FASTA alignment as (taxon, sequence bytes)
+
+    Args:
+        msafile (str): FASTA alignment, may be gzipped
+        parse_id (function): header (without '>') -> taxon label, default the whole header
+
+    Return:
+        iterator: (taxon, sequence) tuples, sequence lines joined without line ends
+    '''
+    taxon = None
+    chunk_lst = []
+    with open_fasta(msafile, 'rb') as infh:
+        for line in infh:
+            if line.startswith(b'>'):
+                if taxon is not None:
+                    yield taxon, b''.join(chunk_lst)
+                taxon = parse_id(line[1:].rstrip(b'\r\n').decode())
+                chunk_lst = []
+            else:
+                chunk_lst.append(line.rstrip(b'\r\n'))
+    if taxon is not None:
+        yield taxon, b''.join(chunk_lst)
+
+def map_in_order(func, item_lst, threads=1, max_pending=None):
+    '''Apply func to every item on a thread pool, yielding results in input order
+
+    Only max_pending items are submitted ahead of the result being yielded, which
+    bounds the results held in memory however long item_lst is. Threads suit
+    I/O-bound work such as reading many small files from a network filesystem.
+
+    Args:
+        func (function): item -> result
+        item_lst (iterable): items
+        threads (int): worker threads, 1 runs in the calling thread
+        max_pending (int): items in flight, default 2 * threads
+
+    Yield:
+        results of func, in the order of item_lst
+    '''
+    if threads <= 1:
+        for item in item_lst:
+            yield func(item)
+        return
+    max_pending = max_pending or 2 * threads
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        pending = collections.deque()
+        for item in item_lst:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def _report_throughput(log, action, num_files, num_bytes, start):
+    if log is None:
+        return
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    print(f'{action} {num_files} alignments, {num_bytes / 1e6:.1f} MB in {elapsed:.2f}s: '
+          f'{num_files / elapsed:.1f} files/s, {num_bytes / 1e6 / elapsed:.1f} MB/s', file=log, flush=True)
+
+def _scan_alignment(msa, parse_id):
+    start = time.perf_counter()
+    taxa_dict = {}
+    length = 0
+    for num, (taxon, seq) in enumerate(iter_alignment(msa, parse_id)):
+        if num == 0:
+            length = len(seq)
+        elif len(seq) != length:
+            raise ValueError(f'{msa}: {taxon} is {len(seq)} long, the alignment is {length}')
+        taxa_dict[taxon] = None
+    return list(taxa_dict), length, os.path.getsize(msa), time.perf_counter() - start
+
+def scan_alignments(msa_lst, parse_id=_full_header, threads=1, log=None):
+    '''First pass over alignments: taxa and length of each, sequences are not kept
+
+    Args:
+        msa_lst (list): FASTA alignment files
+        parse_id (function): header -> taxon label
+        threads (int): alignment files read concurrently
+        log (file): if given, a line per file and the total throughput are printed to it
+
+    Return:
+        tuple: (taxa_lst in order of first appearance, {msa: length}, {msa: set of taxa})
+
+    Raise:
+        ValueError: if the rows of an alignment differ in length
+    '''
+    taxa_dict = {}
+    length_dict = {}
+    msa_taxa_dict = {}
+    max_name_length = max([len(msa) for msa in msa_lst], default=0)
+    total_bytes = 0
+    start = time.perf_counter()
+    results = map_in_order(partial(_scan_alignment, parse_id=parse_id), msa_lst, threads)
+    for num, (msa, (taxa_lst, length, num_bytes, seconds)) in enumerate(zip(msa_lst, results), start=1):
+        length_dict[msa] = length
+        msa_taxa_dict[msa] = set(taxa_lst)
+        taxa_dict.update(dict.fromkeys(taxa_lst))
+        total_bytes += num_bytes
+        if log is not None:
+            print(f'Parsing {msa:{max_name_length}} length:{length:0>5} taxa:{len(taxa_lst)} '
+                  f'{num_bytes / 1e6 / max(seconds, 1e-9):.1f} MB/s [{num:04}/{len(msa_lst)}]', file=log, flush=True)
+    _report_throughput(log, 'Scanned', len(msa_lst), total_bytes, start)
+    return list(taxa_dict), length_dict, msa_taxa_dict
+
+def _write_alignment_block(task, fd, parse_id, row_dict, taxa_lst, pad_buf):
+    msa, msa_length, column, msa_taxa_set = task
+    for taxon, seq in iter_alignment(msa, parse_id):
+        if len(seq) != msa_length:
+            raise ValueError(f'{msa}: {taxon} is {len(seq)} long, the alignment is {msa_length}')
+        os.pwrite(fd, seq, row_dict[taxon] + column)
+    missing_lst = [taxon for taxon in taxa_lst if taxon not in msa_taxa_set]
+    for taxon in missing_lst:
+        os.pwrite(fd, pad_buf[:msa_length], row_dict[taxon] + column)
+    return missing_lst
+
+def write_supermatrix(msa_lst, outfile, pad='?', parse_id=_full_header, scan=None, threads=1, log=None):
+    '''Concatenate alignments into a FASTA supermatrix, one single-line row per taxon
+
+    After a first pass (scan_alignments) the position of every taxon row and every
+    alignment block is known, so the output is laid out at its final size and each
+    alignment is written into place with os.pwrite while it is read. Blocks never
+    overlap, so alignments can be read and written by several threads, and the
+    output does not depend on their number. Only the sequences being written are
+    held, and every missing taxon is padded from one shared buffer of pad characters.
+
+    Args:
+        msa_lst (list): FASTA alignment files, in concatenation order
+        outfile (str): output FASTA file
+        pad (str): character filling the blocks of missing taxa, '?' or '-'
+        parse_id (function): header -> taxon label
+        scan (tuple): result of scan_alignments(msa_lst, parse_id), if already done
+        threads (int): alignment files read and written concurrently
+        log (file): if given, progress and throughput are printed to it
+
+    Return:
+        tuple: (taxa_lst, {msa: length}, {msa: list of missing taxa})
+
+    Raise:
+        ValueError: if the rows of an alignment differ in length, the partial outfile is removed
+    '''
+    taxa_lst, length_dict, msa_taxa_dict = scan or scan_alignments(msa_lst, parse_id, threads, log)
+    total_length = sum(length_dict[msa] for msa in msa_lst)
+    pad_buf = memoryview(pad.encode() * max(length_dict.values(), default=0))
+
+    # row_dict: taxon -> offset of its sequence in the output file
+    row_dict = {}
+    offset = 0
+    for taxon in taxa_lst:
+        offset += len(f'>{taxon}\n'.encode())
+        row_dict[taxon] = offset
+        offset += total_length + 1
+
+    task_lst = []
+    column = 0
+    for msa in msa_lst:
+        task_lst.append((msa, length_dict[msa], column, msa_taxa_dict[msa]))
+        column += length_dict[msa]
+
+    missing_dict = {}
+    start = time.perf_counter()
+    try:
+        with open(outfile, 'wb') as outfh:
+            outfh.truncate(offset)
+            fd = outfh.fileno()
+            for taxon, row in row_dict.items():
+                header = f'>{taxon}\n'.encode()
+                os.pwrite(fd, header, row - len(header))
+                os.pwrite(fd, b'\n', row + total_length)
+
+            write_block = partial(_write_alignment_block, fd=fd, parse_id=parse_id, row_dict=row_dict,
+                                  taxa_lst=taxa_lst, pad_buf=pad_buf)
+            for msa, missing_lst in zip(msa_lst, map_in_order(write_block, task_lst, threads)):
+                missing_dict[msa] = missing_lst
+    except ValueError:
+        # a pre-sized output would be left half-filled with NUL bytes
+        os.remove(outfile)
+        raise
+    if log is not None:
+        _report_throughput(log, 'Joined', len(msa_lst), sum(os.path.getsize(msa) for msa in msa_lst), start)
+    return taxa_lst, length_dict, missing_dict
+
+def write_phylip(fafile, phyfile):
+    '''Convert a FASTA alignment, e.g. a supermatrix of write_supermatrix, to relaxed sequential PHYLIP
+
+    The alignment is streamed twice, a first pass counting taxa and sites, so only
+    one row is held at a time. Whitespace in the labels is replaced by '_'.
+
+    Args:
+        fafile (str): FASTA alignment file(.gz allowed)
+        phyfile (str): output PHYLIP file
+
+    Return:
+        tuple: (ntax, nchar)
+    '''
+    length_set = set()
+    ntax = 0
+    for _, seq_len in read_fasta(fafile, length_only=True):
+        length_set.add(seq_len)
+        ntax += 1
+    if len(length_set) > 1:
+        raise ValueError(f'{fafile} is not an alignment, its sequences have {len(length_set)} different lengths')
+    nchar = length_set.pop() if length_set else 0
+    with open(phyfile, 'wt') as outfh:
+        outfh.write(f'{ntax} {nchar}\n')
+        for header, seq in read_fasta(fafile, full_header=True):
+            outfh.write(f'{"_".join(header.split())} {seq}\n')
+    return ntax, nchar
+
+def gff3_root(featureid, parent_dict):
+    '''The top ancestor of a GFF3 feature, usually its gene
+
+    Args:
+        featureid (str): feature ID
+        parent_dict (dict): {featureid: parentid} of every feature with a Parent
+
+    Return:
+        str: ID of the ancestor without a Parent, featureid itself if it has none
+    '''
+    while featureid in parent_dict:
+        featureid = parent_dict[featureid]
+    return featureid
+
+class GFF3Graph():
+    '''Feature graph of a GFF3 file (.gz allowed, '-' for stdin) built in one streaming pass
+
+    gene -> mRNA/transcript -> exon/CDS/UTR... links are kept in dicts keyed by
+    ID, every line is recorded with its byte offset and owner (its ID, or its
+    Parent when it has no ID, e.g. most exons), so a selection of features is
+    written back by replaying only their lines. Input that cannot be seeked
+    (stdin, .gz) keeps the raw lines instead of offsets.
+
+        graph = GFF3Graph('genes.gff3')
+        for geneid in graph.genes:
+            transcriptid = max(graph.transcripts(geneid), key=graph.cds_length)
+        graph.write(sys.stdout, graph.descendants(geneid))
+
+    Args:
+        gff3 (str): GFF3 file name
+    '''
+    TRANSCRIPT_TYPES = ('mRNA', 'transcript')
+
+    def __init__(self, gff3):
+        self.gff3 = gff3
+        self.genes = {}
+        self.features = {}
+        self.parent = {}
+        self.children = collections.defaultdict(list)
+        self.__cds_length = collections.defaultdict(int)
+        self.__offsets = array('q')
+        self.__owners = []
+        self.__lines = None
+        self.__read()
+
+    @staticmethod
+    def parse_attrs(attrs):
+        '''ID and first Parent of a GFF3 attribute column, None if absent
+        '''
+        featureid = None
+        parentid = None
+        for field in attrs.rstrip('\r\n').split(';'):
+            if field.startswith('ID='):
+                featureid = field[3:]
+            elif field.startswith('Parent='):
+                parentid = field[7:].split(',')[0]
+        return featureid, parentid
+
+    def __read(self):
+        seekable = self.gff3 != '-' and not self.gff3.endswith('.gz')
+        if not seekable:
+            self.__lines = []
+        offset = 0
+        with open_fasta(self.gff3, 'rb') as gff3fh:
+            for line in gff3fh:
+                if seekable:
+                    self.__offsets.append(offset)
+                    offset += len(line)
+                else:
+                    self.__lines.append(line)
+                if line.startswith(b'#') or not line.strip():
+                    self.__owners.append(None)
+                    continue
+                line_lst = line.decode().split('\t')
+                if len(line_lst) < 9:
+                    raise ValueError(f'unknown line in {self.gff3}: {line.decode().rstrip()}')
+                seqid, _, feature, start, end, _, strand = line_lst[:7]
+                featureid, parentid = self.parse_attrs(line_lst[8])
+                if feature == 'CDS' and parentid is not None:
+                    self.__cds_length[parentid] += int(end) - int(start) + 1
+                self.__owners.append(parentid if featureid is None else featureid)
+                if featureid is None or featureid in self.features:
+                    # split features such as CDS share one ID over several lines
+                    continue
+                self.features[featureid] = (seqid, feature, int(start), int(end), strand)
+                if feature == 'gene':
+                    self.genes[featureid] = self.children[featureid]
+                if parentid is not None:
+                    self.parent[featureid] = parentid
+                    self.children[parentid].append(featureid)
+
+    def root(self, featureid):
+        '''The top ancestor of a feature, usually its gene
+        '''
+        return gff3_root(featureid, self.parent)
+
+    def transcripts(self, geneid):
+        '''mRNA/transcript children of a gene, in file order
+        '''
+        return [childid for childid in self.children.get(geneid, [])
+                if self.features[childid][1] in self.TRANSCRIPT_TYPES]
+
+    def cds_length(self, transcriptid):
+        '''Summed length of the CDS lines of a transcript, 0 without CDS
+        '''
+        return self.__cds_length.get(transcriptid, 0)
+
+    def descendants(self, featureid):
+        '''A feature and everything below it
+
+        Return:
+            set: feature IDs
+        '''
+        featureid_set = set()
+        stack = [featureid]
+        while stack:
+            featureid = stack.pop()
+            featureid_set.add(featureid)
+            stack.extend(self.children.get(featureid, []))
+        return featureid_set
+
+    def replay(self, featureid_set, comments=True):
+        '''Lines owned by features of featureid_set (and comment lines), in file order
+
+        Yield:
+            str: lines with their line ends
+        '''
+        if self.__lines is not None:
+            for line, owner in zip(self.__lines, self.__owners):
+                if (owner is None and comments) or (owner is not None and owner in featureid_set):
+                    yield line.decode()
+            return
+        with open(self.gff3, 'rb') as gff3fh:
+            for offset, owner in zip(self.__offsets, self.__owners):
+                if (owner is None and comments) or (owner is not None and owner in featureid_set):
+                    gff3fh.seek(offset)
+                    yield gff3fh.readline().decode()
+
+    def write(self, outfh, featureid_set, comments=True):
+        for line in self.replay(featureid_set, comments):
+            outfh.write(line)
+
+class IntervalIndex():
+    '''Static interval tree over closed integer intervals, e.g. the genes of one contig
+
+    Intervals are sorted by start into integer arrays and every node of an
+    implicit binary tree laid over the sorted array keeps the largest end of
+    its subtree (the layout of Heng Li's cgranges). Building costs
+    O(n log n), each overlap query O(log n + hits).
+
+        gene_index = IntervalIndex()
+        for geneid, start, end in gene_lst:
+            gene_index.add(start, end, geneid)
+        for start, end, geneid in gene_index.overlap(1000, 2000):
+            ...
+
+    Args:
+        interval_lst (list): optional (start, end, label) tuples, 1-based and inclusive
+    '''
+    def __init__(self, interval_lst=None):
+        self.__pending = []
+        self.__starts = array('q')
+        self.__ends = array('q')
+        self.__max_ends = array('q')
+        self.__labels = []
+        self.__max_level = -1
+        for start, end, label in interval_lst or []:
+            self.add(start, end, label)
+
+    def add(self, start, end, label=None):
+        self.__pending.append((int(start), int(end), label))
+        self.__max_level = None
+
+    def __len__(self):
+        return len(self.__pending) if self.__max_level is None else len(self.__labels)
+
+    def __iter__(self):
+        if self.__max_level is None:
+            self.index()
+        return zip(self.__starts, self.__ends, self.__labels)
+
+    def index(self):
+        '''Sort the intervals and compute the subtree maxima, done by the first query if not called
+        '''
+        interval_lst = sorted(self.__pending, key=lambda interval: (interval[0], interval[1]))
+        self.__starts = array('q', [interval[0] for interval in interval_lst])
+        self.__ends = array('q', [interval[1] for interval in interval_lst])
+        self.__max_ends = array('q', self.__ends)
+        self.__labels = [interval[2] for interval in interval_lst]
+        n = len(interval_lst)
+        max_ends = self.__max_ends
+        max_level = -1
+        if n:
+            # leaves sit at even indices, a node at level k has its k lowest bits set
+            last_i = (n - 1) & ~1
+            last = max_ends[last_i]
+            level = 1
+            while (1 << level) <= n:
+                half = 1 << (level - 1)
+                for i in range((half << 1) - 1, n, half << 2):
+                    right = max_ends[i + half] if i + half < n else last
+                    max_ends[i] = max(max_ends[i], max_ends[i - half], right)
+                last_i = last_i - half if (last_i >> level) & 1 else last_i + half
+                if last_i < n and max_ends[last_i] > last:
+                    last = max_ends[last_i]
+                level += 1
+            max_level = level - 1
+        self.__max_level = max_level
+
+    def overlap(self, start, end):
+        '''Intervals overlapping [start, end], both ends inclusive
+
+        Return:
+            list: (start, end, label) tuples
+        '''
+        if self.__max_level is None:
+            self.index()
+        n = len(self.__labels)
+        if n == 0:
+            return []
+        starts, ends, max_ends, labels = self.__starts, self.__ends, self.__max_ends, self.__labels
+        hit_lst = []
+        stack = [(self.__max_level, (1 << self.__max_level) - 1, False)]
+        while stack:
+            level, i, left_done = stack.pop()
+            if level <= 3:
+                # small subtree, scan it linearly
+                i0 = i >> level << level
+                for j in range(i0, min(i0 + (1 << (level + 1)) - 1, n)):
+                    if starts[j] > end:
+                        break
+                    if ends[j] >= start:
+                        hit_lst.append((starts[j], ends[j], labels[j]))
+            elif not left_done:
+                stack.append((level, i, True))
+                left = i - (1 << (level - 1))
+                if left >= n or max_ends[left] >= start:
+                    stack.append((level - 1, left, False))
+            elif i < n and starts[i] <= end:
+                if ends[i] >= start:
+                    hit_lst.append((starts[i], ends[i], labels[i]))
+                stack.append((level - 1, i + (1 << (level - 1)), False))
+        return hit_lst
+
 def base_locater(fa_dict, seq_id, position_tuple):
     '''Get the base according position(s)
     
@@ -182,6 +1511,292 @@ def base_locater(fa_dict, seq_id, position_tuple):
             show_base = fa_dict[seq_id][pos]
             print(f'{pos:<{max_len_flag}} : {show_base}', file=sys.stdout, flush=True)
 
+def orthogroup_count_matrix(orthogroup_df, block_rows=20000):
+    '''Count the genes of every taxon in every orthogroup of an Orthogroups.tsv table
+
+    Cells hold comma-separated gene IDs ("g1, g2"), so a non-empty cell holds one
+    more gene than it has ', ' separators. A block of rows is joined into one
+    tab-separated byte buffer, and the separators falling between the cell
+    boundaries are counted with NumPy, without a Python call per cell.
+
+    Args:
+        orthogroup_df (pandas.DataFrame): orthogroups x taxa table of gene IDs
+        block_rows (int): rows joined per buffer, bounds the temporary memory
+
+    Return:
+        pandas.DataFrame: orthogroups x taxa table of int32 gene counts
+    '''
+    # numpy and pandas are only needed by the orthogroup helpers
+    import numpy as np
+    import pandas as pd
+
+    num_rows, num_cols = orthogroup_df.shape
+    counts = np.zeros((num_rows, num_cols), dtype=np.int32)
+    for start in range(0, num_rows, block_rows):
+        values = orthogroup_df.iloc[start:start + block_rows].fillna('').to_numpy(dtype=object)
+        buf = np.frombuffer('\t'.join(values.ravel().tolist()).encode(), dtype=np.uint8)
+        ends = np.append(np.flatnonzero(buf == 9), buf.size)
+        starts = np.append(0, ends[:-1] + 1)
+        separators = np.flatnonzero((buf[:-1] == 44) & (buf[1:] == 32))
+        block_counts = np.searchsorted(separators, ends) - np.searchsorted(separators, starts) + (ends > starts)
+        counts[start:start + len(values)] = block_counts.reshape(values.shape)
+    return pd.DataFrame(counts, index=orthogroup_df.index, columns=orthogroup_df.columns)
+
+def taxa_coverage_mask(count_df, taxa_coverage=100):
+    '''Boolean mask of orthogroups present in at least taxa_coverage percent of taxa
+
+    Args:
+        count_df (pandas.DataFrame): orthogroups x taxa gene counts
+        taxa_coverage (float): minimum percent of taxa with a gene
+
+    Return:
+        pandas.Series: True for orthogroups passing the coverage
+    '''
+    return (count_df > 0).sum(axis=1) * 100 >= taxa_coverage * count_df.shape[1]
+
+def single_copy_mask(count_df, taxa_coverage=100):
+    '''Boolean mask of single-copy orthogroups: no taxon has more than one gene,
+    and at least taxa_coverage percent of taxa have one
+
+    Args:
+        count_df (pandas.DataFrame): orthogroups x taxa gene counts
+        taxa_coverage (float): minimum percent of taxa with a gene, 100 means all taxa
+
+    Return:
+        pandas.Series: True for single-copy orthogroups
+    '''
+    return (count_df <= 1).all(axis=1) & taxa_coverage_mask(count_df, taxa_coverage)
+
+def _cache_is_fresh(cache_lst, tsv):
+    return all(os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(tsv) for cache in cache_lst)
+
+def read_orthogroup_table(tsv, gene_ids=True, use_cache=True):
+    '''Read an OrthoFinder Orthogroups.tsv (gene IDs) or Orthogroups.GeneCount.tsv table
+
+    The first read converts the text table into a binary cache next to it, later
+    reads load the cache while it is not older than the table. With pyarrow the
+    cache is Parquet (<tsv>.parquet for gene IDs, <tsv>.counts.parquet for counts),
+    otherwise one <tsv>.npz holding the int32 counts and the cells as a single
+    tab-joined byte table.
+
+    Args:
+        tsv (str): table file name, first column holds the orthogroup IDs
+        gene_ids (bool): True for gene ID cells, False for a table of gene counts
+        use_cache (bool): False reads the text table and leaves the cache untouched
+
+    Return:
+        tuple: (orthogroup_df, count_df), orthogroup_df is None when gene_ids=False
+    '''
+    # numpy and pandas are only needed by the orthogroup helpers
+    import numpy as np
+    import pandas as pd
+    try:
+        import pyarrow
+    except ImportError:
+        pyarrow = None
+
+    if pyarrow is not None:
+        cache_lst = [tsv + '.counts.parquet'] + ([tsv + '.parquet'] if gene_ids else [])
+    else:
+        cache_lst = [tsv + '.npz']
+
+    if use_cache and _cache_is_fresh(cache_lst, tsv):
+        if pyarrow is not None:
+            count_df = pd.read_parquet(cache_lst[0])
+            orthogroup_df = pd.read_parquet(cache_lst[1]) if gene_ids else None
+            return orthogroup_df, count_df
+        with np.load(cache_lst[0]) as npz:
+            index = pd.Index(npz['index'], name=str(npz['index_name']) or None)
+            columns = list(npz['columns'])
+            count_df = pd.DataFrame(npz['counts'], index=index, columns=columns)
+            orthogroup_df = None
+            if gene_ids:
+                if npz['counts'].size:
+                    cells = np.array(npz['cells'].tobytes().decode().split('\t'), dtype=object).reshape(npz['counts'].shape)
+                else:
+                    cells = np.empty(npz['counts'].shape, dtype=object)
+                cells[npz['counts'] == 0] = None
+                orthogroup_df = pd.DataFrame(cells, index=index, columns=columns)
+        return orthogroup_df, count_df
+
+    if gene_ids:
+        orthogroup_df = pd.read_table(tsv, index_col=0, dtype=str)
+        count_df = orthogroup_count_matrix(orthogroup_df)
+    else:
+        orthogroup_df = None
+        count_df = pd.read_table(tsv, index_col=0).astype('int32')
+    if not use_cache:
+        return orthogroup_df, count_df
+
+    # write the cache atomically, a read-only directory just means no cache
+    try:
+        if pyarrow is not None:
+            for cache, df in zip(cache_lst, [count_df, orthogroup_df]):
+                df.to_parquet(cache + '.tmp', engine='pyarrow')
+                os.replace(cache + '.tmp', cache)
+        else:
+            arrays = {'index': np.array(count_df.index, dtype=str),
+                      'index_name': np.array(count_df.index.name or ''),
+                      'columns': np.array(count_df.columns, dtype=str),
+                      'counts': count_df.to_numpy(dtype=np.int32)}
+            if gene_ids:
+                cells = orthogroup_df.fillna('').to_numpy(dtype=object).ravel().tolist()
+                arrays['cells'] = np.frombuffer('\t'.join(cells).encode(), dtype=np.uint8)
+            with open(cache_lst[0] + '.tmp', 'wb') as outfh:
+                np.savez(outfh, **arrays)
+            os.replace(cache_lst[0] + '.tmp', cache_lst[0])
+    except OSError:
+        pass
+    return orthogroup_df, count_df
+
+class PartitionScheme():
+    '''Partitions of a concatenated alignment and their models, in concatenation order
+
+    The lengths are collected once, e.g. from scan_alignments, and every partition
+    file format is emitted from this one model without reading the alignments
+    again. The table can be saved next to the outputs.
+
+        scheme = PartitionScheme()
+        for msa in msa_lst:
+            scheme.add(os.path.basename(msa).split('.')[0], length_dict[msa], model_dict[msa])
+        scheme.write('best_scheme.txt', 'nexus')
+        scheme.save('partition_lengths.tsv')
+
+    Args:
+        partition_lst (list): (label, length, model) tuples, model may be None
+    '''
+    FORMATS = ('nexus', 'raxml', 'mrbayes', 'partitionfinder')
+
+    # file suffix of each format used by write_formats
+    SUFFIXES = {'nexus': '.nex',
+                'raxml': '.raxml.txt',
+                'mrbayes': '.mrbayes.nex',
+                'partitionfinder': '.partition_finder.cfg'}
+
+    def __init__(self, partition_lst=None):
+        self.partition_lst = [tuple(partition) for partition in partition_lst or []]
+
+    def add(self, label, length, model=None):
+        self.partition_lst.append((label, length, model))
+
+    def __len__(self):
+        return len(self.partition_lst)
+
+    @property
+    def nchar(self):
+        return sum(length for _, length, _ in self.partition_lst)
+
+    def ranges(self):
+        '''(label, start, end, model) of every partition, 1-based and inclusive
+        '''
+        end = 0
+        range_lst = []
+        for label, length, model in self.partition_lst:
+            range_lst.append((label, end + 1, end + length, model))
+            end += length
+        return range_lst
+
+    def nexus(self, name='ModelFinder'):
+        '''IQ-TREE NEXUS: charset per partition and a charpartition with the models
+        '''
+        line_lst = ['#nexus', 'begin sets;']
+        for label, start, end, _ in self.ranges():
+            line_lst.append(f'charset {label} = {start}-{end};')
+        charpartition = ', '.join(f'{model}:{label}' for label, _, model in self.partition_lst)
+        line_lst.append(f'charpartition {name} = {charpartition};')
+        line_lst.append('end;')
+        return '\n'.join(line_lst) + '\n'
+
+    def raxml(self, group_by_model=False):
+        '''RAxML-NG (and IQ-TREE -q) scheme: "MODEL, label = start-end"
+
+        With group_by_model=True partitions sharing a model are merged into part_N
+        with comma separated ranges, in order of first appearance of the model.
+        '''
+        if not group_by_model:
+            return ''.join(f'{model}, {label} = {start}-{end}\n' for label, start, end, model in self.ranges())
+        model_range_dict = {}
+        for _, start, end, model in self.ranges():
+            model_range_dict.setdefault(model, []).append(f'{start}-{end}')
+        return ''.join(f'{model}, part_{num} = {", ".join(range_lst)}\n'
+                       for num, (model, range_lst) in enumerate(model_range_dict.items(), start=1))
+
+    def mrbayes(self, name='ModelFinder'):
+        '''MrBayes block commands: charsets SubsetN, the partition and lset/prset per subset
+
+        Models are IQ-TREE names mapped through MRBAYES_MODEL_MAP, ValueError for others.
+        '''
+        line_lst = []
+        for num, (_, start, end, _) in enumerate(self.ranges(), start=1):
+            line_lst.append(f'  charset Subset{num} = {start}-{end};')
+        subset_string = ', '.join(f'Subset{num}' for num in range(1, len(self) + 1))
+        line_lst.append(f'  partition {name} = {len(self)}:{subset_string};')
+        line_lst.append(f'  set partition={name};')
+        line_lst.append('')
+        for num, (_, _, model) in enumerate(self.partition_lst, start=1):
+            mrbayes_model = MRBAYES_MODEL_MAP.get(str(model).rstrip('4').replace('+F', ''))
+            if mrbayes_model is None:
+                raise ValueError(f'unknown model {model}')
+            if isinstance(mrbayes_model, list):
+                line_lst.append(f'  lset applyto=({num}) {mrbayes_model[0]};')
+                line_lst.append(f'  prset applyto=({num}) {mrbayes_model[1]};')
+            else:
+                line_lst.append(f'  lset applyto=({num}) {mrbayes_model};')
+        return '\n'.join(line_lst) + '\n'
+
+    def partitionfinder(self, alignment='concatenated.phy', models='all', model_selection='aicc', search='greedy'):
+        '''PartitionFinder2 partition_finder.cfg with one data block per partition
+
+        alignment is the PHYLIP file of the concatenation (see write_phylip), relative to the cfg
+        '''
+        line_lst = ['## ALIGNMENT FILE ##',
+                    f'alignment = {alignment};',
+                    '',
+                    '## BRANCHLENGTHS: linked | unlinked ##',
+                    'branchlengths = linked;',
+                    '',
+                    '## MODELS OF EVOLUTION: all | allx | mrbayes | beast | gamma | gammai | <list> ##',
+                    f'models = {models};',
+                    '',
+                    '# MODEL SELECTION: AIC | AICc | BIC #',
+                    f'model_selection = {model_selection};',
+                    '',
+                    '## DATA BLOCKS: see manual for how to define ##',
+                    '[data_blocks]']
+        for label, start, end, _ in self.ranges():
+            line_lst.append(f'{label} = {start}-{end};')
+        line_lst += ['',
+                     '## SCHEMES, search: all | user | greedy | rcluster | rclusterf | kmeans ##',
+                     '[schemes]',
+                     f'search = {search};']
+        return '\n'.join(line_lst) + '\n'
+
+    def write(self, outfile, fmt='nexus', **kwargs):
+        '''Write the scheme in one of FORMATS, kwargs go to the format method
+        '''
+        if fmt not in self.FORMATS:
+            raise ValueError(f'unknown partition format {fmt}, choose from {", ".join(self.FORMATS)}')
+        text = getattr(self, fmt)(**kwargs)
+        with open(outfile, 'wt') as outfh:
+            outfh.write(text)
+        return outfile
+
+    def write_formats(self, prefix, fmt_lst, format_kwargs=None):
+        '''Write every format of fmt_lst to prefix + SUFFIXES[fmt], return the filenames
+
+        format_kwargs maps a format to the kwargs of its method, e.g. {'partitionfinder': {'alignment': 'x.phy'}}
+        '''
+        format_kwargs = format_kwargs or {}
+        return [self.write(prefix + self.SUFFIXES[fmt], fmt, **format_kwargs.get(fmt, {})) for fmt in fmt_lst]
+
+    def save(self, tsv):
+        '''Save the length table: label, length and model, tab-delimited
+        '''
+        with open(tsv, 'wt') as outfh:
+            outfh.write('#label\tlength\tmodel\n')
+            for label, length, model in self.partition_lst:
+                outfh.write(f'{label}\t{length}\t{"" if model is None else model}\n')
+
 class Phylip():
     def __init__(self, infile='alignment.phy', filetype='sequential'):
         self.basename = os.path.basename(infile)
@@ -193,4 +1808,11 @@ class Phylip():
         infile_fh.close()
 
     def taxons(self):
-        
\ No newline at end of file
+        '''Taxon labels in the order of the alignment
+
+        Return:
+            list: taxon labels
+        '''
+        ntax = int(self.__line_lst[0].split()[0])
+        seq_line_lst = [line for line in self.__line_lst[1:] if line.strip()]
+        return [line.split()[0] for line in seq_line_lst[:ntax]]
@@ -8,6 +8,10 @@ to process VCF files with sizes >1GB. For small VCF files the algorithm slows
 down as the number of taxa increases (but is still fast).
 
 Any ploidy is allowed, but binary NEXUS is produced only for diploid VCFs.
+
+When NumPy is installed records are filtered and decoded in blocks, genotypes are turned into IUPAC
+codes through a lookup table instead of one record at a time, and the binary NEXUS genotypes are
+kept in memory packed 2 bits per genotype.
 """
 
 __author__      = "Edgardo M. Ortiz"
@@ -18,10 +22,20 @@ __date__        = "2023-07-07"
 
 import argparse
 import gzip
+import itertools
+import multiprocessing
 import random
+import shutil
+import struct
 import sys
 from pathlib import Path
 
+# NumPy is optional, without it every record goes through the per-record conversion
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 # Dictionary of IUPAC ambiguities for nucleotides
 # '*' is a deletion in GATK, deletions are ignored in consensus, lowercase consensus is used when an
 # 'N' or '*' is part of the genotype. Capitalization is used by some software but ignored by Geneious
@@ -60,6 +74,23 @@ GEN_BIN = {
 }
 
 
+# Bit assigned to each nucleotide of a genotype, the union of the bits of a genotype indexes the
+# AMBIG_LUT. Bits follow the sorted order of the characters so every AMBIG key maps to one mask
+NT_BITS = {"*": 1, "A": 2, "C": 4, "G": 8, "N": 16, "T": 32}
+
+# Lookup table from the nucleotide bit mask of a genotype to its IUPAC byte, 0 means no code
+AMBIG_LUT = bytearray(64)
+for _nts, _code in AMBIG.items():
+    AMBIG_LUT[sum(NT_BITS[_nt] for _nt in _nts)] = ord(_code)
+
+# Number of genotypes (records x samples) decoded together by the block engine
+BLOCK_GENOTYPES = 2000000
+
+# Bytes of transposed matrix held in memory at once when writing the output matrices, samples are
+# transposed in groups that fit, one sequential pass over the temporary file per group
+TRANSPOSE_MEMORY = 1024 * 1024 * 1024
+
+
 def extract_sample_names(vcf_file):
     """
     Extract sample names from VCF file
@@ -147,6 +178,404 @@ def get_matrix_column_bin(record, num_samples):
     return column
 
 
+def locate_genotypes(sample_buf, num_records, num_samples):
+    """
+    Locate the genotype (GT) subfield of every sample in 'sample_buf', the sample columns of a block
+    of records joined by tabs. Returns the buffer as uint8 padded with two zero bytes, so reads past
+    the end of the last genotype stay in bounds, and the (records x samples) start offsets and
+    lengths of the genotypes
+    """
+    buf = np.frombuffer(sample_buf, dtype=np.uint8)
+    starts = np.concatenate(([0], np.flatnonzero(buf == 9) + 1)).reshape(num_records, num_samples)
+
+    # The genotype is the first subfield, it ends at the first ':', tab or the end of the buffer
+    delim = np.flatnonzero((buf == 58) | (buf == 9))
+    delim = np.append(delim, len(buf))
+    gt_len = delim[np.searchsorted(delim, starts)] - starts
+    padded = np.concatenate((buf, np.zeros(2, dtype=np.uint8)))
+    return padded, starts, gt_len
+
+
+def decode_binary_block(sample_buf, num_records, num_samples):
+    """
+    Decode the genotypes of a block of biallelic SNP records into SNAPP codes with NumPy, the same
+    codes as GEN_BIN: 0 homozygous reference, 1 heterozygous, 2 homozygous alternative and 3 for
+    '?' (missing or not diploid). Returns a (records x samples) uint8 matrix
+    """
+    padded, starts, gt_len = locate_genotypes(sample_buf, num_records, num_samples)
+    first = padded[starts]
+    sep = padded[starts + 1]
+    second = padded[starts + 2]
+    diploid = (gt_len == 3) & ((sep == 47) | (sep == 124))
+    called = diploid & ((first == 48) | (first == 49)) & ((second == 48) | (second == 49))
+    return np.where(called, first.astype(np.uint8) + second - 96, 3).astype(np.uint8)
+
+
+class BinaryGenotypes:
+    """
+    Biallelic diploid genotypes of the binary NEXUS matrix packed 2 bits per genotype, four samples
+    per byte, in NumPy uint8 arrays. Blocks are kept sample-major so that the rows of the matrix are
+    read back without transposing the whole matrix
+    """
+    def __init__(self, num_samples):
+        self.num_samples = num_samples
+        self.num_sites = 0
+        self.blocks = []
+
+    def append(self, codes):
+        """
+        Pack a (sites x samples) matrix of SNAPP codes (0-3) and add it after the stored sites
+        """
+        if not len(codes):
+            return
+        padded = np.full((len(codes), -(-self.num_samples // 4) * 4), 3, dtype=np.uint8)
+        padded[:, :self.num_samples] = codes
+        packed = ((padded[:, 0::4] << 6) | (padded[:, 1::4] << 4) | (padded[:, 2::4] << 2)
+                  | padded[:, 3::4])
+        self.blocks.append(np.ascontiguousarray(packed.T))
+        self.num_sites += len(codes)
+
+    def extend(self, other):
+        """
+        Add the sites of another BinaryGenotypes after the stored sites
+        """
+        self.blocks.extend(other.blocks)
+        self.num_sites += other.num_sites
+
+    def iter_sequences(self, sample_order):
+        """
+        Yield (sample index, binary NEXUS sequence) for the samples in 'sample_order'
+        """
+        symbols = np.frombuffer(b"012?", dtype=np.uint8)
+        column_index = None
+        for s in sample_order:
+            if s // 4 != column_index:
+                column_index = s // 4
+                column = np.concatenate([block[column_index] for block in self.blocks] or
+                                        [np.zeros(0, dtype=np.uint8)])
+            codes = (column >> (6 - 2 * (s % 4))) & 3
+            yield s, symbols[codes].tobytes().decode()
+
+
+def decode_nucleotide_block(records, sample_buf, num_samples, resolve_IUPAC):
+    """
+    Decode the genotypes of a block of SNP records into IUPAC bytes with NumPy. 'records' are the
+    first nine VCF columns of each record and 'sample_buf' holds the sample columns of all records
+    joined by tabs. Returns a (records x samples) uint8 matrix and a boolean vector flagging the
+    records the vectorized decoder cannot handle (multi-digit alleles, unknown nucleotides, ...)
+    that must go through get_matrix_column instead
+    """
+    num_records = len(records)
+    padded, starts, gt_len = locate_genotypes(sample_buf, num_records, num_samples)
+    num_alleles = (gt_len + 1) // 2
+    fallback = (gt_len % 2 == 0).any(axis=1)
+
+    # Nucleotide bits of every allele index of every record, column 10 is the missing allele '.'
+    allele_bits = np.zeros((num_records, 11), dtype=np.uint8)
+    allele_bits[:, 10] = NT_BITS["N"]
+    for r, record in enumerate(records):
+        ref = record[3].decode().replace("-", "*").upper()
+        alt = record[4].decode().replace("-", "*").replace("<NON_REF>", ref).split(",")
+        for n, nt in enumerate([ref] + alt[:9]):
+            allele_bits[r, n] = NT_BITS.get(nt, 0)
+
+    max_alleles = int(num_alleles.max()) if num_alleles.size else 0
+    genotype_bits = np.zeros(starts.shape, dtype=np.uint8)
+    allele_index = np.zeros(starts.shape + (max(max_alleles, 1),), dtype=np.intp)
+    row_index = np.arange(num_records)[:, None]
+    for k in range(max_alleles):
+        present = k < num_alleles
+        char = padded[starts + 2 * k]
+        index = np.where(char == 46, 10, char.astype(np.intp) - 48)
+        valid = (index >= 0) & (index <= 10)
+        if k + 1 < max_alleles:
+            sep = padded[starts + 2 * k + 1]
+            valid &= ~(k + 1 < num_alleles) | (sep == 47) | (sep == 124)
+        index = np.where(valid, index, 0)
+        bits = allele_bits[row_index, index]
+        fallback |= (present & (~valid | (bits == 0))).any(axis=1)
+        genotype_bits |= np.where(present, bits, 0).astype(np.uint8)
+        allele_index[:, :, k] = index
+
+    lut = np.frombuffer(bytes(AMBIG_LUT), dtype=np.uint8)
+    if resolve_IUPAC:
+        # Pick one allele of each genotype at random
+        pick = (np.random.random_sample(starts.shape) * np.maximum(num_alleles, 1)).astype(np.intp)
+        index = np.take_along_axis(allele_index, pick[:, :, None], axis=2)[:, :, 0]
+        genotype_bits = allele_bits[row_index, index]
+    column = lut[genotype_bits]
+    fallback |= (column == 0).any(axis=1)
+    return column, fallback
+
+
+def convert_block(lines, num_samples, min_samples_locus, nucleotides, binary, resolve_IUPAC):
+    """
+    Filter and convert a block of VCF lines (bytes). Missing data is counted for the whole block at
+    once, the surviving SNPs are decoded by decode_nucleotide_block when NumPy is available. Returns
+    a dictionary with the counters, the messages to print, the accepted nucleotide rows and used
+    sites, and the binary NEXUS rows (as a matrix of SNAPP codes with NumPy), all in input order
+    """
+    result = {"snp_num": 0, "snp_shallow": 0, "mnp_num": 0, "snp_accepted": 0, "snp_biallelic": 0,
+              "messages": [], "rows": [], "used_sites": [], "bin_rows": [], "bin_codes": None}
+
+    # Split off the first nine columns, keep the samples as one chunk of bytes per record
+    records = []
+    sample_parts = []
+    lines_kept = []
+    order = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith(b"#"): # skip empty and commented lines
+            continue
+        result["snp_num"] += 1
+        record = line.split(b"\t", 9)
+        if len(record) != 10 or record[9].count(b"\t") != num_samples - 1:
+            result["messages"].append((result["snp_num"],
+                                       "Skipping malformed line:\n{}".format(line.decode())))
+            continue
+        order.append(result["snp_num"])
+        records.append(record)
+        sample_parts.append(record[9])
+        lines_kept.append(line)
+    if not records:
+        result["messages"] = [message for _, message in result["messages"]]
+        return result
+
+    # Check if the SNPs have the minimum number of samples required, for the whole block at once
+    if np is not None:
+        sample_buf = b"\t".join(sample_parts)
+        buf = np.frombuffer(sample_buf, dtype=np.uint8)
+        starts = np.concatenate(([0], np.flatnonzero(buf == 9) + 1))
+        missing = (buf[starts] == 46).reshape(len(records), num_samples).sum(axis=1)
+        num_samples_locus_lst = (num_samples - missing).tolist()
+    else:
+        num_samples_locus_lst = [num_genotypes(line.decode().split("\t"), num_samples)
+                                 for line in lines_kept]
+
+    snp_index = []
+    for i, record in enumerate(records):
+        if num_samples_locus_lst[i] < min_samples_locus:
+            # Keep track of loci rejected due to exceeded missing data
+            result["snp_shallow"] += 1
+        elif is_snp([field.decode() for field in record[:5]]):
+            snp_index.append(i)
+        else:
+            # Keep track of loci rejected due to multinucleotide genotypes
+            result["mnp_num"] += 1
+
+    # Transform the VCF records into alignment columns
+    columns = None
+    fallback = None
+    if nucleotides and snp_index and np is not None:
+        columns, fallback = decode_nucleotide_block([records[i] for i in snp_index],
+                                                    b"\t".join(sample_parts[i] for i in snp_index),
+                                                    num_samples, resolve_IUPAC)
+
+    bin_index = []
+    for j, i in enumerate(snp_index):
+        record = records[i]
+        if nucleotides:
+            if columns is not None and not fallback[j]:
+                site_tmp = columns[j].tobytes()
+            else:
+                site_tmp = get_matrix_column(lines_kept[i].decode().split("\t"), num_samples,
+                                             resolve_IUPAC)
+                if site_tmp == "malformed":
+                    result["messages"].append((order[i], "Skipping malformed line:\n{}".format(
+                                                                          lines_kept[i].decode())))
+                    continue
+                site_tmp = site_tmp.encode()
+            # Add to running sum of accepted SNPs
+            result["snp_accepted"] += 1
+            result["rows"].append(site_tmp)
+            result["used_sites"].append((record[0].decode(), record[1].decode(),
+                                         num_samples_locus_lst[i]))
+        # Binary NEXUS for SNAPP, only SNPs with two alleles
+        if binary and len(record[4]) == 1:
+            result["snp_biallelic"] += 1
+            if np is not None:
+                bin_index.append(i)
+            else:
+                result["bin_rows"].append(get_matrix_column_bin(
+                                          lines_kept[i].decode().split("\t"), num_samples).encode())
+    if bin_index:
+        result["bin_codes"] = decode_binary_block(b"\t".join(sample_parts[i] for i in bin_index),
+                                                  len(bin_index), num_samples)
+    result["messages"] = [message for _, message in sorted(result["messages"])]
+    return result
+
+
+def convert_lines(lines, num_samples, min_samples_locus, nucleotides, binary, resolve_IUPAC,
+                  temporal, temporalbin, used_sites, counters, messages=None):
+    """
+    Convert an iterable of VCF lines block by block, writing nucleotide rows to 'temporal', binary
+    rows to 'temporalbin' (a BinaryGenotypes with NumPy) and coordinates to 'used_sites' (each can
+    be None) and adding to the running 'counters'. Messages are printed, or collected in 'messages' when a list is given
+    """
+    # Records are read and converted in blocks of about BLOCK_GENOTYPES genotypes
+    block_size = max(1, BLOCK_GENOTYPES // num_samples)
+    lines = iter(lines)
+    while 1:
+        # Load large chunks of file into memory
+        vcf_chunk = list(itertools.islice(lines, block_size))
+        if not vcf_chunk:
+            break
+
+        block = convert_block(vcf_chunk, num_samples, min_samples_locus, nucleotides, binary,
+                              resolve_IUPAC)
+        if messages is None:
+            for message in block["messages"]:
+                print(message)
+            # Print progress every 500000 lines
+            if (counters["snp_num"] + block["snp_num"]) // 500000 > counters["snp_num"] // 500000:
+                print("{:d} genotypes processed.".format(
+                                        (counters["snp_num"] + block["snp_num"]) // 500000 * 500000))
+        else:
+            messages.extend(block["messages"])
+        for key in counters:
+            counters[key] += block[key]
+
+        # Write entire rows of single nucleotide genotypes to temp file
+        if block["rows"]:
+            temporal.write(b"\n".join(block["rows"]) + b"\n")
+            if used_sites is not None:
+                for chrom, pos, num_samples_locus in block["used_sites"]:
+                    used_sites.write(chrom + "\t" + pos + "\t" + str(num_samples_locus) + "\n")
+        if block["bin_codes"] is not None:
+            temporalbin.append(block["bin_codes"])
+        if block["bin_rows"]:
+            temporalbin.write(b"\n".join(block["bin_rows"]) + b"\n")
+
+
+def read_index_offsets(vcf_file):
+    """
+    Read the tabix (.tbi) or CSI (.csi) index of a bgzipped VCF and return a list of (contig,
+    virtual offset of its first record) in file order. Returns None if there is no index
+    """
+    for suffix in [".tbi", ".csi"]:
+        if Path(vcf_file + suffix).exists():
+            with gzip.open(vcf_file + suffix, "rb") as index:
+                data = index.read()
+            break
+    else:
+        return None
+
+    magic = data[:4]
+    if magic == b"TBI\1":
+        n_ref = struct.unpack_from("<i", data, 4)[0]
+        l_nm = struct.unpack_from("<i", data, 32)[0]
+        names = data[36:36+l_nm].split(b"\0")[:n_ref]
+        pos = 36 + l_nm
+        pseudo_bin = 37450
+        has_loffset = False
+    elif magic == b"CSI\1":
+        min_shift, depth, l_aux = struct.unpack_from("<3i", data, 4)
+        l_nm = struct.unpack_from("<i", data, 16 + 24)[0]
+        names = data[16+28:16+28+l_nm].split(b"\0")
+        pos = 16 + l_aux
+        n_ref = struct.unpack_from("<i", data, pos)[0]
+        names = names[:n_ref]
+        pos += 4
+        pseudo_bin = ((1 << ((depth + 1) * 3)) - 1) // 7 + 1
+        has_loffset = True
+    else:
+        return None
+
+    offsets = []
+    for name in names:
+        n_bin = struct.unpack_from("<i", data, pos)[0]
+        pos += 4
+        first = None
+        for _ in range(n_bin):
+            bin_id = struct.unpack_from("<I", data, pos)[0]
+            pos += 12 if has_loffset else 4
+            n_chunk = struct.unpack_from("<i", data, pos)[0]
+            pos += 4
+            if bin_id != pseudo_bin:
+                for beg, _end in struct.iter_unpack("<QQ", data[pos:pos+16*n_chunk]):
+                    if first is None or beg < first:
+                        first = beg
+            pos += 16 * n_chunk
+        if not has_loffset:
+            n_intv = struct.unpack_from("<i", data, pos)[0]
+            pos += 4 + 8 * n_intv
+        # Contigs without records have no bins
+        if first is not None:
+            offsets.append((name, first))
+    return sorted(offsets, key=lambda item: item[1])
+
+
+def convert_contig(task):
+    """
+    Worker of the per-contig conversion. Seeks to the first record of the contig in the bgzipped
+    VCF through its virtual offset, converts the records of that contig and writes them to
+    temporary part files. Returns the counters and messages of the contig, and its packed binary
+    genotypes when NumPy is available
+    """
+    (vcf_file, contig, voffset, part, num_samples, min_samples_locus, nucleotides, binary,
+     resolve_IUPAC, write_used) = task
+    counters = {"snp_num": 0, "snp_shallow": 0, "mnp_num": 0, "snp_accepted": 0, "snp_biallelic": 0}
+    messages = []
+    temporal = open(part+".tmp", "wb") if nucleotides else None
+    temporalbin = None
+    if binary:
+        temporalbin = BinaryGenotypes(num_samples) if np is not None else open(part+".bin.tmp", "wb")
+    used_sites = open(part+".used_sites.tsv", "w") if write_used else None
+
+    with open(vcf_file, "rb") as raw:
+        # A virtual offset is the offset of the BGZF block and the offset inside the block
+        raw.seek(voffset >> 16)
+        with gzip.GzipFile(fileobj=raw) as vcf:
+            vcf.read(voffset & 0xFFFF)
+            lines = itertools.takewhile(lambda line: line.split(b"\t", 1)[0] == contig, vcf)
+            convert_lines(lines, num_samples, min_samples_locus, nucleotides, binary, resolve_IUPAC,
+                          temporal, temporalbin, used_sites, counters, messages)
+
+    if isinstance(temporalbin, BinaryGenotypes):
+        contig_bin = temporalbin
+        temporalbin = None
+    else:
+        contig_bin = None
+    for handle in [temporal, temporalbin, used_sites]:
+        if handle is not None:
+            handle.close()
+    return contig.decode(), counters, messages, contig_bin
+
+
+def transpose_temporal(tmp_file, num_sites, num_samples, sample_order):
+    """
+    Yield (sample index, sequence) for the samples in 'sample_order' from a temporary file holding
+    one fixed-width row per site (one character per sample and the newline). With NumPy the file is
+    memory-mapped as a (sites x samples) byte matrix and transposed in blocks, without it the file
+    is read once per sample
+    """
+    if np is None:
+        for s in sample_order:
+            with open(tmp_file) as tmp_seq:
+                # This is where the transposing happens
+                yield s, "".join(line[s] for line in tmp_seq)
+        return
+
+    if num_sites == 0:
+        for s in sample_order:
+            yield s, ""
+        return
+
+    matrix = np.memmap(tmp_file, dtype=np.uint8, mode="r", shape=(num_sites, num_samples + 1))
+    group_size = max(1, min(len(sample_order), TRANSPOSE_MEMORY // num_sites))
+    # Sites copied per step, about 64 MB of the temporary file
+    site_block = max(1, 64 * 1024 * 1024 // (num_samples + 1))
+    for g in range(0, len(sample_order), group_size):
+        group = sample_order[g:g+group_size]
+        sequences = np.empty((len(group), num_sites), dtype=np.uint8)
+        for start in range(0, num_sites, site_block):
+            end = min(start + site_block, num_sites)
+            sequences[:, start:end] = matrix[start:end, group].T
+        for i, s in enumerate(group):
+            yield s, sequences[i].tobytes().decode()
+    del matrix
+
+
 def main():
     parser = argparse.ArgumentParser(description=__doc__,
                                      formatter_class=argparse.RawDescriptionHelpFormatter)
@@ -205,6 +634,13 @@ def main():
         dest = "write_used",
         help = "Save the list of coordinates that passed the filters and were used in the alignments "
                "(disabled by default)")
+    parser.add_argument("-t", "--threads",
+        action = "store",
+        dest = "threads",
+        type = int,
+        default = 1,
+        help = "Number of processes, a bgzipped VCF with a .tbi or .csi index is split by contig "
+               "across them (default=1)")
     parser.add_argument("-v", "--version",
         action = "version",
         version = "%(prog)s {version}".format(version=__version__))
@@ -246,14 +682,20 @@ def main():
 
     outfile = str(Path(args.folder, args.prefix))
 
+    nucleotides = bool(args.fasta or args.nexus or not args.phylipdisable)
+
     # We need to create an intermediate file to hold the sequence data vertically and then transpose
     # it to create the matrices
-    if args.fasta or args.nexus or not args.phylipdisable:
-        temporal = open(outfile+".tmp", "w")
+    if nucleotides:
+        temporal = open(outfile+".tmp", "wb")
 
-    # If binary NEXUS is selected also create a separate temporal
+    # If binary NEXUS is selected also create a separate temporal, with NumPy the genotypes are kept
+    # in memory, packed 2 bits per genotype
     if args.nexusbin:
-        temporalbin = open(outfile+".bin.tmp", "w")
+        if np is not None:
+            temporalbin = BinaryGenotypes(num_samples)
+        else:
+            temporalbin = open(outfile+".bin.tmp", "wb")
 
 
     ##########################
@@ -268,98 +710,75 @@ def main():
     else:
         opener = open
 
-    with opener(args.filename, "rt") as vcf:
-        # Initialize line counter
-        snp_num = 0
-        snp_accepted = 0
-        snp_shallow = 0
-        mnp_num = 0
-        snp_biallelic = 0
-
-        while 1:
-            # Load large chunks of file into memory
-            vcf_chunk = vcf.readlines(50000)
-            if not vcf_chunk:
-                break
-
-            for line in vcf_chunk:
-                line = line.strip()
-
-                if line and not line.startswith("#"): # skip empty and commented lines
-                    # Split line into columns
-                    record = line.split("\t")
-                    # Keep track of number of genotypes processed
-                    snp_num += 1
-                    # Print progress every 500000 lines
-                    if snp_num % 500000 == 0:
-                        print("{:d} genotypes processed.".format(snp_num))
-                    if is_anomalous(record, num_samples):
-                        print("Skipping malformed line:\n{}".format(line))
-                        continue
-                    else:
-                        # Check if the SNP has the minimum number of samples required
-                        num_samples_locus = num_genotypes(record, num_samples)
-                        if  num_samples_locus < args.min_samples_locus:
-                            # Keep track of loci rejected due to exceeded missing data
-                            snp_shallow += 1
-                            continue
-                        else:
-                            # Check that neither REF nor ALT contain MNPs
-                            if is_snp(record):
-                                # If nucleotide matrices are requested
-                                if args.fasta or args.nexus or not args.phylipdisable:
-                                    # Uncomment for debugging
-                                    # print(record)
-                                    # Transform VCF record into an alignment column
-                                    site_tmp = get_matrix_column(record, num_samples,
-                                                                 args.resolve_IUPAC)
-                                    # Uncomment for debugging
-                                    # print(site_tmp)
-                                    # Write entire row of single nucleotide genotypes to temp file
-                                    if site_tmp == "malformed":
-                                        print("Skipping malformed line:\n{}".format(line))
-                                        continue
-                                    else:
-                                        # Add to running sum of accepted SNPs
-                                        snp_accepted += 1
-                                        temporal.write(site_tmp+"\n")
-                                        if args.write_used:
-                                            used_sites.write(record[0] + "\t"
-                                                             + record[1] + "\t"
-                                                             + str(num_samples_locus) + "\n")
-                                # Write binary NEXUS for SNAPP if requested
-                                if args.nexusbin:
-                                    # Check that the SNP only has two alleles
-                                    if len(record[4]) == 1:
-                                        # Add to running sum of biallelic SNPs
-                                        snp_biallelic += 1
-                                        # Translate genotype into 0 for homozygous REF, 1 for
-                                        # heterozygous, and 2 for homozygous ALT
-                                        binsite_tmp = get_matrix_column_bin(record, num_samples)
-                                        # Write entire row to temporary file
-                                        temporalbin.write(binsite_tmp+"\n")
-                            else:
-                                # Keep track of loci rejected due to multinucleotide genotypes
-                                mnp_num += 1
-
-        # Print useful information about filtering of SNPs
-        print("Total of genotypes processed: {:d}".format(snp_num))
-        print("Genotypes excluded because they exceeded the amount "
-              "of missing data allowed: {:d}".format(snp_shallow))
-        print("Genotypes that passed missing data filter but were "
-              "excluded for being MNPs: {:d}".format(mnp_num))
-        print("SNPs that passed the filters: {:d}".format(snp_accepted))
-        if args.nexusbin:
-            print("Biallelic SNPs selected for binary NEXUS: {:d}".format(snp_biallelic))
+    # Initialize line counter
+    counters = {"snp_num": 0, "snp_shallow": 0, "mnp_num": 0, "snp_accepted": 0, "snp_biallelic": 0}
+
+    # Split the work by contig if the VCF is bgzipped and indexed
+    offsets = None
+    if args.threads > 1:
+        if args.filename.lower().endswith(".gz"):
+            offsets = read_index_offsets(args.filename)
+        if offsets is None:
+            print("No .tbi/.csi index found for the VCF, converting on a single core.")
+
+    if offsets:
+        tasks = [(args.filename, contig, voffset, "{}.part{:d}".format(outfile, n), num_samples,
+                  args.min_samples_locus, nucleotides, args.nexusbin, args.resolve_IUPAC,
+                  args.write_used) for n, (contig, voffset) in enumerate(offsets)]
+        with multiprocessing.Pool(min(args.threads, len(tasks))) as pool:
+            # Merge the part files in genomic order as the contigs finish
+            for task, (contig, contig_counters, messages, contig_bin) in zip(tasks,
+                                                      pool.imap(convert_contig, tasks, chunksize=1)):
+                part = task[3]
+                for message in messages:
+                    print(message)
+                for key in counters:
+                    counters[key] += contig_counters[key]
+                print("Contig '{}' done, {:d} genotypes processed.".format(contig,
+                                                                          counters["snp_num"]))
+                if contig_bin is not None:
+                    temporalbin.extend(contig_bin)
+                for handle, suffix in [(temporal if nucleotides else None, ".tmp"),
+                                       (temporalbin if contig_bin is None and args.nexusbin else None,
+                                        ".bin.tmp"),
+                                       (used_sites if args.write_used else None, ".used_sites.tsv")]:
+                    if handle is not None:
+                        with open(part+suffix, "rb" if suffix.endswith("tmp") else "r") as part_fh:
+                            shutil.copyfileobj(part_fh, handle)
+                        Path(part+suffix).unlink()
+    else:
+        with opener(args.filename, "rb") as vcf:
+            convert_lines(vcf, num_samples, args.min_samples_locus, nucleotides, args.nexusbin,
+                          args.resolve_IUPAC, temporal if nucleotides else None,
+                          temporalbin if args.nexusbin else None,
+                          used_sites if args.write_used else None, counters)
+
+    snp_num = counters["snp_num"]
+    snp_accepted = counters["snp_accepted"]
+    snp_shallow = counters["snp_shallow"]
+    mnp_num = counters["mnp_num"]
+    snp_biallelic = counters["snp_biallelic"]
+    if args.nexusbin and np is not None:
+        snp_biallelic = temporalbin.num_sites
+
+    # Print useful information about filtering of SNPs
+    print("Total of genotypes processed: {:d}".format(snp_num))
+    print("Genotypes excluded because they exceeded the amount "
+          "of missing data allowed: {:d}".format(snp_shallow))
+    print("Genotypes that passed missing data filter but were "
+          "excluded for being MNPs: {:d}".format(mnp_num))
+    print("SNPs that passed the filters: {:d}".format(snp_accepted))
+    if args.nexusbin:
+        print("Biallelic SNPs selected for binary NEXUS: {:d}".format(snp_biallelic))
 
     if args.write_used:
         print("Used sites saved to: '" + outfile + ".used_sites.tsv'")
         used_sites.close()
     print("")
 
-    if args.fasta or args.nexus or not args.phylipdisable:
+    if nucleotides:
         temporal.close()
-    if args.nexusbin:
+    if args.nexusbin and np is None:
         temporalbin.close()
 
 
@@ -395,85 +814,56 @@ def main():
     idx_outgroup = None
     if outgroup in sample_names:
         idx_outgroup = sample_names.index(outgroup)
-
-        if args.fasta or args.nexus or not args.phylipdisable:
-            with open(outfile+".tmp") as tmp_seq:
-                seqout = ""
-
-                # This is where the transposing happens
-                for line in tmp_seq:
-                    seqout += line[idx_outgroup]
-
-                # Write FASTA line
-                if args.fasta:
-                    output_fas.write(">"+sample_names[idx_outgroup]+"\n"+seqout+"\n")
-
-                # Pad sequences names and write PHYLIP or NEXUS lines
-                padding = (len_longest_name + 3 - len(sample_names[idx_outgroup])) * " "
-                if not args.phylipdisable:
-                    output_phy.write(sample_names[idx_outgroup]+padding+seqout+"\n")
-                if args.nexus:
-                    output_nex.write(sample_names[idx_outgroup]+padding+seqout+"\n")
-
-                # Print current progress
+    sample_order = [s for s in range(len(sample_names)) if s != idx_outgroup]
+    if idx_outgroup is not None:
+        sample_order.insert(0, idx_outgroup)
+
+    # This is where the transposing happens, both matrices are transposed in step
+    if nucleotides:
+        nucleotide_seqs = transpose_temporal(outfile+".tmp", snp_accepted, num_samples,
+                                             sample_order)
+    if args.nexusbin and np is not None:
+        binary_seqs = temporalbin.iter_sequences(sample_order)
+    elif args.nexusbin:
+        binary_seqs = transpose_temporal(outfile+".bin.tmp", snp_biallelic, num_samples,
+                                         sample_order)
+
+    for s in sample_order:
+        # Pad sequences names
+        padding = (len_longest_name + 3 - len(sample_names[s])) * " "
+
+        if nucleotides:
+            _, seqout = next(nucleotide_seqs)
+
+            # Write FASTA line
+            if args.fasta:
+                output_fas.write(">"+sample_names[s]+"\n"+seqout+"\n")
+
+            # Write PHYLIP or NEXUS lines
+            if not args.phylipdisable:
+                output_phy.write(sample_names[s]+padding+seqout+"\n")
+            if args.nexus:
+                output_nex.write(sample_names[s]+padding+seqout+"\n")
+
+            # Print current progress
+            if s == idx_outgroup:
                 print("Outgroup, '{}', added to the matrix(ces).".format(outgroup))
+            else:
+                print("Sample {:d} of {:d}, '{}', added to the nucleotide matrix(ces).".format(
+                                                       s+1, len(sample_names), sample_names[s]))
 
         if args.nexusbin:
-            with open(outfile+".bin.tmp") as bin_tmp_seq:
-                seqout = ""
-
-                # This is where the transposing happens
-                for line in bin_tmp_seq:
-                    seqout += line[idx_outgroup]
+            _, seqout = next(binary_seqs)
 
-                # Write line of binary SNPs to NEXUS
-                padding = (len_longest_name + 3 - len(sample_names[idx_outgroup])) * " "
-                output_nexbin.write(sample_names[idx_outgroup]+padding+seqout+"\n")
+            # Write line of binary SNPs to NEXUS
+            output_nexbin.write(sample_names[s]+padding+seqout+"\n")
 
-                # Print current progress
+            # Print current progress
+            if s == idx_outgroup:
                 print("Outgroup, '{}', added to the binary matrix.".format(outgroup))
-
-    # Write sequences of the ingroup
-    for s in range(0, len(sample_names)):
-        if s != idx_outgroup:
-            if args.fasta or args.nexus or not args.phylipdisable:
-                with open(outfile+".tmp") as tmp_seq:
-                    seqout = ""
-
-                    # This is where the transposing happens
-                    for line in tmp_seq:
-                        seqout += line[s]
-
-                    # Write FASTA line
-                    if args.fasta:
-                        output_fas.write(">"+sample_names[s]+"\n"+seqout+"\n")
-
-                    # Pad sequences names and write PHYLIP or NEXUS lines
-                    padding = (len_longest_name + 3 - len(sample_names[s])) * " "
-                    if not args.phylipdisable:
-                        output_phy.write(sample_names[s]+padding+seqout+"\n")
-                    if args.nexus:
-                        output_nex.write(sample_names[s]+padding+seqout+"\n")
-
-                    # Print current progress
-                    print("Sample {:d} of {:d}, '{}', added to the nucleotide matrix(ces).".format(
-                                                           s+1, len(sample_names), sample_names[s]))
-
-            if args.nexusbin:
-                with open(outfile+".bin.tmp") as bin_tmp_seq:
-                    seqout = ""
-
-                    # This is where the transposing happens
-                    for line in bin_tmp_seq:
-                        seqout += line[s]
-
-                    # Write line of binary SNPs to NEXUS
-                    padding = (len_longest_name + 3 - len(sample_names[s])) * " "
-                    output_nexbin.write(sample_names[s]+padding+seqout+"\n")
-
-                    # Print current progress
-                    print("Sample {:d} of {:d}, '{}', added to the binary matrix.".format(
-                                                           s+1, len(sample_names), sample_names[s]))
+            else:
+                print("Sample {:d} of {:d}, '{}', added to the binary matrix.".format(
+                                                       s+1, len(sample_names), sample_names[s]))
 
     print()
     if not args.phylipdisable:
@@ -491,10 +881,13 @@ def main():
         print("BINARY NEXUS matrix saved to: " + outfile+".bin.nex")
         output_nexbin.close()
 
-    if args.fasta or args.nexus or not args.phylipdisable:
+    if nucleotides:
+        del nucleotide_seqs
         Path(outfile+".tmp").unlink()
     if args.nexusbin:
-        Path(outfile+".bin.tmp").unlink()
+        del binary_seqs
+        if np is None:
+            Path(outfile+".bin.tmp").unlink()
 
     print( "\nDone!\n")
 